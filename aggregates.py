@@ -0,0 +1,386 @@
+"""
+Agregados por equipo y temporada (team_season_stats) y métricas del dashboard
+
+Cada partido terminado se suma una sola vez a la fila (liga, temporada, team_id)
+de sus dos equipos (IDs de teams.TeamRegistry: los alias de un equipo comparten
+fila): victorias/empates/derrotas en casa y fuera, goles, porterías
+a cero, posesión y tiros (como sumas; las medias se calculan al leer), goles por
+tramo de minutos y puntos. aggregated_matches registra los partidos ya sumados,
+así que update() solo procesa los nuevos y después recalcula la posición en la
+tabla de las temporadas afectadas (una veintena de filas por liga).
+
+Las métricas del dashboard (partidos del día, en vivo, valor detectado por liga)
+se guardan en dashboard_metrics y la app las lee por clave primaria.
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, insert, update as sql_update, delete, bindparam, text, tuple_
+
+from config import Leagues
+from database import (
+    engine as default_engine, TeamSeasonStats, AggregatedMatch, DashboardMetric, bump_data_version
+)
+from features import season_of
+from teams import get_team_registry, team_ids
+
+logger = logging.getLogger(__name__)
+
+GOAL_TIMING_BUCKETS = ["0-15", "16-30", "31-45", "46-60", "61-75", "76-90"]
+_BUCKET_EDGES = np.array([15, 30, 45, 60, 75])  # minuto final de cada tramo (el 90+ va al último)
+_BUCKET_COLUMNS = [f"goals_{label.replace('-', '_')}" for label in GOAL_TIMING_BUCKETS]
+
+_VENUE_COLUMNS = [
+    "played", "wins", "draws", "losses", "goals_for", "goals_against", "clean_sheets",
+    "stats_played", "possession", "shots", "shots_on_target",
+]
+COUNTER_COLUMNS = (
+    [f"{venue}_{name}" for venue in ("home", "away") for name in _VENUE_COLUMNS]
+    + _BUCKET_COLUMNS + ["points"]
+)
+_KEY = ["league", "season", "team_id"]
+
+_ts = TeamSeasonStats.__table__
+_am = AggregatedMatch.__table__
+_dm = DashboardMetric.__table__
+
+# UPDATE col = col + :d_col para todas las columnas acumuladas (executemany por id)
+_INCREMENT = (
+    sql_update(_ts)
+    .where(_ts.c.id == bindparam("row_id"))
+    .values(
+        **{name: _ts.c[name] + bindparam(f"d_{name}") for name in COUNTER_COLUMNS},
+        updated_at=bindparam("now")
+    )
+)
+_SET_POSITION = sql_update(_ts).where(_ts.c.id == bindparam("row_id")).values(position=bindparam("new_position"))
+
+
+def pending_matches(bind, league: Optional[str] = None) -> pd.DataFrame:
+    """Partidos terminados que aún no están sumados en team_season_stats"""
+    query = text("""
+    SELECT
+        m.id AS match_id, m.league, m.date, m.home_team, m.away_team,
+        m.home_team_id, m.away_team_id, m.home_score, m.away_score,
+        ms.id AS stats_id,
+        ms.home_possession, ms.away_possession,
+        ms.home_shots, ms.away_shots,
+        ms.home_shots_on_target, ms.away_shots_on_target,
+        ms.home_goal_minutes, ms.away_goal_minutes
+    FROM matches m
+    LEFT JOIN match_stats ms ON ms.match_id = m.id
+    LEFT JOIN aggregated_matches am ON am.match_id = m.id
+    WHERE m.status = 'finished'
+    AND m.home_score IS NOT NULL
+    AND am.match_id IS NULL
+    AND (:league IS NULL OR m.league = :league)
+    """)
+    return pd.read_sql_query(query, bind, params={"league": league}, parse_dates=["date"])
+
+
+def _minutes(value) -> List[int]:
+    if isinstance(value, str):
+        value = json.loads(value)
+    return value if isinstance(value, list) else []
+
+
+def _bucket_counts(minutes: pd.Series) -> np.ndarray:
+    """(filas, tramos) con los goles de cada fila por tramo de minutos"""
+    lists = [_minutes(value) for value in minutes]
+    lengths = np.fromiter((len(values) for values in lists), dtype=np.int64, count=len(lists))
+    counts = np.zeros((len(lists), len(GOAL_TIMING_BUCKETS)), dtype=np.int64)
+    if lengths.sum():
+        flat = np.concatenate([np.asarray(values, dtype=np.int64) for values in lists if values])
+        rows = np.repeat(np.arange(len(lists)), lengths)
+        buckets = np.searchsorted(_BUCKET_EDGES, flat, side="left")
+        np.add.at(counts, (rows, buckets), 1)
+    return counts
+
+
+def match_deltas(matches: pd.DataFrame) -> pd.DataFrame:
+    """
+    Incrementos por (liga, temporada, team_id) de un lote de partidos terminados
+    (columnas de pending_matches con home_team_id/away_team_id ya resueltos). Una
+    fila por equipo con COUNTER_COLUMNS y su nombre en `team`.
+    """
+    season = season_of(matches["date"]).to_numpy()
+    has_stats = matches["stats_id"].notna().to_numpy()
+    frames = []
+    for venue, other in (("home", "away"), ("away", "home")):
+        gf = matches[f"{venue}_score"].to_numpy(dtype=np.int64)
+        ga = matches[f"{other}_score"].to_numpy(dtype=np.int64)
+        venue_columns = {
+            "played": np.ones(len(matches), dtype=np.int64),
+            "wins": (gf > ga).astype(np.int64),
+            "draws": (gf == ga).astype(np.int64),
+            "losses": (gf < ga).astype(np.int64),
+            "goals_for": gf,
+            "goals_against": ga,
+            "clean_sheets": (ga == 0).astype(np.int64),
+            "stats_played": has_stats.astype(np.int64),
+            "possession": matches[f"{venue}_possession"].fillna(0).to_numpy(dtype=float),
+            "shots": matches[f"{venue}_shots"].fillna(0).to_numpy(dtype=np.int64),
+            "shots_on_target": matches[f"{venue}_shots_on_target"].fillna(0).to_numpy(dtype=np.int64),
+        }
+        frame = pd.DataFrame({
+            "league": matches["league"].to_numpy(),
+            "season": season,
+            "team_id": matches[f"{venue}_team_id"].to_numpy(dtype=np.int64),
+            "team": matches[f"{venue}_team"].to_numpy(),
+        })
+        for name in _VENUE_COLUMNS:
+            frame[f"{venue}_{name}"] = venue_columns[name]
+            frame[f"{other}_{name}"] = 0
+        frame[_BUCKET_COLUMNS] = _bucket_counts(matches[f"{venue}_goal_minutes"])
+        frame["points"] = 3 * venue_columns["wins"] + venue_columns["draws"]
+        frames.append(frame)
+    sums = {name: "sum" for name in COUNTER_COLUMNS}
+    return pd.concat(frames, ignore_index=True).groupby(_KEY, as_index=False, sort=False).agg({**sums, "team": "first"})
+
+
+def _update_positions(conn, seasons: List[tuple]):
+    """Recalcula la posición (puntos, diferencia de goles, goles a favor) de cada temporada"""
+    gf = _ts.c.home_goals_for + _ts.c.away_goals_for
+    ga = _ts.c.home_goals_against + _ts.c.away_goals_against
+    rows = []
+    for league, season in seasons:
+        table = conn.execute(
+            select(_ts.c.id)
+            .where(_ts.c.league == league, _ts.c.season == season)
+            .order_by(_ts.c.points.desc(), (gf - ga).desc(), gf.desc(), _ts.c.team)
+        ).scalars().all()
+        rows.extend({"row_id": row_id, "new_position": position} for position, row_id in enumerate(table, 1))
+    if rows:
+        conn.execute(_SET_POSITION, rows)
+
+
+def update(bind=None, league: Optional[str] = None) -> int:
+    """Suma los partidos terminados pendientes. Devuelve el número de partidos aplicados."""
+    bind = bind or default_engine
+    _rebuild_unkeyed(bind)
+    pending = pending_matches(bind, league)
+    if pending.empty:
+        return 0
+
+    # Agrupación por ID entero; el nombre guardado es el canónico del registro
+    registry = get_team_registry(bind)
+    for side, ids in zip(("home", "away"), team_ids(pending, bind)):
+        pending[f"{side}_team_id"] = ids
+        pending[f"{side}_team"] = registry.names(ids.tolist())
+    deltas = match_deltas(pending)
+    now = datetime.utcnow()
+    seasons = deltas[["league", "season"]].drop_duplicates()
+    season_keys = [(league, int(season)) for league, season in seasons.itertuples(index=False, name=None)]
+
+    with bind.begin() as conn:
+        existing = pd.DataFrame(
+            conn.execute(
+                select(_ts.c.id, _ts.c.league, _ts.c.season, _ts.c.team_id)
+                .where(tuple_(_ts.c.league, _ts.c.season).in_(season_keys))
+            ).fetchall(),
+            columns=["row_id"] + _KEY
+        )
+        deltas = deltas.merge(existing, on=_KEY, how="left")
+        known = deltas["row_id"].notna()
+
+        if known.any():
+            increments = deltas[known].astype({"row_id": np.int64})
+            increments = increments.rename(columns={name: f"d_{name}" for name in COUNTER_COLUMNS})
+            increments = increments[["row_id"] + [f"d_{name}" for name in COUNTER_COLUMNS]].astype(object)
+            increments["now"] = now
+            conn.execute(_INCREMENT, increments.to_dict("records"))
+        if (~known).any():
+            new_rows = deltas.loc[~known, _KEY + ["team"] + COUNTER_COLUMNS].astype(object)
+            new_rows["updated_at"] = now
+            conn.execute(insert(_ts), new_rows.to_dict("records"))
+
+        _update_positions(conn, season_keys)
+        conn.execute(insert(_am), [
+            {"match_id": match_id, "applied_at": now} for match_id in pending["match_id"].tolist()
+        ])
+
+    logger.info(f"Agregados: {len(pending)} partidos sumados en {len(season_keys)} temporadas")
+    return len(pending)
+
+
+def _rebuild_unkeyed(bind):
+    """Recalcula las ligas con filas anteriores a team_id (agrupadas por nombre)"""
+    with bind.connect() as conn:
+        leagues = conn.execute(select(_ts.c.league).where(_ts.c.team_id.is_(None)).distinct()).scalars().all()
+    if leagues:
+        logger.info(f"Agregados sin team_id en {', '.join(leagues)}: se recalculan")
+        _reset(bind, leagues)
+
+
+def _reset(bind, leagues: List[str]):
+    with bind.begin() as conn:
+        conn.execute(delete(_ts).where(_ts.c.league.in_(leagues)))
+        conn.execute(text("""
+        DELETE FROM aggregated_matches
+        WHERE match_id IN (SELECT id FROM matches WHERE league IN :leagues)
+        """).bindparams(bindparam("leagues", expanding=True)), {"leagues": leagues})
+
+
+def rebuild(bind=None, leagues: Optional[List[str]] = None) -> int:
+    """Borra y recalcula los agregados de las ligas indicadas (todas por defecto)"""
+    bind = bind or default_engine
+    leagues = leagues or [league.value for league in Leagues]
+    _reset(bind, leagues)
+    return sum(update(bind, league) for league in leagues)
+
+
+# -- Lecturas -----------------------------------------------------------------
+
+def team_season(team: str, league: Optional[str] = None, season: Optional[int] = None,
+                bind=None) -> Optional[Dict]:
+    """
+    Fila de team_season_stats del equipo (la temporada más reciente por defecto).
+    El nombre puede ser cualquier alias conocido (se resuelve con TeamRegistry).
+    """
+    bind = bind or default_engine
+    team_id = get_team_registry(bind).resolve(team, create=False)
+    if team_id is None:
+        return None
+    query = select(_ts).where(_ts.c.team_id == team_id)
+    if league is not None:
+        query = query.where(_ts.c.league == league)
+    if season is not None:
+        query = query.where(_ts.c.season == season)
+    with bind.connect() as conn:
+        row = conn.execute(query.order_by(_ts.c.season.desc()).limit(1)).mappings().first()
+    return dict(row) if row else None
+
+
+def venue_record(row: Optional[Dict], venue: str) -> Dict:
+    """Récord en casa/fuera con las claves de FreeDataFetcher (ceros sin datos)"""
+    keys = ["wins", "draws", "losses", "goals_for", "goals_against"]
+    return {key: int(row[f"{venue}_{key}"]) if row else 0 for key in keys}
+
+
+def goal_timing(row: Optional[Dict]) -> Dict[str, int]:
+    """Goles marcados por tramo de minutos"""
+    return {
+        label: int(row[column]) if row else 0
+        for label, column in zip(GOAL_TIMING_BUCKETS, _BUCKET_COLUMNS)
+    }
+
+
+def standing(row: Dict) -> Dict:
+    """Posición, puntos, partidos jugados y diferencia de goles"""
+    goals_for = row["home_goals_for"] + row["away_goals_for"]
+    goals_against = row["home_goals_against"] + row["away_goals_against"]
+    return {
+        "season": row["season"],
+        "position": row["position"],
+        "points": row["points"],
+        "played": row["home_played"] + row["away_played"],
+        "goal_difference": goals_for - goals_against,
+    }
+
+
+def summary_table(row: Dict) -> pd.DataFrame:
+    """Tabla Métrica/Total/Casa/Fuera de una fila de team_season_stats"""
+    def column(venues):
+        total = {name: sum(row[f"{venue}_{name}"] for venue in venues) for name in _VENUE_COLUMNS}
+        n = total["stats_played"]
+        return [
+            total["wins"], total["draws"], total["losses"],
+            total["goals_for"], total["goals_against"], total["clean_sheets"],
+            f"{total['possession'] / n:.1f}%" if n else "-",
+            round(total["shots"] / n, 1) if n else "-",
+            round(total["shots_on_target"] / n, 1) if n else "-",
+        ]
+
+    return pd.DataFrame({
+        "Métrica": ["Victorias", "Empates", "Derrotas", "Goles a favor", "Goles en contra",
+                    "Clean sheets", "Posesión promedio", "Tiros por partido", "Tiros a puerta"],
+        "Total": column(("home", "away")),
+        "Casa": column(("home",)),
+        "Fuera": column(("away",)),
+    })
+
+
+def league_table(league: str, season: Optional[int] = None, bind=None) -> pd.DataFrame:
+    """Clasificación de una temporada (la más reciente por defecto)"""
+    bind = bind or default_engine
+    with bind.connect() as conn:
+        if season is None:
+            season = conn.execute(
+                select(_ts.c.season).where(_ts.c.league == league).order_by(_ts.c.season.desc()).limit(1)
+            ).scalar()
+        rows = conn.execute(
+            select(_ts).where(_ts.c.league == league, _ts.c.season == season).order_by(_ts.c.position)
+        ).mappings().all()
+    return pd.DataFrame([{"team": row["team"], **standing(row)} for row in rows])
+
+
+# -- Métricas del dashboard ---------------------------------------------------
+
+def refresh_dashboard_metrics(bind=None, day: Optional[datetime] = None,
+                              leagues: Optional[List[str]] = None, registry=None) -> Dict:
+    """
+    Recalcula las métricas del dashboard: partidos de hoy y mañana, partidos en
+    vivo y, por liga, valor detectado (EV medio de la mejor apuesta de valor de los
+    próximos partidos) y número de apuestas de valor. Las ligas sin predicciones
+    quedan con 0 apuestas de valor y valor detectado NULL.
+    """
+    import dashboard_queries as queries
+
+    bind = bind or default_engine
+    day = day or datetime.utcnow()
+    leagues = leagues or [league.value for league in Leagues]
+
+    today = queries.match_counts(bind, day)
+    tomorrow = queries.match_counts(bind, day + timedelta(days=1))
+    metrics = {
+        ("matches_day", day.date().isoformat()): today["today"],
+        ("matches_day", (day + timedelta(days=1)).date().isoformat()): tomorrow["today"],
+        ("live_matches", ""): today["live"],
+    }
+
+    for league in leagues:
+        predictions = queries.upcoming_predictions(bind, league, registry=registry)
+        if predictions.empty or "expected_value" not in predictions:
+            # Sin partidos o sin modelo: se vacía el valor anterior en vez de conservarlo
+            metrics[("value_bets", league)] = 0
+            metrics[("value_detected", league)] = None
+            continue
+        ev = predictions["expected_value"].dropna()
+        metrics[("value_bets", league)] = len(ev)
+        metrics[("value_detected", league)] = float(ev.mean()) if len(ev) else None
+
+    now = datetime.utcnow()
+    with bind.begin() as conn:
+        conn.execute(delete(_dm).where(tuple_(_dm.c.name, _dm.c.scope).in_(list(metrics))))
+        conn.execute(insert(_dm), [
+            {"name": name, "scope": scope, "value": value, "updated_at": now}
+            for (name, scope), value in metrics.items()
+        ])
+    bump_data_version("metrics", bind)
+    return metrics
+
+
+def dashboard_metrics(day: datetime, league: Optional[str] = None, bind=None) -> Dict[str, Optional[float]]:
+    """
+    Métricas del dashboard por clave primaria: today, live, value_detected,
+    value_bets (None si aún no se han calculado)
+    """
+    keys = {
+        "today": ("matches_day", day.date().isoformat()),
+        "live": ("live_matches", ""),
+        "value_detected": ("value_detected", league or ""),
+        "value_bets": ("value_bets", league or ""),
+    }
+    with (bind or default_engine).connect() as conn:
+        rows = dict(
+            ((name, scope), value) for name, scope, value in conn.execute(
+                select(_dm.c.name, _dm.c.scope, _dm.c.value)
+                .where(tuple_(_dm.c.name, _dm.c.scope).in_(list(keys.values())))
+            )
+        )
+    return {metric: rows.get(key) for metric, key in keys.items()}
@@ -1,45 +1,23 @@
 # app.py - VERSIÓN CORREGIDA PARA STREAMLIT CLOUD
 import streamlit as st
-import yaml
-from yaml.loader import SafeLoader
-import plotly.graph_objects as go
-import plotly.express as px
 from datetime import datetime
 import pandas as pd
+import logging
 import os
 import sys
 
+logger = logging.getLogger(__name__)
+
 # Añadir el directorio actual al path para importaciones locales
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
     from streamlit_authenticator import Authenticate
 except ImportError as e:
+    # Las dependencias se comprueban/instalan en el arranque (python run.py --preflight)
     st.error(f"Error de importación: {e}")
-    st.info("Instalando dependencias faltantes...")
-    import subprocess
-    import pkg_resources
-    
-    # Lista de paquetes necesarios
-    required = {
-        'streamlit-authenticator': '0.2.3',
-        'bcrypt': '4.0.1',
-        'pyyaml': '6.0.1'
-    }
-    
-    for package, version in required.items():
-        try:
-            dist = pkg_resources.get_distribution(package)
-            st.write(f"✓ {package} {dist.version} está instalado")
-        except pkg_resources.DistributionNotFound:
-            st.write(f"Instalando {package}...")
-            subprocess.check_call([sys.executable, "-m", "pip", "install", f"{package}=={version}"])
-    
-    # Recargar después de instalar
-    import importlib
-    import streamlit_authenticator
-    importlib.reload(streamlit_authenticator)
-    from streamlit_authenticator import Authenticate
+    st.info("Ejecuta `python run.py --preflight --install` y reinicia la aplicación.")
+    st.stop()
 
 # Configuración de la página
 st.set_page_config(
@@ -49,12 +27,12 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Cargar configuración YAML o usar valores por defecto
+import data_layer
+
+# Cargar configuración YAML (cacheada) o usar valores por defecto
 config_path = 'config.yaml'
-if os.path.exists(config_path):
-    with open(config_path) as file:
-        config = yaml.load(file, Loader=SafeLoader)
-else:
+config = data_layer.load_auth_config(config_path)
+if config is None:
     # Configuración por defecto si no existe config.yaml
     st.warning("Archivo config.yaml no encontrado. Usando configuración por defecto.")
     config = {
@@ -77,14 +55,16 @@ else:
         }
     }
 
-# Inicializar autenticador
-authenticator = Authenticate(
-    config['credentials'],
-    config['cookie']['name'],
-    config['cookie']['key'],
-    config['cookie']['expiry_days'],
-    config.get('preauthorized', {})
-)
+# Inicializar autenticador (uno por sesión, no en cada rerun)
+if 'authenticator' not in st.session_state:
+    st.session_state.authenticator = Authenticate(
+        config['credentials'],
+        config['cookie']['name'],
+        config['cookie']['key'],
+        config['cookie']['expiry_days'],
+        config.get('preauthorized', {})
+    )
+authenticator = st.session_state.authenticator
 
 # CSS personalizado
 st.markdown("""
@@ -168,6 +148,46 @@ def main():
     elif page == "🎫 Mis Apuestas":
         show_my_bets()
 
+def _query(func, *args, default=None):
+    """Consulta de la capa de datos; sin base de datos o sin datos se usa el ejemplo"""
+    try:
+        result = func(*args)
+    except Exception:
+        logger.exception(f"Error en data_layer.{func.__name__}; se muestran datos de ejemplo")
+        return default
+    if result is None or (isinstance(result, (pd.DataFrame, list)) and len(result) == 0):
+        return default
+    return result
+
+# Etiqueta de las métricas que muestran valores de ejemplo
+DEMO_LABEL = " (ejemplo)"
+
+# Métricas de ejemplo (si el scheduler aún no las ha calculado)
+DEMO_METRICS = {'today': 12, 'live': 3, 'value_detected': None}
+
+# Goles por tramo de ejemplo (si no hay agregados del equipo)
+DEMO_GOAL_TIMING = (('0-15', 5), ('16-30', 8), ('31-45', 10), ('46-60', 12), ('61-75', 15), ('76-90', 18))
+
+@st.cache_resource(show_spinner=False)
+def goal_distribution_figure(timing=DEMO_GOAL_TIMING, title="% de Goles por Intervalo - Temporada 2023/24"):
+    """Gráfico de goles por tramo de minutos (se construye una vez por equipo y datos)"""
+    import plotly.express as px
+    
+    data = pd.DataFrame(list(timing), columns=['Minuto', 'Goles'])
+    data['Goles %'] = (100 * data['Goles'] / max(data['Goles'].sum(), 1)).round(1)
+    return px.bar(data, x='Minuto', y='Goles %', 
+                  title=title, hover_data=['Goles'],
+                  color='Goles %', color_continuous_scale='Viridis')
+
+# Tabla de ejemplo de próximos partidos
+DEMO_UPCOMING = pd.DataFrame({
+    'Partido': ['Inter vs Juventus', 'Real Madrid vs Barcelona', 'Bayern vs Dortmund'],
+    'Fecha': ['Hoy 20:45', 'Mañana 21:00', '15/01 20:30'],
+    'Sugerencia': ['Inter ganador', 'Over 2.5 goles', 'Ambos marcan'],
+    'Confianza': ['85%', '72%', '68%'],
+    'Cuota': [2.10, 1.85, 1.95]
+})
+
 def show_dashboard():
     """Panel principal simplificado"""
     st.markdown('<h1 class="main-header">📊 Dashboard Principal</h1>', unsafe_allow_html=True)
@@ -176,64 +196,88 @@ def show_dashboard():
     leagues = ["La Liga", "Premier League", "Serie A", "Bundesliga", "Ligue 1"]
     selected_league = st.selectbox("Seleccionar Liga", leagues)
     
-    # Datos de ejemplo
+    # Métricas precalculadas por el scheduler (lectura por clave)
+    metrics = _query(data_layer.dashboard_metrics, selected_league,
+                     default=DEMO_METRICS)
+    accuracy = _query(data_layer.model_accuracy, selected_league)
+    predictions = _query(data_layer.upcoming_predictions, selected_league)
+    value = metrics['value_detected']
+    if value is None and predictions is not None and predictions['expected_value'].notna().any():
+        value = predictions['expected_value'].mean()
+    
+    demo_metrics = DEMO_LABEL if metrics is DEMO_METRICS else ""
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("📈 Partidos Hoy", "12")
+        st.metric("📈 Partidos Hoy" + demo_metrics, str(int(metrics['today'])))
     with col2:
-        st.metric("🎯 Precisión Modelo", "78.5%")
+        if accuracy is not None:
+            st.metric("🎯 Precisión Modelo", f"{accuracy:.1%}")
+        else:
+            st.metric("🎯 Precisión Modelo" + DEMO_LABEL, "78.5%")
     with col3:
-        st.metric("💰 Valor Detectado", "+12.3%")
+        if value is not None:
+            st.metric("💰 Valor Detectado", f"{value:+.1%}")
+        else:
+            st.metric("💰 Valor Detectado" + DEMO_LABEL, "+12.3%")
     with col4:
-        st.metric("⚡ En Vivo", "3")
+        st.metric("⚡ En Vivo" + demo_metrics, str(int(metrics['live'])))
     
-    # Gráfico de ejemplo
-    st.subheader("📊 Distribución de Goles por Minuto - Inter de Milán")
-    data = pd.DataFrame({
-        'Minuto': ['0-15', '16-30', '31-45', '46-60', '61-75', '76-90'],
-        'Goles %': [8, 12, 15, 18, 22, 25],
-        'Goles': [5, 8, 10, 12, 15, 18]
-    })
-    
-    fig = px.bar(data, x='Minuto', y='Goles %', 
-                 title="% de Goles por Intervalo - Temporada 2023/24",
-                 color='Goles %', color_continuous_scale='Viridis')
-    st.plotly_chart(fig, use_container_width=True)
+    # Goles por minuto del líder de la liga (o el ejemplo de Inter de Milán)
+    table = _query(data_layer.league_table, selected_league)
+    team = table['team'].iloc[0] if table is not None else "Inter de Milán"
+    timing = _query(data_layer.team_goal_timing, team, selected_league) if table is not None else None
+    st.subheader(f"📊 Distribución de Goles por Minuto - {team}")
+    if timing is not None:
+        season = int(table['season'].iloc[0])
+        figure = goal_distribution_figure(tuple(timing.items()),
+                                          f"% de Goles por Intervalo - Temporada {season}/{str(season + 1)[-2:]}")
+    else:
+        figure = goal_distribution_figure()
+    st.plotly_chart(figure, use_container_width=True)
     
     # Tabla de partidos
     st.subheader("🎯 Próximos Partidos - Valor Detectado")
+    if predictions is None:
+        st.caption("Partidos de ejemplo: aún no hay predicciones para esta liga")
+        st.dataframe(DEMO_UPCOMING, use_container_width=True)
+        return
+    
+    probabilities = predictions[['prob_1', 'prob_X', 'prob_2']].to_numpy()
     matches = pd.DataFrame({
-        'Partido': ['Inter vs Juventus', 'Real Madrid vs Barcelona', 'Bayern vs Dortmund'],
-        'Fecha': ['Hoy 20:45', 'Mañana 21:00', '15/01 20:30'],
-        'Sugerencia': ['Inter ganador', 'Over 2.5 goles', 'Ambos marcan'],
-        'Confianza': ['85%', '72%', '68%'],
-        'Cuota': [2.10, 1.85, 1.95]
+        'Partido': predictions['home_team'] + ' vs ' + predictions['away_team'],
+        'Fecha': predictions['date'].dt.strftime('%d/%m %H:%M'),
+        'Sugerencia': (predictions['market'] + ' ' + predictions['selection']).fillna(predictions['prediction']),
+        'Confianza': [f"{p:.0%}" for p in probabilities.max(axis=1)],
+        'Cuota': predictions['price'],
+        'EV': predictions['expected_value'].map(lambda ev: f"{ev:+.1%}" if pd.notna(ev) else "-")
     })
     st.dataframe(matches, use_container_width=True)
 
+# Partidos en vivo de ejemplo (si la base de datos no tiene ninguno)
+DEMO_LIVE_MATCHES = [
+    {
+        'id': 1,
+        'home_team': 'Real Sociedad',
+        'away_team': 'Atlético Madrid',
+        'minute': 65,
+        'score': '1-0',
+        'odds': {'1': 3.50, 'X': 3.40, '2': 2.10}
+    },
+    {
+        'id': 2,
+        'home_team': 'Inter de Milán',
+        'away_team': 'Juventus',
+        'minute': 45,
+        'score': '0-0',
+        'odds': {'1': 1.85, 'X': 3.60, '2': 4.20}
+    }
+]
+
 def show_live_betting():
     """Página de apuestas en vivo simplificada"""
     st.markdown('<h1 class="main-header">🔴 Apuestas en Vivo</h1>', unsafe_allow_html=True)
     
-    # Partidos en vivo de ejemplo
-    live_matches = [
-        {
-            'id': 1,
-            'home_team': 'Real Sociedad',
-            'away_team': 'Atlético Madrid',
-            'minute': 65,
-            'score': '1-0',
-            'odds': {'1': 3.50, 'X': 3.40, '2': 2.10}
-        },
-        {
-            'id': 2,
-            'home_team': 'Inter de Milán',
-            'away_team': 'Juventus',
-            'minute': 45,
-            'score': '0-0',
-            'odds': {'1': 1.85, 'X': 3.60, '2': 4.20}
-        }
-    ]
+    live_matches = _query(data_layer.live_matches, default=DEMO_LIVE_MATCHES)
     
     for match in live_matches:
         with st.expander(f"⚽ {match['home_team']} vs {match['away_team']} - Min {match['minute']}' | {match['score']}", expanded=True):
@@ -271,6 +315,13 @@ def show_predictions():
     """Página de predicciones simplificada"""
     st.markdown('<h1 class="main-header">🤖 Predicciones con ML</h1>', unsafe_allow_html=True)
     
+    league = st.selectbox("Seleccionar Liga", ["La Liga", "Premier League", "Serie A", "Bundesliga", "Ligue 1"])
+    predictions = _query(data_layer.upcoming_predictions, league)
+    if predictions is not None:
+        show_match_prediction(predictions)
+        return
+    
+    st.caption("Análisis de ejemplo: aún no hay predicciones para esta liga")
     # Selector de partido
     match = st.selectbox(
         "Seleccionar Partido",
@@ -298,6 +349,7 @@ def show_predictions():
             st.metric("Valor Esperado", "+12.3%")
         
         # Gráfico de probabilidades
+        import plotly.express as px
         prob_data = pd.DataFrame({
             'Resultado': ['Inter gana', 'Empate', 'Juventus gana'],
             'Probabilidad': [48, 30, 22]
@@ -307,10 +359,63 @@ def show_predictions():
                     title='Probabilidades Predichas', hole=0.4)
         st.plotly_chart(fig, use_container_width=True)
 
+def show_match_prediction(predictions: pd.DataFrame):
+    """Predicción de un partido real a partir de la capa de datos"""
+    import plotly.express as px
+    
+    labels = (predictions['home_team'] + ' vs ' + predictions['away_team']).tolist()
+    selected = st.selectbox("Seleccionar Partido", range(len(labels)), format_func=labels.__getitem__)
+    row = predictions.iloc[selected]
+    
+    st.subheader(f"📊 Análisis del Partido: {labels[selected]}")
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        prob_data = pd.DataFrame({
+            'Resultado': [f"{row['home_team']} gana", 'Empate', f"{row['away_team']} gana"],
+            'Probabilidad': [row['prob_1'], row['prob_X'], row['prob_2']]
+        })
+        fig = px.pie(prob_data, values='Probabilidad', names='Resultado',
+                     title='Probabilidades Predichas', hole=0.4)
+        st.plotly_chart(fig, use_container_width=True)
+    
+    with col2:
+        st.success("**🎯 Recomendación del Modelo:**")
+        outcome = {'1': f"{row['home_team']} ganador", 'X': 'Empate', '2': f"{row['away_team']} ganador"}
+        st.metric("Predicción", outcome.get(row['prediction'], row['prediction']))
+        st.metric("Confianza", f"{row['prob_' + row['prediction']]:.0%}")
+        if pd.notna(row['expected_value']):
+            st.metric("Apuesta de Valor", f"{row['market']} {row['selection']}")
+            st.metric("Cuota", f"{row['price']:.2f}")
+            st.metric("Valor Esperado", f"{row['expected_value']:+.1%}")
+
 def show_statistics():
     """Página de estadísticas simplificada"""
     st.markdown('<h1 class="main-header">📊 Estadísticas Detalladas</h1>', unsafe_allow_html=True)
     
+    league = st.selectbox("Seleccionar Liga", ["Serie A", "La Liga", "Premier League", "Bundesliga", "Ligue 1"])
+    teams = _query(data_layer.league_teams, league)
+    if teams is not None:
+        team = st.selectbox("Seleccionar Equipo", teams)
+        standing = _query(data_layer.team_standing, team, league)
+        stats = _query(data_layer.team_season_summary, team, league)
+        if stats is not None:
+            st.subheader(f"📈 Estadísticas Temporada Actual - {league}")
+            if standing is not None:
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("Posición", f"{standing['position']}º")
+                with col2:
+                    st.metric("Puntos", str(standing['points']))
+                with col3:
+                    st.metric("Partidos", str(standing['played']))
+                with col4:
+                    st.metric("Diferencia de goles", f"{standing['goal_difference']:+d}")
+            st.dataframe(stats, use_container_width=True)
+        else:
+            st.info("Sin partidos terminados esta temporada")
+        return
+    
     team = st.selectbox("Seleccionar Equipo", 
                        ["Inter de Milán", "Juventus", "Real Madrid", "Barcelona", "Bayern München"])
     
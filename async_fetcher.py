@@ -0,0 +1,317 @@
+"""
+Cliente HTTP asíncrono para los proveedores de API_CONFIG
+
+Un pool de conexiones por proveedor, límite de peticiones con token bucket,
+reintentos con backoff exponencial con jitter y peticiones concurrentes entre
+ligas/partidos. Las URLs base se pueden sustituir (p. ej. por un servidor stub local).
+"""
+
+import asyncio
+import random
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from config import API_CONFIG, BetTypes, Leagues
+
+logger = logging.getLogger(__name__)
+
+# Límites por proveedor: peticiones por segundo y ráfaga máxima
+RATE_LIMITS = {
+    "sportmonks": {"rate": 0.8, "burst": 10},
+    "api_football": {"rate": 5.0, "burst": 10},
+    "odds_api": {"rate": 10.0, "burst": 20},
+}
+
+# Cómo se autentica cada proveedor: ("header" | "param", nombre)
+PROVIDER_AUTH = {
+    "sportmonks": ("header", "Authorization"),
+    "api_football": ("header", "x-apisports-key"),
+    "odds_api": ("param", "apiKey"),
+}
+
+ODDS_API_SPORT_KEYS = {
+    Leagues.LA_LIGA.value: "soccer_spain_la_liga",
+    Leagues.PREMIER_LEAGUE.value: "soccer_epl",
+    Leagues.BUNDESLIGA.value: "soccer_germany_bundesliga",
+    Leagues.SERIE_A.value: "soccer_italy_serie_a",
+    Leagues.LIGUE_1.value: "soccer_france_ligue_one",
+    Leagues.CHAMPIONS_LEAGUE.value: "soccer_uefa_champs_league",
+    Leagues.EUROPA_LEAGUE.value: "soccer_uefa_europa_league",
+}
+
+API_FOOTBALL_LEAGUE_IDS = {
+    Leagues.LA_LIGA.value: 140,
+    Leagues.PREMIER_LEAGUE.value: 39,
+    Leagues.BUNDESLIGA.value: 78,
+    Leagues.SERIE_A.value: 135,
+    Leagues.LIGUE_1.value: 61,
+    Leagues.CHAMPIONS_LEAGUE.value: 2,
+    Leagues.EUROPA_LEAGUE.value: 3,
+}
+
+# Estado corto de api_football -> status de matches (aplazados, cancelados, etc. se descartan)
+API_FOOTBALL_STATUSES = {
+    **dict.fromkeys(("FT", "AET", "PEN"), "finished"),
+    **dict.fromkeys(("TBD", "NS"), "scheduled"),
+    **dict.fromkeys(("1H", "HT", "2H", "ET", "BT", "P", "LIVE", "INT"), "live"),
+}
+
+# Tipo de estadística de api_football -> columna de match_stats (sin el prefijo home_/away_)
+API_FOOTBALL_STAT_COLUMNS = {
+    "Ball Possession": "possession",
+    "Total Shots": "shots",
+    "Shots on Goal": "shots_on_target",
+    "Corner Kicks": "corners",
+    "Fouls": "fouls",
+    "Yellow Cards": "yellow_cards",
+    "Red Cards": "red_cards",
+    "expected_goals": "xg",
+}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Limitador token bucket para corrutinas (rate tokens/s, capacidad burst)"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncAPIClient:
+    """
+    Uso:
+        async with AsyncAPIClient() as client:
+            odds = await client.fetch_odds_for_leagues()
+    """
+
+    def __init__(self, providers: Dict = None, base_urls: Optional[Dict[str, str]] = None,
+                 rate_limits: Optional[Dict] = None, max_connections: int = 20,
+                 retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 10.0,
+                 timeout: float = 10.0):
+        self.providers = providers or API_CONFIG
+        self.base_urls = {name: cfg["base_url"] for name, cfg in self.providers.items()}
+        self.base_urls.update(base_urls or {})
+        limits = {**RATE_LIMITS, **(rate_limits or {})}
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._buckets = {
+            name: TokenBucket(**limits.get(name, {"rate": 5.0, "burst": 10}))
+            for name in self.providers
+        }
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    async def __aenter__(self):
+        for name in self.providers:
+            self._sessions[name] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300),
+                timeout=self.timeout,
+                headers=self._auth_headers(name)
+            )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.gather(*(session.close() for session in self._sessions.values()))
+        self._sessions.clear()
+
+    def _auth_headers(self, provider: str) -> Dict[str, str]:
+        kind, name = PROVIDER_AUTH.get(provider, ("header", None))
+        key = self.providers[provider].get("key")
+        return {name: key} if kind == "header" and key else {}
+
+    def _auth_params(self, provider: str) -> Dict[str, str]:
+        kind, name = PROVIDER_AUTH.get(provider, ("header", None))
+        key = self.providers[provider].get("key")
+        return {name: key} if kind == "param" and key else {}
+
+    async def get_json(self, provider: str, path: str, params: Optional[Dict] = None) -> Any:
+        """GET con límite de peticiones y reintentos (429/5xx/errores de red)"""
+        url = self.base_urls[provider].rstrip("/") + "/" + path.lstrip("/")
+        query = {**self._auth_params(provider), **(params or {})}
+        session = self._sessions[provider]
+
+        for attempt in range(self.retries + 1):
+            await self._buckets[provider].acquire()
+            retry_after = None
+            try:
+                async with session.get(url, params=query) as response:
+                    if response.status not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+                    retry_after = response.headers.get("Retry-After")
+                    error = f"HTTP {response.status}"
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                error = repr(e)
+
+            if attempt == self.retries:
+                raise aiohttp.ClientError(f"{provider} {path}: {error} tras {attempt + 1} intentos")
+
+            # Backoff exponencial con jitter completo (o el Retry-After del servidor)
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            if retry_after and retry_after.replace(".", "", 1).isdigit():
+                delay = max(delay, float(retry_after))
+            logger.warning(f"{provider} {path}: {error}, reintento en {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def gather(self, requests: List[Tuple[str, str, Optional[Dict]]]) -> List[Any]:
+        """Lanza todas las peticiones a la vez; los fallos se devuelven como excepciones"""
+        return await asyncio.gather(
+            *(self.get_json(provider, path, params) for provider, path, params in requests),
+            return_exceptions=True
+        )
+
+    async def fetch_odds_for_leagues(self, leagues: Optional[List[str]] = None,
+                                     markets: str = "h2h,totals", regions: str = "eu") -> Dict[str, List[Dict]]:
+        """Cuotas de todos los partidos de varias ligas en paralelo (odds_api)"""
+        leagues = leagues or list(ODDS_API_SPORT_KEYS)
+        results = await self.gather([
+            ("odds_api", f"sports/{ODDS_API_SPORT_KEYS[league]}/odds",
+             {"regions": regions, "markets": markets, "oddsFormat": "decimal"})
+            for league in leagues
+        ])
+        odds = {}
+        for league, result in zip(leagues, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error obteniendo cuotas de {league}: {result}")
+                odds[league] = []
+            else:
+                odds[league] = result
+        return odds
+
+    async def fetch_fixture_statistics(self, fixture_ids: List[int]) -> Dict[int, Any]:
+        """Estadísticas de muchos partidos en paralelo (api_football)"""
+        results = await self.gather([
+            ("api_football", "fixtures/statistics", {"fixture": fixture_id})
+            for fixture_id in fixture_ids
+        ])
+        return {
+            fixture_id: result
+            for fixture_id, result in zip(fixture_ids, results)
+            if not isinstance(result, Exception)
+        }
+
+    async def fetch_team_seasons(self, team_name: str, seasons: List[int]) -> Dict:
+        """Estadísticas por temporada de un equipo (api_football)"""
+        search = await self.get_json("api_football", "teams", {"search": team_name})
+        teams = search.get("response", []) if isinstance(search, dict) else []
+        if not teams:
+            return {"team": team_name, "seasons": []}
+        team_id = teams[0]["team"]["id"]
+
+        leagues = await self.gather([
+            ("api_football", "leagues", {"team": team_id, "season": season, "type": "league"})
+            for season in seasons
+        ])
+        requests = []
+        for season, league in zip(seasons, leagues):
+            entries = league.get("response", []) if isinstance(league, dict) else []
+            if entries:
+                requests.append(("api_football", "teams/statistics",
+                                 {"team": team_id, "season": season, "league": entries[0]["league"]["id"]}))
+
+        stats = await self.gather(requests)
+        return {
+            "team": teams[0]["team"]["name"],
+            "seasons": [s.get("response") for s in stats if isinstance(s, dict)]
+        }
+
+    async def fetch_league_fixtures(self, league: str, seasons: List[int]) -> List[Dict]:
+        """
+        Partidos de una liga en varias temporadas en paralelo (api_football), con
+        las columnas de matches. `seasons` son años de inicio de temporada.
+        """
+        results = await self.gather([
+            ("api_football", "fixtures", {"league": API_FOOTBALL_LEAGUE_IDS[league], "season": season})
+            for season in seasons
+        ])
+        fixtures = []
+        for season, result in zip(seasons, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error obteniendo partidos de {league} {season}: {result}")
+                continue
+            for entry in result.get("response", []) if isinstance(result, dict) else []:
+                status = API_FOOTBALL_STATUSES.get(entry["fixture"]["status"]["short"])
+                if status is None:
+                    continue
+                fixtures.append({
+                    "api_match_id": f"api_football:{entry['fixture']['id']}",
+                    "league": league,
+                    "competition": league,
+                    "date": entry["fixture"]["date"],
+                    "home_team": entry["teams"]["home"]["name"],
+                    "away_team": entry["teams"]["away"]["name"],
+                    "home_score": entry["goals"]["home"],
+                    "away_score": entry["goals"]["away"],
+                    "status": status,
+                })
+        return fixtures
+
+
+def odds_api_items(events: List[Dict]) -> List[Dict]:
+    """
+    Eventos de odds_api en el formato de los scrapers (home_team, away_team, odds),
+    uno por evento y casa: 1X2 plano y las líneas de goles en {"Over/Under": {...}}
+    """
+    items = []
+    for event in events if isinstance(events, list) else []:
+        home, away = event.get("home_team"), event.get("away_team")
+        for bookmaker in event.get("bookmakers") or []:
+            odds = {}
+            for market in bookmaker.get("markets") or []:
+                for outcome in market.get("outcomes") or []:
+                    if market.get("key") == "h2h":
+                        selection = {home: "1", away: "2", "Draw": "X"}.get(outcome.get("name"))
+                        if selection:
+                            odds[selection] = outcome["price"]
+                    elif market.get("key") == "totals" and outcome.get("point") is not None:
+                        odds.setdefault(BetTypes.OVER_UNDER.value, {})[
+                            f"{outcome['name'].lower()}_{outcome['point']}"
+                        ] = outcome["price"]
+            if odds:
+                items.append({"home_team": home, "away_team": away, "bookmaker": bookmaker.get("key"), "odds": odds})
+    return items
+
+
+def fixture_statistics_row(result: Any) -> Optional[Dict]:
+    """Fila de match_stats de una respuesta de fixtures/statistics (el local va primero)"""
+    teams = result.get("response", []) if isinstance(result, dict) else []
+    if len(teams) != 2:
+        return None
+    row = {}
+    for side, team in zip(("home", "away"), teams):
+        for stat in team.get("statistics") or []:
+            column = API_FOOTBALL_STAT_COLUMNS.get(stat.get("type"))
+            value = stat.get("value")
+            if column:
+                # Posesión ("55%") y xG ("1.23") llegan como texto
+                row[f"{side}_{column}"] = float(value.rstrip("%")) if isinstance(value, str) else value
+    return row
+
+
+def run(coro_factory, **client_options):
+    """Ejecuta una corrutina con un cliente abierto desde código síncrono"""
+    async def _main():
+        async with AsyncAPIClient(**client_options) as client:
+            return await coro_factory(client)
+    return asyncio.run(_main())
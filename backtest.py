@@ -0,0 +1,330 @@
+"""
+Backtesting walk-forward de los modelos 1X2 sobre las cuotas guardadas
+
+Las temporadas se recorren en orden cronológico por pasos de step_days: en cada
+paso el modelo se entrena solo con los partidos anteriores (mode='full') o sigue
+entrenando con los del bloque ya jugado (mode='incremental', como
+BettingPredictor.update_model; random forest siempre se reentrena) y predice los
+partidos del paso. Las características son solo las previas al partido
+(features.FEATURE_COLUMNS): walk_forward rechaza las estadísticas del propio
+partido (posesión, tiros, xG, goles), así que nunca ve el futuro.
+
+Con todas las predicciones se simulan de una vez (vectorizado con
+value_bets.scan_value_bets) las apuestas de valor contra la cuota vigente al
+inicio de cada partido (OddsStore.prices_before), con stake fijo o Kelly. Cada
+paso escribe una fila en model_performance (aciertos, confianza media, apostado y
+beneficio). run_backtests reparte ligas × configuraciones en procesos.
+"""
+
+import os
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler, LabelEncoder
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from config import BACKTEST_CONFIG, MODEL_CONFIG, VALUE_BET_CONFIG, BetTypes, Leagues
+from database import engine as default_engine, create_db_engine, MLModel, ModelPerformance, bump_data_version
+from features import FEATURE_COLUMNS, season_of
+from feature_store import FeatureStore, STAT_COLUMNS, DERIVED_COLUMNS
+from ml_model import BettingPredictor, INCREMENTAL_MODEL_TYPES
+from odds_store import OddsStore
+from value_bets import DOUBLE_CHANCE_OUTCOMES, outcome_probabilities, scan_value_bets
+
+logger = logging.getLogger(__name__)
+
+_OUTCOMES = ['1', 'X', '2']
+
+# Columnas que solo se conocen al terminar el partido
+IN_MATCH_COLUMNS = set(STAT_COLUMNS + DERIVED_COLUMNS + ['result'])
+
+
+def make_config(name: Optional[str] = None, model_type: str = 'xgboost', **overrides) -> Dict:
+    """Configuración de una ejecución: BACKTEST_CONFIG + modelo, hiperparámetros y características"""
+    config = {
+        **BACKTEST_CONFIG,
+        'model_type': model_type,
+        'params': {},
+        'features': list(FEATURE_COLUMNS),
+        'min_ev': VALUE_BET_CONFIG['min_ev'],
+        **overrides,
+    }
+    config['name'] = name or f"{model_type}-{config['mode']}-{config['step_days']}d"
+    return config
+
+
+def load_league(bind, league: str, bookmaker: Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Vectores del feature store en orden cronológico y cuotas 1X2 previas a cada partido"""
+    store = FeatureStore(Session(bind=bind))
+    chunks = list(store.iter_chunks(league))
+    if not chunks:
+        return pd.DataFrame(), pd.DataFrame()
+    frame = pd.concat(chunks, ignore_index=True)
+    frame = frame[frame['result'].isin(_OUTCOMES)].reset_index(drop=True)
+    odds = OddsStore(bind).prices_before(frame.set_index('match_id')['date'], BetTypes.WIN_DRAW_WIN)
+    if bookmaker is not None:
+        odds = odds[odds['bookmaker'] == bookmaker]
+    return frame, odds
+
+
+def _boundaries(dates: pd.Series, config: Dict) -> pd.DatetimeIndex:
+    """Inicio de cada paso: desde la primera temporada simulada (tras el mínimo de entrenamiento)"""
+    seasons = season_of(dates)
+    test_seasons = np.sort(seasons.unique())[-config['seasons']:]
+    start = dates[seasons >= test_seasons[0]].min()
+    warmup = dates.iloc[min(config['min_train_matches'], len(dates) - 1)]
+    start = max(start, warmup).normalize()
+    return pd.date_range(start, dates.max() + pd.Timedelta(days=config['step_days']), freq=f"{config['step_days']}D")
+
+
+def walk_forward(frame: pd.DataFrame, config: Dict, n_jobs: Optional[int] = None) -> pd.DataFrame:
+    """
+    Predicciones fuera de muestra de los partidos de las temporadas simuladas.
+    Columnas: match_id, date, result, step, period_start, prob_1, prob_X, prob_2
+    """
+    leaked = [column for column in config['features'] if column in IN_MATCH_COLUMNS]
+    if leaked:
+        raise ValueError(f"Características del propio partido en el backtest: {', '.join(leaked)}")
+    frame = frame.sort_values(['date', 'match_id'], kind='stable').reset_index(drop=True)
+    boundaries = _boundaries(frame['date'], config)
+    step_of = np.searchsorted(boundaries.values, frame['date'].values, side='right') - 1
+
+    X = frame.reindex(columns=config['features']).fillna(0).to_numpy(dtype=float)
+    le = LabelEncoder().fit(_OUTCOMES)
+    y = le.transform(frame['result'])
+    probs = np.full((len(frame), len(_OUTCOMES)), np.nan)
+
+    model = scaler = None
+    pending = np.empty(0, dtype=np.int64)  # Partidos jugados aún no usados (modo incremental)
+    increments = 0
+    for step in range(len(boundaries)):
+        block = np.flatnonzero(step_of == step)
+        if not block.size:
+            continue
+        incremental = (config['mode'] == 'incremental' and model is not None
+                       and config['model_type'] in INCREMENTAL_MODEL_TYPES)
+        if not incremental or increments >= MODEL_CONFIG['full_rebuild_every']:
+            train = np.flatnonzero(step_of < step)
+            if len(np.unique(y[train])) < len(_OUTCOMES):
+                continue
+            scaler = StandardScaler().fit(X[train])
+            model = BettingPredictor._new_estimator(config['model_type'], n_jobs, config['params'])
+            model.fit(scaler.transform(X[train]), y[train])
+            pending, increments = np.empty(0, dtype=np.int64), 0
+        elif (len(pending) >= MODEL_CONFIG['min_incremental_samples']
+              and len(np.unique(y[pending])) == len(_OUTCOMES)):
+            model = BettingPredictor._continue_training(
+                model, config['model_type'], scaler.transform(X[pending]), y[pending], n_jobs
+            )
+            pending, increments = np.empty(0, dtype=np.int64), increments + 1
+        probs[block] = model.predict_proba(scaler.transform(X[block]))
+        pending = np.concatenate([pending, block])
+
+    tested = step_of >= 0
+    result = pd.DataFrame({
+        'match_id': frame['match_id'].to_numpy(),
+        'date': frame['date'].to_numpy(),
+        'result': frame['result'].to_numpy(),
+        'step': step_of,
+        'period_start': boundaries.values[np.clip(step_of, 0, None)],
+    })
+    for i, outcome in enumerate(le.classes_):
+        result[f'prob_{outcome}'] = probs[:, i]
+    return result[tested & ~np.isnan(probs).any(axis=1)].reset_index(drop=True)
+
+
+def simulate_bets(predictions: pd.DataFrame, odds: pd.DataFrame, config: Dict) -> pd.DataFrame:
+    """
+    Apuestas de valor de todas las predicciones (las max_bets_per_match de mayor EV
+    de cada partido) con su stake y beneficio
+    """
+    columns = ['match_id', 'step', 'market', 'selection', 'price', 'expected_value', 'stake', 'won', 'pnl']
+    if predictions.empty or odds.empty:
+        return pd.DataFrame(columns=columns)
+
+    probabilities = outcome_probabilities(predictions, predictions['match_id'])
+    bets = scan_value_bets(probabilities, odds, bankroll=config['bankroll'], min_ev=config['min_ev'])
+    bets = bets.groupby('match_id', sort=False).head(config['max_bets_per_match'])
+    if bets.empty:
+        return pd.DataFrame(columns=columns)
+
+    played = predictions.set_index('match_id')
+    result = played['result'].reindex(bets['match_id']).to_numpy()
+    selection = bets['selection'].to_numpy()
+    is_double = (bets['market'] == BetTypes.DOUBLE_CHANCE.value).to_numpy()
+    covers = np.array([r in DOUBLE_CHANCE_OUTCOMES.get(s, ()) for r, s in zip(result, selection)], dtype=bool)
+    won = np.where(is_double, covers, selection == result)
+
+    stake = bets['stake'].to_numpy() if config['staking'] == 'kelly' else np.full(len(bets), config['flat_stake'])
+    price = bets['price'].to_numpy(dtype=float)
+    return pd.DataFrame({
+        'match_id': bets['match_id'].to_numpy(),
+        'step': played['step'].reindex(bets['match_id']).to_numpy(),
+        'market': bets['market'].to_numpy(),
+        'selection': selection,
+        'price': price,
+        'expected_value': bets['expected_value'].to_numpy(),
+        'stake': stake,
+        'won': won,
+        'pnl': np.where(won, stake * (price - 1.0), -stake),
+    })[columns]
+
+
+def summarize(predictions: pd.DataFrame, bets: pd.DataFrame) -> pd.DataFrame:
+    """Una fila por paso: predicciones, aciertos, confianza media, apuestas, apostado y beneficio"""
+    probs = predictions[[f'prob_{outcome}' for outcome in _OUTCOMES]].to_numpy()
+    scored = predictions.assign(
+        correct=np.asarray(_OUTCOMES)[probs.argmax(axis=1)] == predictions['result'].to_numpy(),
+        confidence=probs.max(axis=1),
+    )
+    periods = scored.groupby('step').agg(
+        period_start=('period_start', 'first'),
+        period_end=('date', 'max'),
+        total_predictions=('match_id', 'size'),
+        correct_predictions=('correct', 'sum'),
+        avg_confidence=('confidence', 'mean'),
+    )
+    staking = bets.groupby('step').agg(bets_placed=('pnl', 'size'), staked=('stake', 'sum'), profit_loss=('pnl', 'sum'))
+    periods = periods.join(staking).fillna({'bets_placed': 0, 'staked': 0.0, 'profit_loss': 0.0})
+    periods['accuracy'] = periods['correct_predictions'] / periods['total_predictions']
+    return periods.reset_index()
+
+
+def write_performance(bind, league: str, config: Dict, periods: pd.DataFrame, run_id: str) -> int:
+    """Filas de model_performance de una ejecución (model_id: modelo en producción del mismo tipo)"""
+    if periods.empty:
+        return 0
+    with bind.begin() as conn:
+        model_id = conn.execute(
+            select(MLModel.id)
+            .where(MLModel.model_name == league, MLModel.model_type == config['model_type'])
+            .order_by(MLModel.trained_at.desc(), MLModel.id.desc())
+            .limit(1)
+        ).scalar()
+        stored_config = {key: value for key, value in config.items() if key != 'features'}
+        conn.execute(insert(ModelPerformance), [
+            {
+                'model_id': model_id,
+                'run_id': run_id,
+                'league': league,
+                'config': stored_config,
+                'date': row.period_end.to_pydatetime(),
+                'period_start': row.period_start.to_pydatetime(),
+                'total_predictions': int(row.total_predictions),
+                'correct_predictions': int(row.correct_predictions),
+                'accuracy': float(row.accuracy),
+                'avg_confidence': float(row.avg_confidence),
+                'bets_placed': int(row.bets_placed),
+                'staked': float(row.staked),
+                'profit_loss': float(row.profit_loss),
+            }
+            for row in periods.itertuples(index=False)
+        ])
+    return len(periods)
+
+
+def backtest_league(league: str, config: Optional[Dict] = None, bind=None, write: bool = True,
+                    n_jobs: Optional[int] = None) -> Dict:
+    """Backtest completo de una liga con una configuración. Devuelve el resumen"""
+    bind = bind or default_engine
+    config = config or make_config()
+    start = time.perf_counter()
+
+    frame, odds = load_league(bind, league, config.get('bookmaker'))
+    if frame.empty:
+        raise ValueError(f"No hay partidos en el feature store para {league}")
+    predictions = walk_forward(frame, config, n_jobs)
+    bets = simulate_bets(predictions, odds, config)
+    periods = summarize(predictions, bets)
+
+    run_id = f"{league}:{config['name']}:{datetime.utcnow():%Y%m%d%H%M%S}"
+    if write:
+        write_performance(bind, league, config, periods, run_id)
+
+    staked = float(bets['stake'].sum())
+    profit = float(bets['pnl'].sum())
+    summary = {
+        'league': league,
+        'config': config['name'],
+        'run_id': run_id,
+        'periods': len(periods),
+        'matches': len(predictions),
+        'accuracy': float(periods['correct_predictions'].sum() / max(len(predictions), 1)),
+        'bets': len(bets),
+        'staked': staked,
+        'profit_loss': profit,
+        'roi': profit / staked if staked else 0.0,
+        'seconds': time.perf_counter() - start,
+        'error': None,
+    }
+    logger.info(
+        f"Backtest {config['name']} en {league}: {summary['matches']} partidos, "
+        f"accuracy {summary['accuracy']:.3f}, {summary['bets']} apuestas, ROI {summary['roi']:+.2%}"
+    )
+    return summary
+
+
+def _backtest_one(league: str, config: Dict, url: Optional[str], threads: int) -> Dict:
+    """Tarea de un worker: su propio engine (los engines no se comparten entre procesos)"""
+    bind = create_db_engine(url) if url else default_engine
+    try:
+        return backtest_league(league, config, bind, n_jobs=threads)
+    finally:
+        if url:
+            bind.dispose()
+
+
+def run_backtests(leagues: Optional[List[str]] = None, configs: Optional[List[Dict]] = None,
+                  workers: Optional[int] = None, threads_per_worker: int = 1,
+                  url: Optional[str] = None) -> List[Dict]:
+    """
+    Backtest de ligas × configuraciones en un ProcessPoolExecutor (como
+    training.train_all). El feature store se actualiza antes, en este proceso.
+    """
+    from training import _init_worker
+
+    leagues = leagues or [league.value for league in Leagues]
+    configs = configs or [make_config()]
+    bind = create_db_engine(url) if url else default_engine
+    store = FeatureStore(Session(bind=bind))
+    for league in leagues:
+        store.update(league)
+
+    tasks = [(league, config) for league in leagues for config in configs]
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) // max(1, threads_per_worker))
+    workers = max(1, min(workers, len(tasks)))
+    logger.info(f"Backtesting de {len(tasks)} combinaciones liga × configuración con {workers} workers")
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(threads_per_worker,)
+    ) as executor:
+        futures = {
+            executor.submit(_backtest_one, league, config, url, threads_per_worker): (league, config['name'])
+            for league, config in tasks
+        }
+        for future in as_completed(futures):
+            league, name = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"Error en el backtest {name} de {league}: {e}")
+                results.append({'league': league, 'config': name, 'error': str(e)})
+
+    bump_data_version('backtests', bind)
+    if url:
+        bind.dispose()
+    logger.info(f"Backtesting completo en {time.perf_counter() - start:.1f}s")
+    return results
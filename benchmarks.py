@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+"""
+Benchmarks de rendimiento para SportsPred Dashboard
+
+Uso:
+    python benchmarks.py prediction [--sizes 1000 10000]
+    python benchmarks.py parsing [--sizes 1000 10000] [--html pagina.html ...]
+    python benchmarks.py value_bets [--sizes 1000 10000]
+    python benchmarks.py goal_model [--sizes 1 3 10]
+    python benchmarks.py aggregates [--sizes 2 5 10]
+    python benchmarks.py h2h [--sizes 2 10 50]
+    python benchmarks.py settlement [--sizes 10000 100000]
+    python benchmarks.py placement [--sizes 1 8 32]
+    python benchmarks.py backtest [--sizes 2 5]
+    python benchmarks.py tuning [--sizes 8 24]
+    python benchmarks.py import_time [--sizes 5]
+    python benchmarks.py async_client [--sizes 50 200]
+"""
+
+import sys
+import os
+import time
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _timed(func, *args, **kwargs):
+    """Ejecuta func y devuelve (resultado, segundos)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _synthetic_predictor(leagues, n_features: int = 11, seed: int = 42):
+    """BettingPredictor con modelos XGBoost entrenados sobre datos aleatorios"""
+    import xgboost as xgb
+    from sklearn.preprocessing import StandardScaler, LabelEncoder
+    from ml_model import BettingPredictor
+
+    rng = np.random.default_rng(seed)
+    features = [f'f{i}' for i in range(n_features)]
+    predictor = BettingPredictor(db_session=None)
+
+    for league in leagues:
+        X = pd.DataFrame(rng.normal(size=(600, n_features)), columns=features)
+        y = rng.choice(['1', 'X', '2'], size=600)
+        le = LabelEncoder()
+        scaler = StandardScaler()
+        model = xgb.XGBClassifier(n_estimators=100, max_depth=5, objective='multi:softprob', num_class=3)
+        model.fit(scaler.fit_transform(X), le.fit_transform(y))
+        predictor.models[(league, 'xgboost')] = {
+            'model': model,
+            'scaler': scaler,
+            'label_encoder': le,
+            'features': features,
+        }
+    return predictor, features
+
+
+def benchmark_prediction(sizes=(1000, 10000), per_fixture_limit: int = 2000):
+    """Compara predict_match por partido frente a predict_matches por lotes"""
+    leagues = ['La Liga', 'Premier League', 'Serie A']
+    predictor, features = _synthetic_predictor(leagues)
+    rng = np.random.default_rng(0)
+
+    for size in sizes:
+        fixtures = pd.DataFrame(rng.normal(size=(size, len(features))), columns=features)
+        fixtures['league'] = rng.choice(leagues, size=size)
+        fixtures['odds_1'] = rng.uniform(1.3, 6.0, size)
+        fixtures['odds_X'] = rng.uniform(2.8, 4.5, size)
+        fixtures['odds_2'] = rng.uniform(1.3, 8.0, size)
+
+        _, batch_time = _timed(predictor.predict_matches, fixtures)
+
+        # El camino por partido es lento: se mide una muestra y se extrapola
+        sample = fixtures.head(min(size, per_fixture_limit))
+        records = sample.to_dict('records')
+        for record in records:
+            record['odds'] = {'1': record['odds_1'], 'X': record['odds_X'], '2': record['odds_2']}
+        _, loop_time = _timed(lambda: [predictor.predict_match(r['league'], r) for r in records])
+        loop_time *= size / len(sample)
+
+        logger.info(
+            f"{size:>6} partidos | por partido: {loop_time:8.3f}s"
+            f"{' (extrapolado)' if len(sample) < size else ''}"
+            f" | por lotes: {batch_time:6.3f}s | x{loop_time / batch_time:,.0f}"
+        )
+
+
+def _odds_page(rows: int, seed: int = 0) -> bytes:
+    """Página HTML sintética con la estructura que espera el scraper de cuotas"""
+    rng = np.random.default_rng(seed)
+    parts = [
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Serie A odds</title>',
+        '<script>var config = {"tracking": true};</script></head><body>',
+        '<nav class="menu">' + ''.join(f'<a href="/l/{i}">Liga {i}</a>' for i in range(200)) + '</nav>',
+        '<table class="table-main"><tbody>',
+    ]
+    for i in range(rows):
+        h, d, a = rng.uniform(1.2, 6.0, 3).round(2)
+        parts.append(
+            f'<tr class="deactivate" xeid="{i}"><td class="table-time">20:45</td>'
+            f'<td class="table-participant"><a class="name" href="#">Equipo {2 * i}</a> - '
+            f'<a class="name" href="#">Equipo {2 * i + 1}</a></td>'
+            f'<td class="odds"><a href="#">{h}</a></td><td class="odds">{d}</td>'
+            f'<td class="odds">{a}</td><td class="center info-value">12</td></tr>'
+        )
+    parts.append('</tbody></table><footer>&copy; 2024</footer></body></html>')
+    return ''.join(parts).encode('utf-8')
+
+
+def _measure(func):
+    """(resultado, segundos, pico de memoria en bytes); tracemalloc va en otra pasada"""
+    import tracemalloc
+    result, seconds = _timed(func)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def benchmark_parsing(sizes=(1000, 10000), html_files=None, chunk_size: int = 16384):
+    """Compara BeautifulSoup (DOM completo) con el parser en streaming"""
+    from itertools import islice
+    from data_fetcher import FreeDataFetcher
+    from odds_parser import parse_odds_stream
+
+    # Calentamiento (imports y compilación de expresiones regulares)
+    FreeDataFetcher.parse_odds_html(_odds_page(5))
+    list(parse_odds_stream([_odds_page(5)]))
+
+    pages = [(path, open(path, 'rb').read()) for path in html_files or []]
+    pages += [(f'sintética {rows} filas', _odds_page(rows)) for rows in ([] if html_files else sizes)]
+
+    def chunks(content):
+        return (content[i:i + chunk_size] for i in range(0, len(content), chunk_size))
+
+    for name, content in pages:
+        logger.info(f"{name} ({len(content) / 1024:,.0f} KiB)")
+        for label, limit in [('primeros 5', 5), ('todas', None)]:
+            soup_rows, soup_time, soup_peak = _measure(lambda: FreeDataFetcher.parse_odds_html(content, limit))
+            stream_rows, stream_time, stream_peak = _measure(
+                lambda: list(islice(parse_odds_stream(chunks(content)), limit))
+            )
+            assert soup_rows == stream_rows, "Los dos parsers deben producir los mismos registros"
+            logger.info(
+                f"  {label:<10} | BeautifulSoup: {soup_time * 1000:8.1f} ms, pico {soup_peak / 2**20:7.1f} MiB"
+                f" | streaming: {stream_time * 1000:8.1f} ms, pico {stream_peak / 2**20:6.2f} MiB"
+                f" | {len(stream_rows)} partidos"
+            )
+
+
+def _market_snapshot(size: int, bookmakers: int = 3, seed: int = 0):
+    """Probabilidades y cuotas sintéticas (1X2, doble oportunidad, over/under y BTTS)"""
+    from value_bets import outcome_probabilities
+
+    rng = np.random.default_rng(seed)
+    match_ids = np.arange(1, size + 1)
+    p1x2 = rng.dirichlet([4, 3, 3], size)
+    probabilities = [outcome_probabilities(
+        pd.DataFrame({'prob_1': p1x2[:, 0], 'prob_X': p1x2[:, 1], 'prob_2': p1x2[:, 2]}), match_ids
+    )]
+    selections = {
+        'Over/Under': [f'{side}_{line}' for line in ('1.5', '2.5', '3.5') for side in ('over', 'under')],
+        'Ambos Marcan': ['yes', 'no'],
+    }
+    for market, labels in selections.items():
+        for first, second in zip(labels[::2], labels[1::2]):
+            p = rng.uniform(0.2, 0.8, size)
+            for label, values in ((first, p), (second, 1 - p)):
+                probabilities.append(pd.DataFrame(
+                    {'match_id': match_ids, 'market': market, 'selection': label, 'prob': values}
+                ))
+    probabilities = pd.concat(probabilities, ignore_index=True)
+
+    odds = pd.concat([
+        probabilities.assign(
+            bookmaker=f'casa{b}',
+            price=(1 / (probabilities['prob'] * rng.uniform(0.95, 1.12, len(probabilities)))).round(2)
+        ).drop(columns='prob')
+        for b in range(bookmakers)
+    ], ignore_index=True)
+    return probabilities, odds
+
+
+def benchmark_value_bets(sizes=(1000, 10000)):
+    """EV, margen y Kelly para todas las selecciones de todos los mercados"""
+    from value_bets import scan_value_bets
+
+    scan_value_bets(*_market_snapshot(10))  # Calentamiento
+    for size in sizes:
+        probabilities, odds = _market_snapshot(size)
+        table, seconds = _timed(scan_value_bets, probabilities, odds, bankroll=1000.0)
+        logger.info(
+            f"{size:>6} partidos | {len(odds):>8,} selecciones | {seconds * 1000:8.1f} ms"
+            f" | {len(odds) / seconds:,.0f} selecciones/s | {len(table):,} apuestas de valor"
+        )
+
+
+def benchmark_goal_model(sizes=(1, 3, 10)):
+    """Ajuste Dixon-Coles en frío frente a reajuste en caliente tras una jornada"""
+    from mock_history import generate_history
+    from goal_model import GoalModel
+
+    for seasons in sizes:
+        matches, _ = generate_history('Premier League', seasons=seasons, seed=0)
+        finished = matches[matches['status'] == 'finished'].sort_values('date')
+        previous, latest = finished.iloc[:-10], finished
+
+        cold, cold_time = _timed(lambda: GoalModel('Premier League').fit(latest))
+        warm_model = GoalModel('Premier League').fit(previous)
+        _, warm_time = _timed(warm_model.fit, latest)
+        logger.info(
+            f"{seasons:>3} temporadas ({len(latest):>5} partidos) | en frío: {cold_time * 1000:7.1f} ms"
+            f" ({cold.fit_info['iterations']} it.) | en caliente: {warm_time * 1000:7.1f} ms"
+            f" ({warm_model.fit_info['iterations']} it.)"
+        )
+
+
+def benchmark_aggregates(sizes=(2, 5, 10)):
+    """Agregados por equipo: recálculo completo, jornada incremental y lectura por clave"""
+    from sqlalchemy import delete, select
+    from database import create_db_engine, Base, AggregatedMatch
+    from mock_history import generate_history, bulk_load
+    import aggregates
+
+    for seasons in sizes:
+        bind = create_db_engine("sqlite://")
+        Base.metadata.create_all(bind)
+        bulk_load(*generate_history('Serie A', seasons=seasons, seed=0), bind=bind)
+
+        applied, rebuild_time = _timed(aggregates.rebuild, bind, ['Serie A'])
+        table = AggregatedMatch.__table__
+        with bind.begin() as conn:
+            latest = select(table.c.match_id).order_by(table.c.match_id.desc()).limit(10).scalar_subquery()
+            conn.execute(delete(table).where(table.c.match_id.in_(latest)))
+        _, update_time = _timed(aggregates.update, bind, 'Serie A')
+
+        lookups = 200
+        _, lookup_time = _timed(lambda: [aggregates.team_season('Inter de Milán', 'Serie A', bind=bind)
+                                         for _ in range(lookups)])
+        logger.info(
+            f"{seasons:>3} temporadas ({applied:>5} partidos) | recálculo: {rebuild_time * 1000:7.1f} ms"
+            f" | jornada (10 partidos): {update_time * 1000:6.1f} ms"
+            f" | lectura: {lookup_time / lookups * 1e6:6.0f} µs"
+        )
+
+
+def benchmark_h2h(sizes=(2, 10, 50)):
+    """Enfrentamientos directos: índice ordenado frente a recorrer la lista de partidos"""
+    from mock_history import generate_history, LEAGUE_TEAMS
+    from h2h import H2HIndex
+    from utils import calculate_h2h_stats
+
+    for seasons in sizes:
+        frames = [generate_history(league, seasons=seasons, seed=i)[0] for i, league in enumerate(LEAGUE_TEAMS)]
+        matches = pd.concat(frames, ignore_index=True)
+        matches = matches[matches['status'] == 'finished'].assign(match_id=lambda df: np.arange(len(df)))
+        records = matches.to_dict('records')
+        pairs = matches[['home_team', 'away_team']].sample(200, random_state=0).values.tolist()
+
+        index, build_time = _timed(H2HIndex.from_matches, matches)
+        _, index_time = _timed(lambda: [index.stats(a, b) for a, b in pairs])
+        _, history_time = _timed(lambda: [index.last_meetings(a, b, 10) for a, b in pairs])
+        _, linear_time = _timed(lambda: [calculate_h2h_stats(records, a, b) for a, b in pairs[:20]])
+        logger.info(
+            f"{len(matches):>7,} partidos | índice: {build_time * 1000:7.1f} ms"
+            f" | consulta: {index_time / len(pairs) * 1e6:6.1f} µs"
+            f" | últimos 10: {history_time / len(pairs) * 1e6:6.1f} µs"
+            f" | lineal: {linear_time / 20 * 1e6:9.1f} µs"
+        )
+
+
+def _synthetic_bets(bind, n_bets: int, n_users: int = 1000, n_matches: int = 10, seed: int = 0):
+    """Usuarios, una jornada de partidos terminados (con córners) y n_bets apuestas abiertas"""
+    from datetime import datetime
+    from sqlalchemy import insert
+    from database import User, Match, MatchStats, Bet
+
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow()
+    selections = [
+        ('1X2', '1'), ('1X2', 'X'), ('1X2', '2'), ('Over/Under', 'Over 2.5'), ('Over/Under', 'Under 2.5'),
+        ('Ambos Marcan', 'Sí'), ('Ambos Marcan', 'No'), ('Resultado Exacto', '1-1'),
+        ('Doble Oportunidad', '1X'), ('Total Tiros de Esquina', 'Over 9.5'), ('Over/Under', 'Over 2'),
+    ]
+    picks = rng.integers(0, len(selections), n_bets)
+    stakes = rng.uniform(1, 20, n_bets).round(2)
+    odds = rng.uniform(1.2, 6.0, n_bets).round(2)
+    with bind.begin() as conn:
+        conn.execute(insert(User), [
+            {'id': i + 1, 'username': f'user{i}', 'password_hash': '-', 'balance': 1000.0}
+            for i in range(n_users)
+        ])
+        conn.execute(insert(Match), [
+            {'id': i + 1, 'league': 'Serie A', 'date': now, 'home_team': f'H{i}', 'away_team': f'A{i}',
+             'status': 'finished', 'home_score': int(rng.poisson(1.5)), 'away_score': int(rng.poisson(1.1))}
+            for i in range(n_matches)
+        ])
+        conn.execute(insert(MatchStats), [
+            {'match_id': i + 1, 'home_corners': int(rng.poisson(5)), 'away_corners': int(rng.poisson(4))}
+            for i in range(n_matches)
+        ])
+        if not n_bets:
+            return
+        conn.execute(insert(Bet), [
+            {'user_id': int(user), 'match_id': int(match), 'bet_type': selections[pick][0],
+             'selection': selections[pick][1], 'odds': float(price), 'stake': float(stake),
+             'potential_win': float(stake * price - stake), 'status': 'pending', 'placed_at': now}
+            for user, match, pick, price, stake in zip(
+                rng.integers(1, n_users + 1, n_bets), rng.integers(1, n_matches + 1, n_bets), picks, odds, stakes
+            )
+        ])
+
+
+def benchmark_settlement(sizes=(10000, 100000)):
+    """Liquidación de una jornada: apuestas abiertas resueltas con UPDATE por lotes"""
+    import tempfile
+    from database import create_db_engine, Base
+    import settlement
+
+    for n_bets in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            bind = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            Base.metadata.create_all(bind)
+            _synthetic_bets(bind, n_bets)
+
+            settled, settle_time = _timed(settlement.settle_finished, bind)
+            again, rerun_time = _timed(settlement.settle_finished, bind)
+            bind.dispose()
+        logger.info(
+            f"{n_bets:>8,} apuestas | liquidadas: {settled:>8,} en {settle_time * 1000:8.1f} ms"
+            f" ({settled / settle_time:,.0f}/s) | repetición: {again} en {rerun_time * 1000:6.1f} ms"
+        )
+
+
+def benchmark_placement(sizes=(1, 8, 32), bets_per_thread: int = 300, n_users: int = 50):
+    """
+    Prueba de carga de la colocación de apuestas: N hilos apostando a la vez sobre
+    pocos usuarios (mucha contención), una transacción por apuesta frente a
+    micro-lotes. Comprueba que ningún usuario supera su saldo ni su límite diario.
+    """
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlalchemy import text
+    from database import create_db_engine, Base
+    import placement
+
+    def run(bind, threads, place):
+        rng = np.random.default_rng(threads)
+        jobs = [
+            (int(user), int(match), float(stake))
+            for user, match, stake in zip(
+                rng.integers(1, n_users + 1, threads * bets_per_thread),
+                rng.integers(1, 11, threads * bets_per_thread),
+                rng.uniform(1, 10, threads * bets_per_thread).round(2),
+            )
+        ]
+        chunks = [jobs[i::threads] for i in range(threads)]
+        work = lambda chunk: [place(user, match, '1X2', '1', 2.0, stake)['accepted'] for user, match, stake in chunk]
+        with ThreadPoolExecutor(threads) as pool:
+            accepted, elapsed = _timed(lambda: sum(sum(done) for done in pool.map(work, chunks)))
+        with bind.connect() as conn:
+            broken = conn.execute(text("""
+                SELECT COUNT(*) FROM users u
+                LEFT JOIN (SELECT user_id, SUM(stake) AS staked FROM bets GROUP BY user_id) b ON b.user_id = u.id
+                WHERE u.balance < 0 OR u.daily_spent > u.daily_limit + 1e-9
+                   OR ABS(1000 - u.balance - COALESCE(b.staked, 0)) > 1e-6
+            """)).scalar()
+        return len(jobs), accepted, elapsed, broken
+
+    for threads in sizes:
+        lines = []
+        for mode in ('directo', 'micro-lotes'):
+            with tempfile.TemporaryDirectory() as tmp:
+                bind = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+                Base.metadata.create_all(bind)
+                _synthetic_bets(bind, 0, n_users=n_users)
+                with bind.begin() as conn:
+                    conn.execute(text("UPDATE matches SET status = 'scheduled', home_score = NULL, away_score = NULL"))
+                if mode == 'directo':
+                    place = lambda *args: placement.place_bet(*args, bind=bind)
+                    total, accepted, elapsed, broken = run(bind, threads, place)
+                else:
+                    placer = placement.PlacementQueue(bind)
+                    total, accepted, elapsed, broken = run(bind, threads, placer.place)
+                    placer.close()
+                bind.dispose()
+            lines.append(f"{mode}: {total / elapsed:8,.0f}/s ({accepted:>5} aceptadas, {broken} usuarios incoherentes)")
+        logger.info(f"{threads:>3} hilos | " + " | ".join(lines))
+
+
+def benchmark_backtest(sizes=(2, 5), model_types=('xgboost', 'random_forest')):
+    """Backtesting walk-forward de todas las ligas × configuraciones en paralelo"""
+    import tempfile
+    from database import create_db_engine, Base
+    from mock_history import generate_history, bulk_load, LEAGUE_TEAMS
+    import backtest
+
+    for seasons in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            bind = create_db_engine(url)
+            Base.metadata.create_all(bind)
+            for i, league in enumerate(LEAGUE_TEAMS):
+                bulk_load(*generate_history(league, seasons=seasons + 1, seed=i), bind=bind)
+            bind.dispose()
+
+            configs = [backtest.make_config(model_type=model_type, seasons=seasons) for model_type in model_types]
+            results, elapsed = _timed(backtest.run_backtests, list(LEAGUE_TEAMS), configs, url=url)
+        failed = [r for r in results if r['error']]
+        matches = sum(r['matches'] for r in results if not r['error'])
+        logger.info(
+            f"{seasons:>3} temporadas × {len(LEAGUE_TEAMS)} ligas × {len(configs)} configuraciones"
+            f" | {matches:>6,} predicciones | {elapsed:6.1f} s | {len(failed)} fallos"
+        )
+
+
+def benchmark_tuning(sizes=(8, 24), seasons=3, league='La Liga'):
+    """Tuning con successive halving; la segunda pasada sale entera de la caché de folds"""
+    import tempfile
+    from database import create_db_engine, Base
+    from mock_history import generate_history, bulk_load
+    import tuning
+
+    for n_trials in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            bind = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            Base.metadata.create_all(bind)
+            bulk_load(*generate_history(league, seasons=seasons, seed=0), bind=bind)
+            for run in ('fría', 'caché'):
+                results, elapsed = _timed(
+                    tuning.tune_all, [league], ['xgboost'], bind=bind, n_trials=n_trials
+                )
+                result = results[0]
+                if result['error']:
+                    logger.info(f"{n_trials:>4} combinaciones | {run:>5} | error: {result['error']}")
+                    continue
+                logger.info(
+                    f"{n_trials:>4} combinaciones | {run:>5} | {result['folds_computed']:>4} folds calculados"
+                    f" | {result['folds_cached']:>4} de caché | {elapsed:6.1f} s | log loss {result['score']:.4f}"
+                )
+            bind.dispose()
+
+
+# Módulos que app.py importa al arrancar (los pesados se importan en cada página)
+APP_IMPORTS = ['streamlit', 'streamlit_authenticator', 'pandas', 'data_layer']
+# Lo que se importaba antes al arrancar app.py
+EAGER_IMPORTS = APP_IMPORTS + ['plotly.express', 'plotly.graph_objects', 'ml_model']
+
+
+def _import_profile(modules):
+    """Importa los módulos en un intérprete nuevo: (segundos, {módulo: µs acumulados})"""
+    import subprocess
+
+    code = "import time; t = time.perf_counter()\n" + "".join(f"import {m}\n" for m in modules) + \
+           "print(time.perf_counter() - t)"
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise ImportError(result.stderr.strip().splitlines()[-1])
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cum, name = line[len('import time:'):].split('|')
+            if cum.strip().isdigit() and not name.startswith('  '):
+                cumulative[name.strip()] = int(cum)
+    return float(result.stdout.strip()), cumulative
+
+
+def benchmark_import_time(sizes=(5,)):
+    """Arranque en frío de app.py: imports actuales frente a importar todo al inicio"""
+    repeats = sizes[0]
+    for label, modules in [('app.py (perezoso)', APP_IMPORTS), ('todo al inicio', EAGER_IMPORTS)]:
+        try:
+            runs = [_import_profile(modules) for _ in range(repeats)]
+        except ImportError as e:
+            logger.info(f"{label:<18} | no disponible: {e}")
+            continue
+        seconds = sorted(run[0] for run in runs)[len(runs) // 2]
+        top = sorted(runs[-1][1].items(), key=lambda item: -item[1])[:5]
+        logger.info(
+            f"{label:<18} | mediana {seconds * 1000:8.1f} ms en {repeats} arranques"
+            f" | más lentos: " + ", ".join(f"{name} {us / 1000:.0f} ms" for name, us in top)
+        )
+
+
+def benchmark_async_client(sizes=(50, 200), rate: float = 100.0, burst: int = 10):
+    """
+    AsyncAPIClient contra un servidor aiohttp local: cada ruta responde 429 con
+    Retry-After la primera vez, así que todas las peticiones se reintentan; el
+    token bucket (rate peticiones/s, ráfaga burst) marca el tiempo mínimo
+    """
+    import asyncio
+    from aiohttp import web
+    from async_fetcher import AsyncAPIClient
+
+    async def _timed_async(coro):
+        start = time.perf_counter()
+        result = await coro
+        return result, time.perf_counter() - start
+
+    async def run(n):
+        throttled = set()
+
+        async def handler(request):
+            item = request.match_info['item']
+            if item not in throttled:
+                throttled.add(item)
+                return web.json_response({}, status=429, headers={'Retry-After': '0.05'})
+            return web.json_response({'item': int(item)})
+
+        app = web.Application()
+        app.router.add_get('/items/{item}', handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', 0).start()
+        port = runner.addresses[0][1]
+        try:
+            async with AsyncAPIClient(
+                providers={'stub': {'base_url': f'http://127.0.0.1:{port}', 'key': None}},
+                rate_limits={'stub': {'rate': rate, 'burst': burst}},
+                backoff_base=0.01
+            ) as client:
+                return await _timed_async(client.gather([('stub', f'items/{i}', None) for i in range(n)]))
+        finally:
+            await runner.cleanup()
+
+    # Un aviso por reintento: se silencian durante la medición
+    logging.getLogger('async_fetcher').setLevel(logging.ERROR)
+    for n in sizes:
+        results, seconds = asyncio.run(run(n))
+        ok = sum(isinstance(result, dict) and result.get('item') == i for i, result in enumerate(results))
+        # 2n peticiones (429 + reintento) por el bucket: las que exceden la ráfaga van a `rate`/s
+        minimum = max(0, 2 * n - burst) / rate
+        logger.info(
+            f"{n:>5} peticiones | correctas tras el 429: {ok:>5} | {seconds * 1000:7.1f} ms"
+            f" (mínimo del token bucket {minimum * 1000:7.1f} ms) | {2 * n / seconds:6.1f} peticiones/s"
+        )
+
+
+BENCHMARKS = {
+    'prediction': benchmark_prediction,
+    'parsing': benchmark_parsing,
+    'value_bets': benchmark_value_bets,
+    'goal_model': benchmark_goal_model,
+    'aggregates': benchmark_aggregates,
+    'h2h': benchmark_h2h,
+    'settlement': benchmark_settlement,
+    'placement': benchmark_placement,
+    'backtest': benchmark_backtest,
+    'tuning': benchmark_tuning,
+    'import_time': benchmark_import_time,
+    'async_client': benchmark_async_client,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks de SportsPred')
+    parser.add_argument('name', choices=sorted(BENCHMARKS), help='Benchmark a ejecutar')
+    parser.add_argument('--sizes', type=int, nargs='+', help='Tamaños de entrada')
+    parser.add_argument('--html', nargs='+', help='Páginas HTML guardadas (benchmark parsing)')
+    args = parser.parse_args()
+
+    kwargs = {'sizes': tuple(args.sizes)} if args.sizes else {}
+    if args.html:
+        kwargs['html_files'] = args.html
+    BENCHMARKS[args.name](**kwargs)
+
+
+if __name__ == "__main__":
+    main()
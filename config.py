@@ -42,6 +42,11 @@ API_CONFIG = {
 MODEL_CONFIG = {
     "retrain_interval_hours": 24,
     "min_training_samples": 100,
+    "incremental_training": True,  # El job de reentrenamiento actualiza con los partidos nuevos
+    "full_rebuild_every": 7,  # Actualizaciones incrementales antes de un reentrenamiento completo
+    "min_incremental_samples": 20,  # Partidos nuevos mínimos para actualizar
+    "incremental_rounds": 25,  # Rondas de boosting (XGBoost) por actualización
+    "incremental_trees": 20,  # Etapas añadidas con warm_start (gradient boosting; random forest se reentrena)
     "prediction_confidence_threshold": 0.65,
     "features": [
         "home_form_last_5",
@@ -62,6 +67,116 @@ MODEL_CONFIG = {
     ]
 }
 
+# Configuración del scheduler
+SCHEDULER_CONFIG = {
+    "odds_refresh_minutes": 15,
+    "ingest_minutes": 30,
+    "metrics_refresh_minutes": 10,
+    "max_workers": 4,
+    "misfire_grace_seconds": 300,
+    "training_workers": None,  # None = según núcleos disponibles
+    "training_threads": 1
+}
+
+# Caché de respuestas HTTP (TTL en segundos, por subcadena de la URL)
+HTTP_CACHE_CONFIG = {
+    "path": "data/http_cache.db",
+    "max_mb": 100,
+    "default_ttl": 300,
+    "stale_while_revalidate": 600,
+    "ttls": {
+        "odds": 60,
+        "fixtures/statistics": 6 * 3600,
+        "teams/statistics": 6 * 3600,
+        "teams": 24 * 3600,
+        "leagues": 24 * 3600
+    }
+}
+
+# Historial de cuotas (odds_store)
+ODDS_HISTORY_CONFIG = {
+    "default_bookmaker": "default",
+    "rollup_dir": "data/odds_history",  # Parquet particionado por mes
+    "rollup_after_days": 30,  # Partidos terminados hace más de N días se archivan
+    "rollup_hour": 4  # Hora UTC del job diario de archivado
+}
+
+# Modelo de goles Dixon-Coles (goal_model)
+GOAL_MODEL_CONFIG = {
+    "max_goals": 10,  # Tamaño de la matriz de marcadores (0..max_goals)
+    "history_days": 3 * 365,  # Partidos usados en cada ajuste
+    "time_decay": 0.0019,  # Peso exp(-xi * días) de los partidos antiguos
+    "l2": 0.001,  # Regularización de ataque/defensa (fija la escala)
+    "over_under_lines": [0.5, 1.5, 2.5, 3.5, 4.5]
+}
+
+# Detección de apuestas de valor (value_bets)
+VALUE_BET_CONFIG = {
+    "min_ev": 0.05,  # EV mínimo para marcar una apuesta como de valor
+    "kelly_fraction": 0.25,  # Fracción de Kelly aplicada al stake
+    "max_stake_fraction": 0.05,  # Stake máximo como fracción del bankroll
+    "min_price": 1.01
+}
+
+# Búsqueda de hiperparámetros (tuning): valores candidatos por tipo de modelo
+TUNING_CONFIG = {
+    "n_trials": 24,  # Combinaciones muestreadas por liga y tipo de modelo
+    "n_folds": 4,  # Folds de validación temporal (TimeSeriesSplit)
+    "eta": 2,  # Successive halving: sigue 1/eta de las combinaciones en cada ronda
+    "seed": 42,
+    "search_spaces": {
+        "xgboost": {
+            "n_estimators": [100, 200, 400],
+            "max_depth": [3, 4, 5, 6],
+            "learning_rate": [0.03, 0.05, 0.1, 0.2],
+            "subsample": [0.7, 0.85, 1.0],
+            "colsample_bytree": [0.7, 0.85, 1.0],
+            "min_child_weight": [1, 3, 5]
+        },
+        "random_forest": {
+            "n_estimators": [100, 200, 400],
+            "max_depth": [6, 10, 14, None],
+            "min_samples_leaf": [1, 3, 5, 10],
+            "max_features": ["sqrt", 0.5, None]
+        },
+        "gradient_boosting": {
+            "n_estimators": [100, 200],
+            "max_depth": [2, 3, 4],
+            "learning_rate": [0.05, 0.1],
+            "subsample": [0.8, 1.0]
+        }
+    }
+}
+
+# Backtesting walk-forward (backtest)
+BACKTEST_CONFIG = {
+    "seasons": 5,  # Temporadas simuladas (las anteriores solo sirven de entrenamiento)
+    "step_days": 14,  # Cada cuánto se reentrena/actualiza el modelo
+    "mode": "full",  # full: reentrenar en cada paso; incremental: seguir entrenando con el bloque jugado
+    "min_train_matches": 200,  # Partidos mínimos antes de la primera predicción
+    "staking": "flat",  # flat: stake fijo; kelly: fracción de Kelly del bankroll inicial
+    "flat_stake": 10.0,
+    "bankroll": 1000.0,
+    "max_bets_per_match": 1,  # Apuestas de valor por partido (las de mayor EV)
+    "bookmaker": None  # None = todas las casas guardadas
+}
+
+# Apuestas de los usuarios (settlement)
+BETTING_CONFIG = {
+    "settlement_batch_matches": 500,  # Partidos liquidados por transacción
+    "placement_batch_size": 200,  # Apuestas colocadas por transacción (micro-lotes)
+    "placement_max_wait_ms": 0,  # Espera extra para llenar un micro-lote (0 = lo acumulado mientras se escribe el anterior)
+    "default_daily_limit": 100.0  # Usuarios sin daily_limit
+}
+
+# Cachés de la app Streamlit (data_layer)
+APP_CACHE_CONFIG = {
+    "version_ttl_seconds": 10,  # Cada cuánto se consulta data_versions
+    "query_ttl_seconds": 3600,  # Tope de vida de un resultado aunque no cambie la versión
+    "live_ttl_seconds": 15,  # Partidos en vivo
+    "max_entries": 256
+}
+
 # Colores por liga
 LEAGUE_COLORS = {
     "La Liga": "#FF6B35",
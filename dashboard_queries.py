@@ -0,0 +1,203 @@
+"""
+Consultas de las páginas de app.py (sin dependencias de Streamlit)
+
+data_layer.py las envuelve con st.cache_data; aquí solo se lee la base de datos
+y los modelos. Todas devuelven DataFrames/dicts pequeños listos para pintar.
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import aggregates
+
+logger = logging.getLogger(__name__)
+
+UPCOMING_DAYS = 7
+
+# Tipo de modelo con el que el dashboard predice (y cuya precisión muestra)
+DASHBOARD_MODEL_TYPE = "xgboost"
+
+
+def league_teams(bind, league: str) -> List[str]:
+    """Nombres canónicos de los equipos de la liga (uno por team_id, sin alias)"""
+    with bind.connect() as conn:
+        rows = conn.execute(text("""
+        SELECT name FROM teams WHERE id IN (
+            SELECT home_team_id FROM matches WHERE league = :league
+            UNION
+            SELECT away_team_id FROM matches WHERE league = :league
+        )
+        """), {"league": league}).fetchall()
+    return sorted(row[0] for row in rows)
+
+
+def match_counts(bind, day: datetime) -> Dict[str, int]:
+    """Partidos del día y en vivo"""
+    start = datetime(day.year, day.month, day.day)
+    with bind.connect() as conn:
+        today = conn.execute(
+            text("SELECT COUNT(*) FROM matches WHERE date >= :start AND date < :end"),
+            {"start": start, "end": start + timedelta(days=1)}
+        ).scalar()
+        live = conn.execute(text("SELECT COUNT(*) FROM matches WHERE status = 'live'")).scalar()
+    return {"today": today, "live": live}
+
+
+def upcoming_matches(bind, league: Optional[str] = None, days: int = UPCOMING_DAYS,
+                     limit: int = 50) -> pd.DataFrame:
+    """Partidos programados de los próximos días (match_id, league, date, equipos e IDs)"""
+    now = datetime.utcnow()
+    return pd.read_sql_query(text("""
+    SELECT id AS match_id, league, date, home_team, away_team, home_team_id, away_team_id
+    FROM matches
+    WHERE status = 'scheduled' AND date >= :now AND date < :until
+    AND (:league IS NULL OR league = :league)
+    ORDER BY date
+    LIMIT :limit
+    """), bind, params={"now": now, "until": now + timedelta(days=days), "league": league, "limit": limit},
+        parse_dates=["date"])
+
+
+def live_matches(bind) -> List[Dict]:
+    """Partidos en vivo con la mejor cuota 1X2 actual del historial de cuotas"""
+    from odds_store import OddsStore
+
+    matches = pd.read_sql_query(text("""
+    SELECT id, date, home_team, away_team, home_score, away_score, odds
+    FROM matches WHERE status = 'live' ORDER BY date
+    """), bind, parse_dates=["date"])
+    if matches.empty:
+        return []
+
+    best = OddsStore(bind).best_prices(matches["id"].tolist())
+    now = datetime.utcnow()
+    result = []
+    for m in matches.itertuples(index=False):
+        odds = best.loc[m.id].dropna().to_dict() if m.id in best.index else _json_odds(m.odds)
+        if not all(outcome in odds for outcome in ("1", "X", "2")):
+            continue
+        result.append({
+            "id": m.id,
+            "home_team": m.home_team,
+            "away_team": m.away_team,
+            "minute": max(0, int((now - m.date).total_seconds() // 60)),
+            "score": f"{int(m.home_score or 0)}-{int(m.away_score or 0)}",
+            "odds": odds,
+        })
+    return result
+
+
+def _json_odds(value) -> Dict:
+    if isinstance(value, str):
+        return json.loads(value)
+    return value or {}
+
+
+def team_matches(bind, team: str, league: Optional[str] = None, limit: int = 38) -> pd.DataFrame:
+    """
+    Últimos partidos terminados de un equipo con sus estadísticas. El equipo se
+    busca por team_id (cualquier alias sirve) y los nombres son los canónicos.
+    """
+    from teams import get_team_registry
+
+    team_id = get_team_registry(bind).resolve(team, create=False)
+    return pd.read_sql_query(text("""
+    SELECT m.id AS match_id, m.date, m.league, th.name AS home_team, ta.name AS away_team,
+           m.home_score, m.away_score,
+           ms.home_possession, ms.away_possession, ms.home_shots, ms.away_shots,
+           ms.home_shots_on_target, ms.away_shots_on_target
+    FROM matches m
+    JOIN teams th ON th.id = m.home_team_id
+    JOIN teams ta ON ta.id = m.away_team_id
+    LEFT JOIN match_stats ms ON ms.match_id = m.id
+    WHERE m.status = 'finished' AND (m.home_team_id = :team_id OR m.away_team_id = :team_id)
+    AND (:league IS NULL OR m.league = :league)
+    ORDER BY m.date DESC
+    LIMIT :limit
+    """), bind, params={"team_id": team_id, "league": league, "limit": limit}, parse_dates=["date"])
+
+
+def team_season_summary(bind, team: str, league: str) -> Optional[pd.DataFrame]:
+    """Tabla Métrica/Total/Casa/Fuera de la temporada en curso (None sin datos)"""
+    row = aggregates.team_season(team, league, bind=bind)
+    return aggregates.summary_table(row) if row else None
+
+
+def team_standing(bind, team: str, league: str) -> Optional[Dict]:
+    """Posición, puntos, partidos y diferencia de goles de la temporada en curso"""
+    row = aggregates.team_season(team, league, bind=bind)
+    return aggregates.standing(row) if row else None
+
+
+def team_goal_timing(bind, team: str, league: str) -> Optional[Dict[str, int]]:
+    """Goles marcados por tramo de minutos en la temporada en curso"""
+    row = aggregates.team_season(team, league, bind=bind)
+    return aggregates.goal_timing(row) if row else None
+
+
+def league_table(bind, league: str) -> pd.DataFrame:
+    """Clasificación de la temporada en curso (team, season, position, points...)"""
+    return aggregates.league_table(league, bind=bind)
+
+
+def dashboard_metrics(bind, day: datetime, league: Optional[str] = None) -> Dict:
+    """
+    Métricas precalculadas del dashboard (lectura por clave); las que aún no ha
+    calculado el scheduler se completan con los conteos indexados de match_counts
+    """
+    metrics = aggregates.dashboard_metrics(day, league, bind=bind)
+    if metrics["today"] is None or metrics["live"] is None:
+        counts = match_counts(bind, day)
+        for key in ("today", "live"):
+            if metrics[key] is None:
+                metrics[key] = counts[key]
+    return metrics
+
+
+def model_accuracy(bind, league: Optional[str] = None, model_type: str = DASHBOARD_MODEL_TYPE) -> Optional[float]:
+    """
+    Accuracy del último modelo `model_type` registrado (de la liga o de cualquiera),
+    el mismo tipo con el que se calculan las predicciones del dashboard
+    """
+    with bind.connect() as conn:
+        row = conn.execute(text("""
+        SELECT accuracy FROM ml_models
+        WHERE (:league IS NULL OR model_name = :league)
+        AND model_type = :model_type
+        ORDER BY trained_at DESC LIMIT 1
+        """), {"league": league, "model_type": model_type}).fetchone()
+    return row[0] if row else None
+
+
+def upcoming_predictions(bind, league: str, registry=None, days: int = UPCOMING_DAYS) -> pd.DataFrame:
+    """
+    Predicciones y mejor apuesta de valor de los próximos partidos de una liga.
+    Devuelve los partidos con prob_*, prediction y las columnas de la mejor apuesta
+    (market, selection, price, expected_value); vacío si no hay modelo o partidos.
+    """
+    from ml_model import BettingPredictor
+
+    fixtures = upcoming_matches(bind, league, days=days)
+    if fixtures.empty:
+        return fixtures
+
+    with Session(bind) as db:
+        predictor = BettingPredictor(db, registry=registry)
+        try:
+            features = predictor.feature_store.fixture_features(league, fixtures)
+            fixtures = pd.concat([fixtures, features], axis=1)
+            predictions = predictor.predict_matches(fixtures, model_type=DASHBOARD_MODEL_TYPE)
+            value_bets = predictor.scan_value_bets(fixtures, predictions=predictions)
+        except (FileNotFoundError, ValueError) as e:
+            logger.warning(f"Sin predicciones para {league}: {e}")
+            return pd.DataFrame()
+
+    result = pd.concat([fixtures[["match_id", "league", "date", "home_team", "away_team"]], predictions], axis=1)
+    best = value_bets.drop_duplicates("match_id")[["match_id", "market", "selection", "price", "expected_value"]]
+    return result.merge(best, on="match_id", how="left")
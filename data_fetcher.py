@@ -4,19 +4,33 @@ from bs4 import BeautifulSoup
 import json
 from datetime import datetime, timedelta
 import time
+from itertools import islice
 from typing import Dict, List, Optional
 import logging
+import os
+import numpy as np
+
+from sqlalchemy import bindparam, insert, select, update
+
+import aggregates
+from config import API_CONFIG
+from database import engine as default_engine, Match, MatchStats, bump_data_version
+from h2h import get_h2h_index
+from teams import canonical_key, get_team_registry
+from http_cache import ResponseCache, get_response_cache
+from odds_parser import parse_odds_stream
 
 logger = logging.getLogger(__name__)
 
 class FreeDataFetcher:
     """Obtiene datos deportivos de fuentes gratuitas"""
     
-    def __init__(self):
+    def __init__(self, cache: Optional[ResponseCache] = None):
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
+        self.cache = cache or get_response_cache()
     
     def get_inter_milan_stats(self, years_back: int = 2) -> Dict:
         """
@@ -74,114 +88,102 @@ class FreeDataFetcher:
         }
         return forms.get(team, ["W", "D", "L", "W", "D"])
     
+    def _team_season(self, team: str) -> Optional[Dict]:
+        """Fila más reciente de team_season_stats del equipo (None sin datos)"""
+        try:
+            return aggregates.team_season(team)
+        except Exception as e:
+            logger.error(f"Error leyendo agregados de {team}: {e}")
+            return None
+    
     def _get_home_record(self, team: str) -> Dict:
-        """Récord en casa"""
-        records = {
-            "Inter de Milán": {"wins": 12, "draws": 3, "losses": 0, "goals_for": 35, "goals_against": 8},
-            "Juventus": {"wins": 10, "draws": 4, "losses": 1, "goals_for": 28, "goals_against": 12},
-            "AC Milan": {"wins": 9, "draws": 5, "losses": 1, "goals_for": 30, "goals_against": 15}
-        }
-        return records.get(team, {"wins": 8, "draws": 5, "losses": 2, "goals_for": 25, "goals_against": 14})
+        """Récord en casa (temporada más reciente, de los agregados por equipo)"""
+        return aggregates.venue_record(self._team_season(team), 'home')
     
     def _get_away_record(self, team: str) -> Dict:
-        """Récord fuera de casa"""
-        records = {
-            "Inter de Milán": {"wins": 9, "draws": 4, "losses": 2, "goals_for": 25, "goals_against": 10},
-            "Juventus": {"wins": 8, "draws": 3, "losses": 4, "goals_for": 22, "goals_against": 15},
-            "AC Milan": {"wins": 7, "draws": 4, "losses": 4, "goals_for": 20, "goals_against": 18}
-        }
-        return records.get(team, {"wins": 6, "draws": 5, "losses": 4, "goals_for": 18, "goals_against": 16})
+        """Récord fuera de casa (temporada más reciente, de los agregados por equipo)"""
+        return aggregates.venue_record(self._team_season(team), 'away')
     
     def _get_goal_timing_stats(self, team: str) -> Dict:
-        """Distribución de goles por minutos"""
-        stats = {
-            "Inter de Milán": {
-                "0-15": 8,
-                "16-30": 12,
-                "31-45": 15,
-                "46-60": 18,
-                "61-75": 22,
-                "76-90": 29
-            },
-            "Juventus": {
-                "0-15": 6,
-                "16-30": 10,
-                "31-45": 14,
-                "46-60": 16,
-                "61-75": 20,
-                "76-90": 24
-            }
-        }
-        return stats.get(team, {
-            "0-15": 7, "16-30": 11, "31-45": 14, "46-60": 17, "61-75": 21, "76-90": 26
-        })
+        """Distribución de goles por minutos (temporada más reciente)"""
+        return aggregates.goal_timing(self._team_season(team))
     
     def get_match_history(self, team1: str, team2: str, limit: int = 10) -> List[Dict]:
-        """Historial de enfrentamientos directos"""
-        # Datos mock de Inter vs Juventus
-        if "Inter" in team1 and "Juventus" in team2 or "Inter" in team2 and "Juventus" in team1:
-            return [
-                {"date": "2024-02-04", "home": "Inter de Milán", "away": "Juventus", "score": "1-0", "competition": "Serie A"},
-                {"date": "2023-11-26", "home": "Juventus", "away": "Inter de Milán", "score": "1-1", "competition": "Serie A"},
-                {"date": "2023-04-26", "home": "Inter de Milán", "away": "Juventus", "score": "1-0", "competition": "Coppa Italia"},
-                {"date": "2023-03-19", "home": "Inter de Milán", "away": "Juventus", "score": "0-1", "competition": "Serie A"},
-                {"date": "2022-11-06", "home": "Juventus", "away": "Inter de Milán", "score": "2-0", "competition": "Serie A"},
-                {"date": "2022-05-11", "home": "Juventus", "away": "Inter de Milán", "score": "2-4", "competition": "Coppa Italia"},
-                {"date": "2022-04-03", "home": "Juventus", "away": "Inter de Milán", "score": "0-1", "competition": "Serie A"},
-                {"date": "2021-10-24", "home": "Inter de Milán", "away": "Juventus", "score": "1-1", "competition": "Serie A"},
-                {"date": "2021-05-15", "home": "Juventus", "away": "Inter de Milán", "score": "3-2", "competition": "Serie A"},
-                {"date": "2021-01-17", "home": "Inter de Milán", "away": "Juventus", "score": "2-0", "competition": "Serie A"}
-            ]
-        return []
+        """Historial de enfrentamientos directos (índice H2H de los partidos terminados)"""
+        try:
+            registry = get_team_registry()
+            team1_id, team2_id = registry.resolve_many([team1, team2], create=False).tolist()
+            meetings = get_h2h_index().last_meetings(team1_id, team2_id, limit)
+        except Exception as e:
+            logger.error(f"Error leyendo enfrentamientos {team1} - {team2}: {e}")
+            return []
+        for meeting in meetings:
+            meeting["home"] = registry.name(meeting["home"])
+            meeting["away"] = registry.name(meeting["away"])
+        return meetings
     
-    def scrape_odds_from_website(self) -> List[Dict]:
+    def scrape_odds_from_website(self, streaming: bool = True, limit: int = 5) -> List[Dict]:
         """
         Ejemplo de web scraping para obtener odds (solo para fines educativos)
         IMPORTANTE: Verifica los términos de servicio del sitio web
+        
+        Con streaming=True el HTML se parsea por trozos según llega (odds_parser),
+        sin construir el DOM; con streaming=False se usa BeautifulSoup. Si el
+        scraping falla devuelve una lista vacía (nunca las cuotas de ejemplo de
+        get_mock_odds, que se guardarían como precios reales).
         """
         try:
             # Ejemplo con sitio público (usar con moderación y respetando robots.txt)
             url = "https://www.oddsportal.com/soccer/italy/serie-a/"
-            response = self.session.get(url, timeout=10)
             
+            if streaming:
+                chunks = self.cache.iter_content(self.session, url, timeout=10)
+                return list(islice(parse_odds_stream(chunks), limit))
+            
+            response = self.cache.get(self.session, url, timeout=10)
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # Este es un ejemplo genérico - necesitarías adaptar los selectores
-                matches = []
-                match_elements = soup.select('.table-main .deactivate')
-                
-                for element in match_elements[:5]:  # Limitar a 5 partidos
-                    try:
-                        teams = element.select('.name')
-                        if len(teams) >= 2:
-                            home_team = teams[0].text.strip()
-                            away_team = teams[1].text.strip()
-                            
-                            odds_elements = element.select('.odds')
-                            if len(odds_elements) >= 3:
-                                home_odds = float(odds_elements[0].text.strip())
-                                draw_odds = float(odds_elements[1].text.strip())
-                                away_odds = float(odds_elements[2].text.strip())
-                                
-                                matches.append({
-                                    "home_team": home_team,
-                                    "away_team": away_team,
-                                    "odds": {
-                                        "1": home_odds,
-                                        "X": draw_odds,
-                                        "2": away_odds
-                                    }
-                                })
-                    except:
-                        continue
-                
-                return matches
+                return self.parse_odds_html(response.content, limit)
+            logger.error(f"Error en web scraping: HTTP {response.status_code}")
         except Exception as e:
             logger.error(f"Error en web scraping: {e}")
         
-        # Datos mock si falla el scraping
-        return self.get_mock_odds()
+        return []
+    
+    @staticmethod
+    def parse_odds_html(content: bytes, limit: int = 5) -> List[Dict]:
+        """Parsea la página completa con BeautifulSoup"""
+        soup = BeautifulSoup(content, 'html.parser')
+        
+        # Este es un ejemplo genérico - necesitarías adaptar los selectores
+        matches = []
+        match_elements = soup.select('.table-main .deactivate')
+        
+        for element in match_elements[:limit]:
+            try:
+                teams = element.select('.name')
+                if len(teams) >= 2:
+                    home_team = teams[0].text.strip()
+                    away_team = teams[1].text.strip()
+                    
+                    odds_elements = element.select('.odds')
+                    if len(odds_elements) >= 3:
+                        home_odds = float(odds_elements[0].text.strip())
+                        draw_odds = float(odds_elements[1].text.strip())
+                        away_odds = float(odds_elements[2].text.strip())
+                        
+                        matches.append({
+                            "home_team": home_team,
+                            "away_team": away_team,
+                            "odds": {
+                                "1": home_odds,
+                                "X": draw_odds,
+                                "2": away_odds
+                            }
+                        })
+            except:
+                continue
+        
+        return matches
     
     def get_mock_odds(self) -> List[Dict]:
         """Datos mock de odds"""
@@ -209,17 +211,137 @@ class FreeDataFetcher:
             }
         ]
 
-# Añade este método a tu DataFetcher existente
-
 class DataFetcher:
-    # ... código existente ...
+    """Punto de acceso a datos: APIs reales si hay claves, datos mock si no"""
+    
+    def __init__(self, use_mock: Optional[bool] = None):
+        if use_mock is None:
+            use_mock = os.getenv("USE_MOCK_DATA", "true").lower() == "true"
+        self.use_mock = use_mock
+    
+    def has_api_keys(self) -> bool:
+        """Indica si hay alguna clave de API configurada"""
+        return any(provider.get("key") for provider in API_CONFIG.values())
     
+    def get_historical_matches(self, league: str, days_back: int = 730,
+                               persist: bool = True, seed: Optional[int] = None) -> pd.DataFrame:
+        """
+        Historial de partidos de una liga. Con claves de API lo descarga de
+        api_football; en modo mock genera temporadas sintéticas (ver mock_history).
+        Con persist=True se guarda en la base de datos.
+        """
+        if not self.use_mock and self.has_api_keys():
+            return self._get_matches_from_api(league, days_back, persist)
+        
+        from mock_history import generate_history, bulk_load
+        
+        seasons = max(1, -(-days_back // 365))
+        matches, stats = generate_history(league, seasons=seasons, seed=seed)
+        if persist:
+            bulk_load(matches, stats)
+        return matches
+    
+    def _get_matches_from_api(self, league: str, days_back: int, persist: bool) -> pd.DataFrame:
+        """Partidos de las temporadas que cubren days_back (peticiones concurrentes)"""
+        from async_fetcher import run
+        
+        now = datetime.utcnow()
+        since = now - timedelta(days=days_back)
+        # api_football identifica la temporada por su año de inicio (julio)
+        first, last = (d.year if d.month >= 7 else d.year - 1 for d in (since, now))
+        fixtures = run(lambda client: client.fetch_league_fixtures(league, list(range(first, last + 1))))
+        
+        matches = pd.DataFrame(fixtures, columns=[
+            "api_match_id", "league", "competition", "date", "home_team", "away_team",
+            "home_score", "away_score", "status"
+        ])
+        matches["date"] = pd.to_datetime(matches["date"], utc=True).dt.tz_convert(None)
+        matches = matches[matches["date"] >= since].sort_values("date", ignore_index=True)
+        if persist and not matches.empty:
+            self._store_matches(matches)
+        return matches
+    
+    @staticmethod
+    def _store_matches(matches: pd.DataFrame, bind=None) -> int:
+        """
+        Inserta los partidos nuevos y actualiza fecha, marcador y estado de los ya
+        guardados (por api_match_id), y descarga las estadísticas de los terminados
+        que aún no las tienen. Las características los recogen en la siguiente
+        ingesta (scheduler.ingest_finished_matches).
+        """
+        bind = bind or default_engine
+        table = Match.__table__
+        records = matches.astype(object).where(matches.notna(), None).to_dict("records")
+        keys = [record["api_match_id"] for record in records]
+        
+        with bind.begin() as conn:
+            existing = set(conn.execute(
+                select(table.c.api_match_id).where(table.c.api_match_id.in_(keys))
+            ).scalars())
+            new = [record for record in records if record["api_match_id"] not in existing]
+            if new:
+                conn.execute(insert(table), new)
+            if existing:
+                conn.execute(
+                    update(table)
+                    .where(table.c.api_match_id == bindparam("key"))
+                    .values(
+                        date=bindparam("new_date"), status=bindparam("new_status"),
+                        home_score=bindparam("new_home_score"), away_score=bindparam("new_away_score")
+                    ),
+                    [
+                        {"key": record["api_match_id"], **{f"new_{column}": record[column] for column in
+                                                           ("date", "status", "home_score", "away_score")}}
+                        for record in records if record["api_match_id"] in existing
+                    ]
+                )
+        
+        DataFetcher._store_statistics(keys, bind)
+        get_team_registry(bind).backfill_matches()
+        aggregates.update(bind)
+        bump_data_version('matches', bind)
+        logger.info(f"{matches['league'].iloc[0]}: {len(new)} partidos nuevos, {len(existing)} actualizados")
+        return len(records)
+    
+    @staticmethod
+    def _store_statistics(keys: List[str], bind) -> int:
+        """Estadísticas (api_football) de los partidos terminados sin fila en match_stats"""
+        from async_fetcher import run, fixture_statistics_row
+        
+        table = Match.__table__
+        stats_table = MatchStats.__table__
+        with bind.connect() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.api_match_id)
+                .outerjoin(stats_table, stats_table.c.match_id == table.c.id)
+                .where(
+                    table.c.api_match_id.in_(keys),
+                    table.c.status == "finished",
+                    stats_table.c.id.is_(None)
+                )
+            ).fetchall()
+        if not rows:
+            return 0
+        
+        match_ids = {int(key.rsplit(":", 1)[1]): match_id for match_id, key in rows}
+        results = run(lambda client: client.fetch_fixture_statistics(list(match_ids)))
+        records = []
+        for fixture_id, result in results.items():
+            row = fixture_statistics_row(result)
+            if row is not None:
+                records.append({"match_id": match_ids[fixture_id], **row})
+        if records:
+            with bind.begin() as conn:
+                conn.execute(insert(stats_table), records)
+        logger.info(f"Estadísticas de {len(records)} de {len(rows)} partidos terminados")
+        return len(records)
+
     def get_team_historical_stats(self, team_name: str, years_back: int = 2):
         """Obtiene estadísticas históricas de un equipo"""
         if self.use_mock or not self.has_api_keys():
             free_fetcher = FreeDataFetcher()
             
-            if "Inter" in team_name:
+            if canonical_key(team_name) == canonical_key("Inter de Milán"):
                 return free_fetcher.get_inter_milan_stats(years_back)
             
             # Datos genéricos para otros equipos
@@ -228,6 +350,28 @@ class DataFetcher:
             # Usar API real si tienes claves
             return self._get_stats_from_api(team_name, years_back)
     
+    def _get_stats_from_api(self, team_name: str, years_back: int) -> Dict:
+        """Estadísticas por temporada desde api_football (peticiones concurrentes)"""
+        from async_fetcher import run
+        
+        current_year = datetime.now().year
+        seasons = [current_year - i for i in range(1, years_back + 1)]
+        return run(lambda client: client.fetch_team_seasons(team_name, seasons))
+    
+    def get_odds_for_leagues(self, leagues: Optional[List[str]] = None) -> Dict[str, List[Dict]]:
+        """
+        Cuotas de todas las ligas a la vez (una ronda de peticiones en paralelo a
+        odds_api), por liga y en el formato de los scrapers (async_fetcher.odds_api_items).
+        Sin clave de odds_api o en modo mock devuelve {}: las cuotas de ejemplo no
+        son precios de ninguna liga.
+        """
+        if self.use_mock or not API_CONFIG["odds_api"].get("key"):
+            return {}
+        
+        from async_fetcher import run, odds_api_items
+        events = run(lambda client: client.fetch_odds_for_leagues(leagues))
+        return {league: odds_api_items(league_events) for league, league_events in events.items()}
+    
     def _generate_generic_stats(self, team_name: str, years_back: int) -> Dict:
         """Genera estadísticas genéricas para equipos"""
         current_year = datetime.now().year
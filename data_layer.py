@@ -0,0 +1,167 @@
+"""
+Capa de acceso a datos de app.py con las cachés de Streamlit
+
+- Recursos compartidos por todas las sesiones (st.cache_resource): engine de la
+  base de datos, registro de modelos e historial de cuotas.
+- Resultados de consultas (st.cache_data) con clave liga/equipo + versión de los
+  datos. Los jobs del scheduler incrementan data_versions al ingerir datos nuevos,
+  así que la clave cambia y la siguiente ejecución de la página recalcula; el resto
+  de reruns (clics en widgets) se sirven de la caché.
+"""
+
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+import yaml
+from yaml.loader import SafeLoader
+
+import dashboard_queries as queries
+from config import APP_CACHE_CONFIG
+
+QUERY_TTL = APP_CACHE_CONFIG["query_ttl_seconds"]
+MAX_ENTRIES = APP_CACHE_CONFIG["max_entries"]
+
+
+# -- Recursos ---------------------------------------------------------------
+
+@st.cache_resource(show_spinner=False)
+def get_engine():
+    from database import engine, init_db
+    init_db()
+    return engine
+
+
+@st.cache_resource(show_spinner=False)
+def get_model_registry():
+    from model_registry import get_registry
+    return get_registry()
+
+
+@st.cache_data(show_spinner=False)
+def _load_yaml(path: str, mtime: float) -> Dict:
+    with open(path) as file:
+        return yaml.load(file, Loader=SafeLoader)
+
+
+def load_auth_config(path: str = 'config.yaml') -> Optional[Dict]:
+    """config.yaml leído una sola vez (se relee si cambia la fecha de modificación)"""
+    if not os.path.exists(path):
+        return None
+    return _load_yaml(path, os.path.getmtime(path))
+
+
+# -- Versiones de los datos -------------------------------------------------
+
+@st.cache_data(ttl=APP_CACHE_CONFIG["version_ttl_seconds"], show_spinner=False)
+def data_versions() -> Dict[str, int]:
+    from database import get_data_versions
+    return get_data_versions(get_engine())
+
+
+def _versions(*names: str) -> Tuple[int, ...]:
+    versions = data_versions()
+    return tuple(versions.get(name, 0) for name in names)
+
+
+def clear_caches():
+    """Vacía los resultados cacheados (los recursos se mantienen)"""
+    st.cache_data.clear()
+
+
+# -- Consultas --------------------------------------------------------------
+
+@st.cache_data(ttl=QUERY_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _league_teams(league: str, versions: Tuple) -> List[str]:
+    return queries.league_teams(get_engine(), league)
+
+
+def league_teams(league: str) -> List[str]:
+    return _league_teams(league, _versions('matches'))
+
+
+@st.cache_data(ttl=QUERY_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _match_counts(day: str, versions: Tuple) -> Dict[str, int]:
+    return queries.match_counts(get_engine(), datetime.fromisoformat(day))
+
+
+def match_counts() -> Dict[str, int]:
+    """Partidos de hoy y en vivo"""
+    return _match_counts(datetime.utcnow().date().isoformat(), _versions('matches'))
+
+
+@st.cache_data(ttl=QUERY_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _dashboard_metrics(day: str, league: Optional[str], versions: Tuple) -> Dict:
+    return queries.dashboard_metrics(get_engine(), datetime.fromisoformat(day), league)
+
+
+def dashboard_metrics(league: Optional[str] = None) -> Dict:
+    """Partidos de hoy, en vivo y valor detectado de la liga (precalculados por el scheduler)"""
+    return _dashboard_metrics(datetime.utcnow().date().isoformat(), league, _versions('metrics', 'matches'))
+
+
+@st.cache_data(ttl=QUERY_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _model_accuracy(league: Optional[str], versions: Tuple) -> Optional[float]:
+    return queries.model_accuracy(get_engine(), league)
+
+
+def model_accuracy(league: Optional[str] = None) -> Optional[float]:
+    return _model_accuracy(league, _versions('models'))
+
+
+@st.cache_data(ttl=APP_CACHE_CONFIG["live_ttl_seconds"], max_entries=MAX_ENTRIES, show_spinner=False)
+def _live_matches(versions: Tuple) -> List[Dict]:
+    return queries.live_matches(get_engine())
+
+
+def live_matches() -> List[Dict]:
+    return _live_matches(_versions('matches', 'odds'))
+
+
+@st.cache_data(ttl=QUERY_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _team_season_summary(team: str, league: str, versions: Tuple) -> Optional[pd.DataFrame]:
+    return queries.team_season_summary(get_engine(), team, league)
+
+
+def team_season_summary(team: str, league: str) -> Optional[pd.DataFrame]:
+    return _team_season_summary(team, league, _versions('matches'))
+
+
+@st.cache_data(ttl=QUERY_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _team_standing(team: str, league: str, versions: Tuple) -> Optional[Dict]:
+    return queries.team_standing(get_engine(), team, league)
+
+
+def team_standing(team: str, league: str) -> Optional[Dict]:
+    return _team_standing(team, league, _versions('matches'))
+
+
+@st.cache_data(ttl=QUERY_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _league_table(league: str, versions: Tuple) -> pd.DataFrame:
+    return queries.league_table(get_engine(), league)
+
+
+def league_table(league: str) -> pd.DataFrame:
+    """Clasificación de la temporada en curso"""
+    return _league_table(league, _versions('matches'))
+
+
+@st.cache_data(ttl=QUERY_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _team_goal_timing(team: str, league: str, versions: Tuple) -> Optional[Dict[str, int]]:
+    return queries.team_goal_timing(get_engine(), team, league)
+
+
+def team_goal_timing(team: str, league: str) -> Optional[Dict[str, int]]:
+    return _team_goal_timing(team, league, _versions('matches'))
+
+
+@st.cache_data(ttl=QUERY_TTL, max_entries=MAX_ENTRIES, show_spinner="Calculando predicciones...")
+def _upcoming_predictions(league: str, versions: Tuple) -> pd.DataFrame:
+    return queries.upcoming_predictions(get_engine(), league, registry=get_model_registry())
+
+
+def upcoming_predictions(league: str) -> pd.DataFrame:
+    """Próximos partidos de la liga con predicción y mejor apuesta de valor"""
+    return _upcoming_predictions(league, _versions('matches', 'odds', 'models'))
@@ -1,8 +1,16 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, JSON, ForeignKey
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, SmallInteger, String, Float, Date, DateTime, Boolean, JSON, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import StaticPool
+from dotenv import load_dotenv
 from datetime import datetime
 import json
+import os
+import logging
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
@@ -15,11 +23,30 @@ class User(Base):
     password_hash = Column(String(255), nullable=False)
     balance = Column(Float, default=1000.0)  # Saldo virtual
     daily_limit = Column(Float, default=100.0)
+    daily_spent = Column(Float, default=0.0)  # Apostado el día daily_spent_date (placement)
+    daily_spent_date = Column(Date)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_admin = Column(Boolean, default=False)
     
     bets = relationship("Bet", back_populates="user")
 
+class Team(Base):
+    """Equipo canónico: todos los nombres de los proveedores apuntan a un id"""
+    __tablename__ = 'teams'
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), unique=True, nullable=False)
+    league = Column(String(50))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class TeamAlias(Base):
+    """Nombre normalizado (teams.normalize_name) -> equipo"""
+    __tablename__ = 'team_aliases'
+    
+    alias = Column(String(100), primary_key=True)
+    team_id = Column(Integer, ForeignKey('teams.id'), nullable=False, index=True)
+    provider = Column(String(50))
+
 class Match(Base):
     __tablename__ = 'matches'
     
@@ -34,6 +61,16 @@ class Match(Base):
     away_score = Column(Integer)
     status = Column(String(20))  # scheduled, live, finished
     odds = Column(JSON)  # { "1": 2.10, "X": 3.40, "2": 3.50 }
+    home_team_id = Column(Integer, ForeignKey('teams.id'))  # teams.TeamRegistry
+    away_team_id = Column(Integer, ForeignKey('teams.id'))
+    
+    __table_args__ = (
+        Index('ix_matches_league_status_date', 'league', 'status', 'date'),
+        Index('ix_matches_status_date', 'status', 'date'),
+        Index('ix_matches_date', 'date'),
+        Index('ix_matches_home_team_id_date', 'home_team_id', 'date'),
+        Index('ix_matches_away_team_id_date', 'away_team_id', 'date'),
+    )
     
     stats = relationship("MatchStats", back_populates="match", uselist=False)
     bets = relationship("Bet", back_populates="match")
@@ -42,7 +79,7 @@ class MatchStats(Base):
     __tablename__ = 'match_stats'
     
     id = Column(Integer, primary_key=True)
-    match_id = Column(Integer, ForeignKey('matches.id'))
+    match_id = Column(Integer, ForeignKey('matches.id'), index=True)
     home_possession = Column(Float)
     away_possession = Column(Float)
     home_shots = Column(Integer)
@@ -59,6 +96,8 @@ class MatchStats(Base):
     away_red_cards = Column(Integer)
     home_xg = Column(Float)  # Expected goals
     away_xg = Column(Float)
+    home_goal_minutes = Column(JSON)  # [12, 67, ...] minuto de cada gol
+    away_goal_minutes = Column(JSON)
     
     match = relationship("Match", back_populates="stats")
 
@@ -70,13 +109,21 @@ class Bet(Base):
     match_id = Column(Integer, ForeignKey('matches.id'))
     bet_type = Column(String(50))
     selection = Column(String(100))  # "1", "X", "2", "Over 2.5", etc.
+    market = Column(Integer)  # odds_store.MARKET_CODES
+    selection_code = Column(Integer)  # odds_store.encode_selection
     odds = Column(Float)
     stake = Column(Float)
-    potential_win = Column(Float)
-    status = Column(String(20), default="pending")  # pending, won, lost
+    potential_win = Column(Float)  # beneficio neto si gana (utils.calculate_potential_win)
+    status = Column(String(20), default="pending")  # pending, won, lost, void (línea exacta: se devuelve el stake)
     placed_at = Column(DateTime, default=datetime.utcnow)
     settled_at = Column(DateTime)
     
+    __table_args__ = (
+        Index('ix_bets_user_status', 'user_id', 'status'),
+        Index('ix_bets_match_status', 'match_id', 'status'),
+        Index('ix_bets_status', 'status'),
+    )
+    
     user = relationship("User", back_populates="bets")
     match = relationship("Match", back_populates="bets")
 
@@ -94,6 +141,19 @@ class MLModel(Base):
     features_used = Column(JSON)
     trained_at = Column(DateTime, default=datetime.utcnow)
     model_path = Column(String(255))
+    # Linaje: entrenamiento completo o incremental sobre el modelo padre
+    parent_id = Column(Integer, ForeignKey('ml_models.id'))
+    training_mode = Column(String(20))  # full, incremental
+    trained_through = Column(DateTime)  # (fecha, match_id) del último partido usado
+    last_match_id = Column(Integer)
+    training_samples = Column(Integer)  # Partidos usados en este entrenamiento
+    total_samples = Column(Integer)  # Acumulado desde el último entrenamiento completo
+    increments_since_full = Column(Integer)
+    hyperparameters = Column(JSON)  # Los de model_hyperparameters usados al entrenar
+    
+    __table_args__ = (
+        Index('ix_ml_models_name_type_trained', 'model_name', 'model_type', 'trained_at'),
+    )
 
 class ModelPerformance(Base):
     __tablename__ = 'model_performance'
@@ -106,13 +166,288 @@ class ModelPerformance(Base):
     accuracy = Column(Float)
     profit_loss = Column(Float)  # Virtual profit/loss en apuestas sugeridas
     avg_confidence = Column(Float)
+    # Backtesting walk-forward (backtest): una fila por periodo de cada ejecución
+    run_id = Column(String(100), index=True)
+    league = Column(String(50))
+    config = Column(JSON)
+    period_start = Column(DateTime)
+    bets_placed = Column(Integer)
+    staked = Column(Float)
+
+class MatchFeatures(Base):
+    __tablename__ = 'match_features'
+    
+    id = Column(Integer, primary_key=True)
+    match_id = Column(Integer, ForeignKey('matches.id'), unique=True, nullable=False)
+    league = Column(String(50))
+    date = Column(DateTime)
+    feature_version = Column(String(20))
+    result = Column(String(1))  # "1", "X", "2"
+    
+    # Estadísticas del partido
+    home_score = Column(Integer)
+    away_score = Column(Integer)
+    home_possession = Column(Float)
+    away_possession = Column(Float)
+    home_shots = Column(Integer)
+    away_shots = Column(Integer)
+    home_xg = Column(Float)
+    away_xg = Column(Float)
+    home_corners = Column(Integer)
+    away_corners = Column(Integer)
+    
+    # Columnas derivadas
+    goal_difference = Column(Integer)
+    total_goals = Column(Integer)
+    possession_difference = Column(Float)
+    shot_difference = Column(Integer)
+    xg_difference = Column(Float)
+    
+    # Características previas al partido (features.FEATURE_COLUMNS)
+    home_form_last_5 = Column(Float)
+    away_form_last_5 = Column(Float)
+    h2h_home_wins = Column(Float)
+    h2h_away_wins = Column(Float)
+    h2h_draws = Column(Float)
+    avg_goals_scored_home = Column(Float)
+    avg_goals_conceded_home = Column(Float)
+    avg_goals_scored_away = Column(Float)
+    avg_goals_conceded_away = Column(Float)
+    injuries_home = Column(Float)
+    injuries_away = Column(Float)
+    days_since_last_match_home = Column(Float)
+    days_since_last_match_away = Column(Float)
+    is_derby = Column(Float)
+    league_position_home = Column(Float)
+    league_position_away = Column(Float)
+    goal_difference_last5_home = Column(Float)
+    goal_difference_last5_away = Column(Float)
+    xg_difference_last5_home = Column(Float)
+    xg_difference_last5_away = Column(Float)
+    
+    computed_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_match_features_league_version_date', 'league', 'feature_version', 'date'),
+    )
+
+class Bookmaker(Base):
+    __tablename__ = 'bookmakers'
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50), unique=True, nullable=False)
+
+class OddsSnapshot(Base):
+    """Historial de cuotas (solo inserciones): una fila por cambio de precio"""
+    __tablename__ = 'odds_history'
+    
+    id = Column(Integer, primary_key=True)
+    match_id = Column(Integer, ForeignKey('matches.id'), nullable=False)
+    bookmaker_id = Column(Integer, ForeignKey('bookmakers.id'), nullable=False)
+    market = Column(SmallInteger, nullable=False)  # odds_store.MARKET_CODES
+    selection = Column(Integer, nullable=False)  # odds_store.encode_selection
+    ts = Column(Integer, nullable=False)  # segundos epoch UTC
+    price = Column(Float, nullable=False)
+    
+    __table_args__ = (
+        # Última cuota / cuota en el instante T: búsqueda por prefijo y ts descendente
+        Index('ix_odds_history_lookup', 'match_id', 'market', 'selection', 'bookmaker_id', 'ts'),
+        Index('ix_odds_history_ts', 'ts'),
+    )
+
+class DataVersion(Base):
+    """Contador por conjunto de datos; los jobs lo incrementan al escribir datos nuevos"""
+    __tablename__ = 'data_versions'
+    
+    name = Column(String(50), primary_key=True)  # matches, odds, models
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class TeamSeasonStats(Base):
+    """Resumen por equipo y temporada (aggregates.py lo actualiza al terminar cada partido)"""
+    __tablename__ = 'team_season_stats'
+    
+    id = Column(Integer, primary_key=True)
+    league = Column(String(50), nullable=False)
+    season = Column(Integer, nullable=False)  # año de inicio (features.season_of)
+    team_id = Column(Integer, ForeignKey('teams.id'))  # clave (teams.TeamRegistry); NULL solo en filas antiguas
+    team = Column(String(100), nullable=False)  # nombre canónico (para mostrar)
+    
+    # Casa / fuera: contadores y sumas (las medias se calculan al leer)
+    home_played = Column(Integer, default=0)
+    home_wins = Column(Integer, default=0)
+    home_draws = Column(Integer, default=0)
+    home_losses = Column(Integer, default=0)
+    home_goals_for = Column(Integer, default=0)
+    home_goals_against = Column(Integer, default=0)
+    home_clean_sheets = Column(Integer, default=0)
+    home_stats_played = Column(Integer, default=0)  # partidos con match_stats
+    home_possession = Column(Float, default=0.0)
+    home_shots = Column(Integer, default=0)
+    home_shots_on_target = Column(Integer, default=0)
+    away_played = Column(Integer, default=0)
+    away_wins = Column(Integer, default=0)
+    away_draws = Column(Integer, default=0)
+    away_losses = Column(Integer, default=0)
+    away_goals_for = Column(Integer, default=0)
+    away_goals_against = Column(Integer, default=0)
+    away_clean_sheets = Column(Integer, default=0)
+    away_stats_played = Column(Integer, default=0)
+    away_possession = Column(Float, default=0.0)
+    away_shots = Column(Integer, default=0)
+    away_shots_on_target = Column(Integer, default=0)
+    
+    # Goles marcados por tramo de minutos (aggregates.GOAL_TIMING_BUCKETS)
+    goals_0_15 = Column(Integer, default=0)
+    goals_16_30 = Column(Integer, default=0)
+    goals_31_45 = Column(Integer, default=0)
+    goals_46_60 = Column(Integer, default=0)
+    goals_61_75 = Column(Integer, default=0)
+    goals_76_90 = Column(Integer, default=0)
+    
+    points = Column(Integer, default=0)
+    position = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_team_season_stats_team_key', 'league', 'season', 'team_id', unique=True),
+        Index('ix_team_season_stats_team_id', 'team_id', 'season'),
+    )
+
+class AggregatedMatch(Base):
+    """Partidos ya sumados en team_season_stats (hace idempotente la actualización)"""
+    __tablename__ = 'aggregated_matches'
+    
+    match_id = Column(Integer, ForeignKey('matches.id'), primary_key=True)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+class DashboardMetric(Base):
+    """Métricas precalculadas del dashboard: una fila por (nombre, ámbito)"""
+    __tablename__ = 'dashboard_metrics'
+    
+    name = Column(String(50), primary_key=True)  # matches_day, live_matches, value_detected...
+    scope = Column(String(50), primary_key=True, default='')  # día ISO, liga o ''
+    value = Column(Float)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class ModelHyperparameters(Base):
+    """Mejores hiperparámetros encontrados por tuning (la fila más reciente es la vigente)"""
+    __tablename__ = 'model_hyperparameters'
+    
+    id = Column(Integer, primary_key=True)
+    league = Column(String(50))
+    model_type = Column(String(50))
+    params = Column(JSON)
+    score = Column(Float)  # Log loss medio en validación temporal
+    data_version = Column(String(100))  # FeatureStore.data_version al buscar
+    trials = Column(Integer)
+    tuned_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_model_hyperparameters_key', 'league', 'model_type', 'tuned_at'),
+    )
+
+class TuningResult(Base):
+    """Resultado de un fold de validación cruzada (caché de tuning)"""
+    __tablename__ = 'tuning_results'
+    
+    id = Column(Integer, primary_key=True)
+    league = Column(String(50))
+    model_type = Column(String(50))
+    data_version = Column(String(100))
+    n_folds = Column(Integer)
+    fold = Column(Integer)
+    params_key = Column(String(40))  # sha1 de los parámetros en JSON ordenado
+    params = Column(JSON)
+    score = Column(Float)
+    seconds = Column(Float)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_tuning_results_key', 'league', 'model_type', 'data_version', 'n_folds', 'params_key', 'fold',
+              unique=True),
+    )
 
 # Configuración de la base de datos
-engine = create_engine('sqlite:///data/database.db')
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///data/database.db")
+
+# PRAGMAs aplicados a cada conexión SQLite: WAL permite que los lectores
+# (Streamlit) y el escritor (scheduler) trabajen a la vez sin bloquearse
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,  # 64 MB (valor negativo = KiB)
+    "mmap_size": 268435456,  # 256 MB
+    "temp_store": "MEMORY",
+    "busy_timeout": 30000,  # ms
+}
+
+DB_POOL_CONFIG = {
+    "pool_size": 10,
+    "max_overflow": 20,
+    "pool_timeout": 30,
+    "pool_recycle": 3600,
+}
+
+def create_db_engine(url: str = DATABASE_URL, **pool_options):
+    """Crea el engine con pool de conexiones y, en SQLite, los PRAGMAs de rendimiento"""
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_pre_ping=True, **{**DB_POOL_CONFIG, **pool_options})
+    
+    if url in ("sqlite://", "sqlite:///:memory:"):
+        # Una sola conexión compartida: cada conexión nueva sería otra BD vacía
+        db_engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        db_engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000},
+            **{**DB_POOL_CONFIG, **pool_options}
+        )
+    
+    @event.listens_for(db_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    
+    return db_engine
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def migrate_db(bind=engine):
+    """
+    Añade las columnas (anulables) y los índices que falten en tablas ya
+    existentes y actualiza estadísticas
+    """
+    inspector = inspect(bind)
+    created = 0
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns and column.nullable and not column.primary_key:
+                column_type = column.type.compile(dialect=bind.dialect)
+                with bind.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                created += 1
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=bind)
+                created += 1
+    if bind.dialect.name == "sqlite":
+        with bind.begin() as conn:
+            conn.execute(text("PRAGMA optimize"))
+    if created:
+        logger.info(f"Migración: {created} columnas/índices creados")
+    return created
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    migrate_db(engine)
     
 def get_db():
     db = SessionLocal()
@@ -120,3 +455,21 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def bump_data_version(name: str, bind=None) -> None:
+    """Marca un conjunto de datos como modificado (invalida las cachés de la app)"""
+    table = DataVersion.__table__
+    with (bind or engine).begin() as conn:
+        updated = conn.execute(
+            table.update()
+            .where(table.c.name == name)
+            .values(version=table.c.version + 1, updated_at=datetime.utcnow())
+        ).rowcount
+        if not updated:
+            conn.execute(table.insert().values(name=name, version=1, updated_at=datetime.utcnow()))
+
+def get_data_versions(bind=None) -> dict:
+    """{nombre: versión} de todos los conjuntos de datos"""
+    table = DataVersion.__table__
+    with (bind or engine).connect() as conn:
+        return dict(conn.execute(table.select().with_only_columns(table.c.name, table.c.version)).fetchall())
@@ -0,0 +1,214 @@
+import pandas as pd
+import numpy as np
+from sqlalchemy import text, insert, delete, select, bindparam, and_, or_
+from sqlalchemy.util import LRUCache
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Optional, Tuple
+import logging
+
+from database import MatchFeatures
+from features import FEATURE_VERSION, FEATURE_COLUMNS, load_league_history, compute_features
+from h2h import get_h2h_index
+
+logger = logging.getLogger(__name__)
+
+# Historial previo necesario para calcular las características de un partido nuevo:
+# los últimos partidos de cada equipo (forma) y el inicio de su temporada
+# (posición). Los enfrentamientos directos salen del índice H2H compartido, que se
+# mantiene de forma incremental, así que no hace falta cargar su ventana de años.
+CONTEXT_DAYS = 366
+
+# Tamaño de lote para sentencias con IN (...) en SQLite
+_CHUNK_SIZE = 500
+
+STAT_COLUMNS = [
+    'home_score', 'away_score',
+    'home_possession', 'away_possession',
+    'home_shots', 'away_shots',
+    'home_xg', 'away_xg',
+    'home_corners', 'away_corners',
+]
+
+DERIVED_COLUMNS = [
+    'goal_difference', 'total_goals',
+    'possession_difference', 'shot_difference', 'xg_difference',
+]
+
+# Sentencias de lectura construidas una sola vez: SQLite recibe siempre el mismo
+# SQL con parámetros enlazados y la compilación se reutiliza desde la caché
+_COMPILED_CACHE = LRUCache(100)
+
+_mf = MatchFeatures.__table__
+_TRAINING_BASE = select(*[
+    _mf.c[name]
+    for name in ['match_id', 'league', 'date', 'result'] + STAT_COLUMNS + DERIVED_COLUMNS + FEATURE_COLUMNS
+]).where(
+    _mf.c.league == bindparam('league'),
+    _mf.c.feature_version == bindparam('version')
+)
+_LATEST_QUERY = _TRAINING_BASE.order_by(_mf.c.date.desc(), _mf.c.match_id.desc())
+_LATEST_LIMIT_QUERY = _LATEST_QUERY.limit(bindparam('limit'))
+_PAGE_QUERY = (
+    _TRAINING_BASE
+    .where(or_(
+        _mf.c.date > bindparam('last_date'),
+        and_(_mf.c.date == bindparam('last_date'), _mf.c.match_id > bindparam('last_id'))
+    ))
+    .order_by(_mf.c.date, _mf.c.match_id)
+    .limit(bindparam('chunk_size'))
+)
+
+
+class FeatureStore:
+    """
+    Tabla materializada de características por partido (match_features).
+
+    Solo se calculan filas para partidos que pasan a status='finished' (o cuyas
+    filas tienen una FEATURE_VERSION antigua). El contexto cargado para calcularlas
+    está acotado a CONTEXT_DAYS (una temporada) y los enfrentamientos directos se
+    leen del índice H2H incremental, así que el coste depende de los partidos
+    nuevos y no del tamaño del historial completo.
+    """
+
+    def __init__(self, db_session: Session):
+        self.db = db_session
+
+    @property
+    def version(self) -> str:
+        return FEATURE_VERSION
+
+    def pending_matches(self, league: str) -> pd.DataFrame:
+        """
+        Partidos terminados sin características (o con versión antigua). Las
+        características son previas al partido, así que no hace falta que tenga
+        fila en match_stats (sus estadísticas quedan a NULL).
+        """
+        query = text("""
+        SELECT
+            m.id AS match_id, m.date, m.league,
+            m.home_score, m.away_score,
+            ms.home_possession, ms.away_possession,
+            ms.home_shots, ms.away_shots,
+            ms.home_xg, ms.away_xg,
+            ms.home_corners, ms.away_corners
+        FROM matches m
+        LEFT JOIN match_stats ms ON m.id = ms.match_id
+        LEFT JOIN match_features mf ON mf.match_id = m.id
+        WHERE m.league = :league
+        AND m.status = 'finished'
+        AND m.home_score IS NOT NULL
+        AND (mf.id IS NULL OR mf.feature_version != :version)
+        ORDER BY m.date
+        """)
+        return pd.read_sql_query(
+            query, self.db.bind,
+            params={'league': league, 'version': self.version},
+            parse_dates=['date']
+        )
+
+    def update(self, league: str) -> int:
+        """Materializa las características de los partidos pendientes. Devuelve filas nuevas."""
+        pending = self.pending_matches(league)
+        if pending.empty:
+            return 0
+
+        since = pending['date'].min() - timedelta(days=CONTEXT_DAYS)
+        history = load_league_history(self.db.bind, league, since=since.to_pydatetime())
+        features = compute_features(
+            history, h2h_index=get_h2h_index(self.db.bind, refresh=True), bind=self.db.bind
+        )
+        features.index = history['match_id']
+
+        rows = pending.join(features, on='match_id')
+        rows['result'] = np.select(
+            [rows['home_score'] > rows['away_score'], rows['home_score'] == rows['away_score']],
+            ['1', 'X'], '2'
+        )
+        rows['goal_difference'] = rows['home_score'] - rows['away_score']
+        rows['total_goals'] = rows['home_score'] + rows['away_score']
+        rows['possession_difference'] = rows['home_possession'] - rows['away_possession']
+        rows['shot_difference'] = rows['home_shots'] - rows['away_shots']
+        rows['xg_difference'] = rows['home_xg'] - rows['away_xg']
+        rows['feature_version'] = self.version
+        rows['computed_at'] = datetime.utcnow()
+
+        records = rows.astype(object).where(rows.notna(), None).to_dict('records')
+        match_ids = rows['match_id'].tolist()
+
+        for start in range(0, len(match_ids), _CHUNK_SIZE):
+            chunk = match_ids[start:start + _CHUNK_SIZE]
+            self.db.execute(delete(MatchFeatures).where(MatchFeatures.match_id.in_(chunk)))
+        self.db.execute(insert(MatchFeatures), records)
+        self.db.commit()
+
+        logger.info(f"Feature store {league}: {len(records)} filas nuevas (v{self.version})")
+        return len(records)
+
+    def load(self, league: str, limit: Optional[int] = None) -> pd.DataFrame:
+        """Lee los vectores precalculados más recientes de una liga"""
+        params = {'league': league, 'version': self.version}
+        if limit:
+            return self._read(_LATEST_LIMIT_QUERY, {**params, 'limit': limit})
+        return self._read(_LATEST_QUERY, params)
+
+    def iter_chunks(self, league: str, chunk_size: int = 5000,
+                    after: Optional[Tuple[datetime, int]] = None) -> Iterator[pd.DataFrame]:
+        """
+        Recorre los vectores de una liga en orden cronológico por bloques.
+        Paginación por clave (date, match_id): cada bloque es una consulta indexada
+        y nunca se carga el historial completo en memoria. `after` empieza tras
+        un (date, match_id) dado.
+        """
+        last_date, last_id = after or (datetime.min, 0)
+        params = {
+            'league': league,
+            'version': self.version,
+            'chunk_size': chunk_size,
+            'last_date': last_date,
+            'last_id': last_id,
+        }
+        while True:
+            chunk = self._read(_PAGE_QUERY, params)
+            if chunk.empty:
+                return
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            last = chunk.iloc[-1]
+            params['last_date'] = last['date'].to_pydatetime()
+            params['last_id'] = int(last['match_id'])
+
+    def load_after(self, league: str, last_date: datetime, last_id: int) -> pd.DataFrame:
+        """Vectores posteriores a (last_date, last_id) en orden cronológico"""
+        chunks = list(self.iter_chunks(league, after=(last_date, last_id)))
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+    def _read(self, statement, params: Dict) -> pd.DataFrame:
+        """Ejecuta una sentencia precompilada con parámetros enlazados"""
+        with self.db.bind.connect() as conn:
+            conn = conn.execution_options(compiled_cache=_COMPILED_CACHE)
+            return pd.read_sql_query(statement, conn, params=params, parse_dates=['date'])
+
+    def fixture_features(self, league: str, fixtures: pd.DataFrame) -> pd.DataFrame:
+        """
+        Características para partidos aún no jugados (no se persisten).
+        `fixtures` necesita date, home_team y away_team.
+        """
+        fixtures = fixtures.assign(date=pd.to_datetime(fixtures['date']), league=league)
+        since = fixtures['date'].min() - timedelta(days=CONTEXT_DAYS)
+        history = load_league_history(self.db.bind, league, since=since.to_pydatetime())
+        history = history[history['home_score'].notna()]
+
+        combined = pd.concat([history, fixtures], ignore_index=True)
+        features = compute_features(combined, h2h_index=get_h2h_index(self.db.bind), bind=self.db.bind)
+        return features.iloc[len(history):].set_axis(fixtures.index)
+
+    def data_version(self, league: str) -> str:
+        """Sello de versión de los datos materializados de una liga"""
+        row = self.db.execute(text("""
+        SELECT COUNT(*), MAX(match_id), MAX(computed_at)
+        FROM match_features
+        WHERE league = :league AND feature_version = :version
+        """), {'league': league, 'version': self.version}).one()
+        return f"v{self.version}:{row[0]}:{row[1] or 0}:{row[2] or ''}"
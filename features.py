@@ -0,0 +1,287 @@
+import pandas as pd
+import numpy as np
+from sqlalchemy import text
+from datetime import datetime
+from typing import Optional
+import logging
+
+from config import MODEL_CONFIG
+from h2h import H2HIndex
+from teams import canonical_name, team_ids
+
+logger = logging.getLogger(__name__)
+
+# Versión del cálculo de características (cambiarla invalida el feature store)
+FEATURE_VERSION = "2"
+
+# Ventana de forma reciente (columnas *_last_5 / *_last5)
+FORM_WINDOW = 5
+
+# Ventana temporal para enfrentamientos directos (días)
+H2H_WINDOW_DAYS = 5 * 365
+
+# Clave temporal: código de grupo * _KEY_STRIDE + día
+_KEY_STRIDE = 10 ** 6
+
+# Derbis conocidos (pares no ordenados de equipos)
+DERBIES = {
+    frozenset(pair) for pair in [
+        ("Inter de Milán", "AC Milan"),
+        ("Juventus", "Torino"),
+        ("Roma", "Lazio"),
+        ("Real Madrid", "Atlético Madrid"),
+        ("Real Madrid", "Barcelona"),
+        ("Barcelona", "Espanyol"),
+        ("Sevilla", "Real Betis"),
+        ("Manchester United", "Manchester City"),
+        ("Liverpool", "Everton"),
+        ("Arsenal", "Tottenham"),
+        ("Bayern München", "Borussia Dortmund"),
+        ("Borussia Dortmund", "Schalke 04"),
+        ("PSG", "Marseille"),
+        ("Lyon", "Saint-Étienne"),
+    ]
+}
+DERBY_KEYS = {"|".join(sorted(pair)) for pair in DERBIES}
+
+# Columnas de forma reciente que no están en MODEL_CONFIG pero usa train_model
+EXTRA_FEATURES = [
+    "goal_difference_last5_home",
+    "goal_difference_last5_away",
+    "xg_difference_last5_home",
+    "xg_difference_last5_away",
+    "h2h_draws",
+]
+
+FEATURE_COLUMNS = MODEL_CONFIG["features"] + EXTRA_FEATURES
+
+
+def load_league_history(bind, league: str, since: Optional[datetime] = None) -> pd.DataFrame:
+    """Carga partidos (terminados y programados) de una liga con su xG"""
+    query = text("""
+    SELECT
+        m.id AS match_id, m.date, m.league,
+        m.home_team, m.away_team, m.home_team_id, m.away_team_id,
+        m.home_score, m.away_score,
+        ms.home_xg, ms.away_xg
+    FROM matches m
+    LEFT JOIN match_stats ms ON m.id = ms.match_id
+    WHERE m.league = :league
+    AND (:since IS NULL OR m.date >= :since)
+    ORDER BY m.date
+    """)
+    return pd.read_sql_query(
+        query, bind, params={"league": league, "since": since}, parse_dates=["date"]
+    )
+
+
+def season_of(dates: pd.Series) -> pd.Series:
+    """Año de inicio de temporada (julio-junio), como en utils.get_season_year"""
+    return dates.dt.year - (dates.dt.month < 7).astype(int)
+
+
+def _prefix(values: np.ndarray) -> np.ndarray:
+    """Suma acumulada con un cero inicial (para sumas por rango)"""
+    out = np.zeros((len(values) + 1,) + values.shape[1:], dtype=float)
+    np.cumsum(values, axis=0, out=out[1:])
+    return out
+
+
+def _team_long_frame(matches: pd.DataFrame) -> pd.DataFrame:
+    """Convierte partidos a formato largo: una fila por equipo y partido"""
+    cols = {
+        "row": np.arange(len(matches)),
+        "date": matches["date"].values,
+    }
+    home = pd.DataFrame({
+        **cols,
+        "team": matches["home_team"].values,
+        "gf": matches["home_score"].values,
+        "ga": matches["away_score"].values,
+        "xgf": matches["home_xg"].values,
+        "xga": matches["away_xg"].values,
+        "is_home": True,
+    })
+    away = pd.DataFrame({
+        **cols,
+        "team": matches["away_team"].values,
+        "gf": matches["away_score"].values,
+        "ga": matches["home_score"].values,
+        "xgf": matches["away_xg"].values,
+        "xga": matches["home_xg"].values,
+        "is_home": False,
+    })
+    long = pd.concat([home, away], ignore_index=True)
+    long[["gf", "ga", "xgf", "xga"]] = long[["gf", "ga", "xgf", "xga"]].astype(float)
+    long["played"] = long["gf"].notna() & long["ga"].notna()
+    long["points"] = np.select(
+        [long["gf"] > long["ga"], long["gf"] == long["ga"]], [3.0, 1.0], 0.0
+    )
+    long["gd"] = long["gf"] - long["ga"]
+    long["xgd"] = (long["xgf"] - long["xga"]).fillna(0.0)
+    return long
+
+
+def _rolling_team_stats(long: pd.DataFrame) -> pd.DataFrame:
+    """Estadísticas de los últimos FORM_WINDOW partidos jugados antes de cada fila"""
+    team_codes, _ = pd.factorize(long["team"])
+    day = long["date"].values.astype("datetime64[D]").astype(np.int64)
+    keys = team_codes.astype(np.int64) * _KEY_STRIDE + day
+
+    played = long["played"].values
+    order = np.argsort(keys[played], kind="stable")
+    played_keys = keys[played][order]
+    played_days = day[played][order]
+    value_cols = ["points", "gd", "xgd", "gf", "ga"]
+    prefix = _prefix(long.loc[played, value_cols].values[order])
+
+    # Índices [lo, hi) de los partidos previos de cada equipo en el array ordenado
+    hi = np.searchsorted(played_keys, keys, side="left")
+    team_start = np.searchsorted(played_keys, team_codes.astype(np.int64) * _KEY_STRIDE, side="left")
+    lo = np.maximum(hi - FORM_WINDOW, team_start)
+    count = (hi - lo).astype(float)
+    sums = prefix[hi] - prefix[lo]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / count[:, None]
+
+    has_previous = hi > team_start
+    # Sin ningún partido jugado (p. ej. una base de datos vacía) no hay día previo
+    last_day = np.where(has_previous, played_days[np.maximum(hi - 1, 0)], 0) if len(played_days) else 0
+
+    return pd.DataFrame({
+        "form": np.where(count > 0, sums[:, 0], np.nan),
+        "gd_mean": means[:, 1],
+        "xgd_mean": means[:, 2],
+        "gf_mean": means[:, 3],
+        "ga_mean": means[:, 4],
+        "days_since": np.where(has_previous, day - last_day, np.nan),
+    }, index=long.index)
+
+
+def _h2h_stats(matches: pd.DataFrame) -> pd.DataFrame:
+    """Victorias/empates en enfrentamientos directos dentro de H2H_WINDOW_DAYS"""
+    index = H2HIndex.from_matches(matches.assign(match_id=np.arange(len(matches))))
+    return index.features(
+        matches["home_team"], matches["away_team"], matches["date"], window_days=H2H_WINDOW_DAYS
+    )
+
+
+def _league_positions(long: pd.DataFrame, matches: pd.DataFrame) -> pd.Series:
+    """Posición en la tabla de cada equipo antes de la fecha del partido"""
+    league = matches["league"].values if "league" in matches else np.full(len(matches), "")
+    long = long.assign(
+        league=league[long["row"].values],
+        season=season_of(long["date"]).values,
+    )
+    group = ["league", "season"]
+
+    played = long[long["played"]].sort_values("date", kind="stable")
+    played = played.assign(
+        cum_points=played.groupby(group + ["team"])["points"].cumsum(),
+        cum_gd=played.groupby(group + ["team"])["gd"].cumsum(),
+        cum_gf=played.groupby(group + ["team"])["gf"].cumsum(),
+    )
+    # Puntuación con desempates: puntos, diferencia de goles, goles a favor
+    played["score"] = played["cum_points"] * 1e6 + played["cum_gd"] * 1e3 + played["cum_gf"]
+
+    if played.empty:
+        return pd.Series(np.nan, index=long.index)
+
+    table = (
+        played.groupby(group + ["date", "team"])["score"].last()
+        .unstack("team")
+        .groupby(level=group).ffill()
+    )
+    # Los equipos que participan en la temporada arrancan en 0 puntos
+    members = pd.crosstab([long["league"], long["season"]], long["team"]).gt(0)
+    table = table.reindex(columns=members.columns)
+    in_season = members.reindex(table.index.droplevel("date")).values
+    table = table.where(table.notna() | ~in_season, 0.0)
+
+    standings = (
+        table.rank(axis=1, ascending=False, method="min")
+        .stack()
+        .rename("position")
+        .reset_index()
+        .sort_values("date")
+    )
+
+    lookup = long[group + ["date", "team"]].reset_index().sort_values("date")
+    merged = pd.merge_asof(
+        lookup, standings, on="date", by=group + ["team"], allow_exact_matches=False
+    )
+    return merged.set_index("index")["position"].reindex(long.index)
+
+
+def compute_features(matches: pd.DataFrame, h2h_index: Optional[H2HIndex] = None, bind=None) -> pd.DataFrame:
+    """
+    Calcula las características de MODEL_CONFIG para cada partido en un solo pase
+    vectorizado, usando únicamente partidos anteriores a cada fecha.
+
+    `matches` necesita las columnas date, home_team, away_team, home_score,
+    away_score, home_xg y away_xg (league opcional). Los partidos sin resultado
+    (programados) reciben características pero no alimentan a los demás.
+    Con `h2h_index` (por ID de equipo, h2h.get_h2h_index) los enfrentamientos
+    directos salen del índice en lugar de los partidos de `matches`, que entonces
+    solo necesita cubrir la ventana de forma y la temporada. Los equipos sin ID
+    se buscan en el registro de `bind` sin darlos de alta (teams.team_ids).
+    """
+    matches = matches.copy()
+    matches["date"] = pd.to_datetime(matches["date"])
+    for col in ["home_xg", "away_xg"]:
+        if col not in matches:
+            matches[col] = np.nan
+    # Derbis por nombre canónico: los alias de otros proveedores también cuentan
+    names = pd.unique(np.concatenate([matches["home_team"].values, matches["away_team"].values]).astype(str))
+    canonical = {name: canonical_name(name) for name in names}
+    home_names = matches["home_team"].astype(str).map(canonical)
+    away_names = matches["away_team"].astype(str).map(canonical)
+    if {"home_team_id", "away_team_id"} <= set(matches.columns):
+        # Agrupaciones y búsquedas sobre IDs enteros (los que falten se resuelven por nombre)
+        matches["home_team"], matches["away_team"] = team_ids(matches, bind, create=False)
+
+    n = len(matches)
+    long = _team_long_frame(matches)
+    rolling = _rolling_team_stats(long)
+    positions = _league_positions(long, matches)
+    if h2h_index is None:
+        h2h = _h2h_stats(matches)
+    else:
+        h2h = h2h_index.features(
+            matches["home_team"], matches["away_team"], matches["date"], window_days=H2H_WINDOW_DAYS
+        )
+
+    home, away = slice(0, n), slice(n, 2 * n)
+    features = pd.DataFrame(index=matches.index)
+    features["home_form_last_5"] = rolling["form"].values[home]
+    features["away_form_last_5"] = rolling["form"].values[away]
+    features["h2h_home_wins"] = h2h["h2h_home_wins"]
+    features["h2h_away_wins"] = h2h["h2h_away_wins"]
+    features["avg_goals_scored_home"] = rolling["gf_mean"].values[home]
+    features["avg_goals_conceded_home"] = rolling["ga_mean"].values[home]
+    features["avg_goals_scored_away"] = rolling["gf_mean"].values[away]
+    features["avg_goals_conceded_away"] = rolling["ga_mean"].values[away]
+    # Sin fuente de lesiones todavía: se mantiene la columna para el modelo
+    features["injuries_home"] = 0.0
+    features["injuries_away"] = 0.0
+    features["days_since_last_match_home"] = rolling["days_since"].values[home]
+    features["days_since_last_match_away"] = rolling["days_since"].values[away]
+    pair_names = np.where(home_names < away_names, home_names + "|" + away_names, away_names + "|" + home_names)
+    features["is_derby"] = np.isin(pair_names, list(DERBY_KEYS)).astype(float)
+    features["league_position_home"] = positions.values[home]
+    features["league_position_away"] = positions.values[away]
+    features["goal_difference_last5_home"] = rolling["gd_mean"].values[home]
+    features["goal_difference_last5_away"] = rolling["gd_mean"].values[away]
+    features["xg_difference_last5_home"] = rolling["xgd_mean"].values[home]
+    features["xg_difference_last5_away"] = rolling["xgd_mean"].values[away]
+    features["h2h_draws"] = h2h["h2h_draws"]
+
+    return features[FEATURE_COLUMNS]
+
+
+def build_feature_matrix(bind, league: str) -> pd.DataFrame:
+    """Historial completo de una liga con sus características, indexado por match_id"""
+    history = load_league_history(bind, league)
+    features = compute_features(history, bind=bind)
+    return pd.concat([history, features], axis=1).set_index("match_id")
@@ -0,0 +1,330 @@
+"""
+Modelo de goles Dixon-Coles por liga y mercados derivados
+
+Ajusta ataque/defensa de cada equipo, ventaja de local y la corrección rho de
+marcadores bajos a partir de `matches` (con ponderación temporal). Para cada partido
+genera la matriz de probabilidades de marcador (0..max_goals) y de ella salen, por
+sumas vectorizadas, 1X2, doble oportunidad, over/under, ambos marcan y resultado
+exacto. Cada reajuste parte de los parámetros anteriores (L-BFGS-B con gradiente
+analítico), así que tras una jornada converge en pocas iteraciones.
+"""
+
+import os
+import copy
+import time
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import joblib
+from scipy.optimize import minimize
+from scipy.stats import poisson
+
+from config import BetTypes, GOAL_MODEL_CONFIG
+from features import load_league_history
+from teams import team_ids
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = 'data/models'
+
+_RHO_BOUND = 0.2
+
+
+class GoalModel:
+    def __init__(self, league: str, max_goals: int = GOAL_MODEL_CONFIG['max_goals'],
+                 time_decay: float = GOAL_MODEL_CONFIG['time_decay'],
+                 l2: float = GOAL_MODEL_CONFIG['l2']):
+        self.league = league
+        self.max_goals = max_goals
+        self.time_decay = time_decay
+        self.l2 = l2
+        self.teams: List = []  # IDs de equipo (o nombres si los datos no traen IDs)
+        self.keyed_by_id = False
+        self.attack = np.zeros(0)
+        self.defence = np.zeros(0)
+        self.home_advantage = 0.25
+        self.rho = 0.0
+        self.fit_info: Dict = {}
+
+    @property
+    def is_fitted(self) -> bool:
+        return bool(self.teams)
+
+    # -- Ajuste ------------------------------------------------------------
+
+    def fit(self, matches: pd.DataFrame, reference_date: Optional[datetime] = None) -> 'GoalModel':
+        """
+        Ajusta el modelo con partidos terminados (home_team, away_team, home_score,
+        away_score, date). Si ya estaba ajustado, parte de los parámetros anteriores;
+        los equipos nuevos empiezan en 0.
+        """
+        matches = matches.dropna(subset=['home_score', 'away_score'])
+        if matches.empty:
+            return self
+
+        self.keyed_by_id = {'home_team_id', 'away_team_id'} <= set(matches.columns)
+        home_keys, away_keys = self._team_keys(matches)
+        teams = np.unique(np.concatenate([home_keys, away_keys])).tolist()
+        n = len(teams)
+        home = pd.Index(teams).get_indexer(home_keys)
+        away = pd.Index(teams).get_indexer(away_keys)
+        x = matches['home_score'].to_numpy(dtype=float)
+        y = matches['away_score'].to_numpy(dtype=float)
+
+        dates = pd.to_datetime(matches['date'])
+        reference = pd.Timestamp(reference_date) if reference_date is not None else dates.max()
+        weights = np.exp(-self.time_decay * (reference - dates).dt.days.to_numpy(dtype=float))
+
+        # Celdas con corrección de Dixon-Coles
+        c00 = (x == 0) & (y == 0)
+        c01 = (x == 0) & (y == 1)
+        c10 = (x == 1) & (y == 0)
+        c11 = (x == 1) & (y == 1)
+
+        def objective(params):
+            attack, defence = params[:n], params[n:2 * n]
+            home_adv, rho = params[2 * n], params[2 * n + 1]
+            eta_h = home_adv + attack[home] - defence[away]
+            eta_a = attack[away] - defence[home]
+            lam, mu = np.exp(eta_h), np.exp(eta_a)
+
+            tau = np.ones_like(lam)
+            tau[c00] = 1 - lam[c00] * mu[c00] * rho
+            tau[c01] = 1 + lam[c01] * rho
+            tau[c10] = 1 + mu[c10] * rho
+            tau[c11] = 1 - rho
+            tau = np.maximum(tau, 1e-10)
+
+            loglik = np.log(tau) + x * eta_h - lam + y * eta_a - mu
+            value = -(weights * loglik).sum() + self.l2 * (attack @ attack + defence @ defence)
+
+            # Derivadas de log(tau) respecto a eta_h, eta_a y rho
+            g_h = x - lam
+            g_a = y - mu
+            g_rho = np.zeros_like(lam)
+            g_h[c00] -= lam[c00] * mu[c00] * rho / tau[c00]
+            g_a[c00] -= lam[c00] * mu[c00] * rho / tau[c00]
+            g_rho[c00] = -lam[c00] * mu[c00] / tau[c00]
+            g_h[c01] += lam[c01] * rho / tau[c01]
+            g_rho[c01] = lam[c01] / tau[c01]
+            g_a[c10] += mu[c10] * rho / tau[c10]
+            g_rho[c10] = mu[c10] / tau[c10]
+            g_rho[c11] = -1 / tau[c11]
+
+            wh, wa = weights * g_h, weights * g_a
+            grad = np.empty_like(params)
+            grad[:n] = -(np.bincount(home, wh, n) + np.bincount(away, wa, n)) + 2 * self.l2 * attack
+            grad[n:2 * n] = np.bincount(away, wh, n) + np.bincount(home, wa, n) + 2 * self.l2 * defence
+            grad[2 * n] = -wh.sum()
+            grad[2 * n + 1] = -(weights * g_rho).sum()
+            return value, grad
+
+        x0 = self._initial_params(teams)
+        bounds = [(None, None)] * (2 * n + 1) + [(-_RHO_BOUND, _RHO_BOUND)]
+        start = time.perf_counter()
+        result = minimize(objective, x0, jac=True, method='L-BFGS-B', bounds=bounds)
+
+        self.teams = teams
+        self.attack = result.x[:n]
+        self.defence = result.x[n:2 * n]
+        self.home_advantage = float(result.x[2 * n])
+        self.rho = float(result.x[2 * n + 1])
+        self.fit_info = {
+            'matches': len(matches),
+            'iterations': int(result.nit),
+            'seconds': time.perf_counter() - start,
+            'converged': bool(result.success),
+            'log_likelihood': float(-result.fun),
+            'fitted_at': datetime.utcnow(),
+            'warm_start': bool(self._warm_started),
+        }
+        return self
+
+    def _team_keys(self, frame: pd.DataFrame):
+        """IDs de equipo (teams.team_ids) si el modelo se ajustó con ellos; si no, nombres"""
+        if getattr(self, 'keyed_by_id', False):
+            return team_ids(frame, create=False)
+        return frame['home_team'].to_numpy(dtype=object), frame['away_team'].to_numpy(dtype=object)
+
+    def _initial_params(self, teams: List) -> np.ndarray:
+        n = len(teams)
+        params = np.zeros(2 * n + 2)
+        params[2 * n] = self.home_advantage
+        params[2 * n + 1] = self.rho
+        self._warm_started = self.is_fitted
+        if self.is_fitted:
+            previous = {team: i for i, team in enumerate(self.teams)}
+            for i, team in enumerate(teams):
+                j = previous.get(team)
+                if j is not None:
+                    params[i] = self.attack[j]
+                    params[n + i] = self.defence[j]
+        return params
+
+    # -- Predicción --------------------------------------------------------
+
+    def expected_goals(self, home_teams, away_teams):
+        """Goles esperados (local, visitante); equipos desconocidos = media de la liga"""
+        index = pd.Index(self.teams)
+        home = index.get_indexer(np.asarray(home_teams))
+        away = index.get_indexer(np.asarray(away_teams))
+        attack = np.append(self.attack, 0.0)
+        defence = np.append(self.defence, 0.0)
+        home = np.where(home < 0, len(self.teams), home)
+        away = np.where(away < 0, len(self.teams), away)
+        lam = np.exp(self.home_advantage + attack[home] - defence[away])
+        mu = np.exp(attack[away] - defence[home])
+        return lam, mu
+
+    def score_matrix(self, home_teams, away_teams) -> np.ndarray:
+        """Probabilidad de cada marcador: array (partidos, max_goals+1, max_goals+1)"""
+        lam, mu = self.expected_goals(home_teams, away_teams)
+        goals = np.arange(self.max_goals + 1)
+        matrix = poisson.pmf(goals, lam[:, None])[:, :, None] * poisson.pmf(goals, mu[:, None])[:, None, :]
+
+        rho = self.rho
+        matrix[:, 0, 0] *= 1 - lam * mu * rho
+        matrix[:, 0, 1] *= 1 + lam * rho
+        matrix[:, 1, 0] *= 1 + mu * rho
+        matrix[:, 1, 1] *= 1 - rho
+        return matrix / matrix.sum(axis=(1, 2), keepdims=True)
+
+    def market_probabilities(self, fixtures: pd.DataFrame,
+                             lines: Optional[List[float]] = None,
+                             exact_scores: bool = True) -> pd.DataFrame:
+        """
+        Probabilidades de todos los mercados derivados en formato largo
+        (match_id, market, selection, prob), listo para value_bets.scan_value_bets
+        """
+        lines = GOAL_MODEL_CONFIG['over_under_lines'] if lines is None else lines
+        matrix = self.score_matrix(*self._team_keys(fixtures))
+        match_ids = fixtures['match_id'].to_numpy()
+        markets = score_markets(matrix, lines, exact_scores)
+
+        frames = [
+            pd.DataFrame({'match_id': match_ids, 'market': market, 'selection': selection, 'prob': values})
+            for (market, selection), values in markets.items()
+        ]
+        return pd.concat(frames, ignore_index=True)
+
+    # -- Persistencia ------------------------------------------------------
+
+    def save(self, path: Optional[str] = None) -> str:
+        """Escribe en un temporal y lo renombra: los lectores nunca ven un fichero a medias"""
+        path = path or model_path(self.league)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            joblib.dump(self, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+    @staticmethod
+    def load(path: str) -> 'GoalModel':
+        return joblib.load(path)
+
+
+def score_markets(matrix: np.ndarray, lines: List[float], exact_scores: bool = True) -> Dict:
+    """Sumas vectorizadas sobre la matriz de marcadores: {(mercado, selección): probs}"""
+    goals = np.arange(matrix.shape[1])
+    home_goals, away_goals = goals[:, None], goals[None, :]
+    total = home_goals + away_goals
+
+    home = (matrix * (home_goals > away_goals)).sum(axis=(1, 2))
+    draw = np.trace(matrix, axis1=1, axis2=2)
+    away = 1 - home - draw
+    btts = (matrix * ((home_goals > 0) & (away_goals > 0))).sum(axis=(1, 2))
+
+    # P(total = k) una sola vez y acumulado para todas las líneas
+    totals = np.stack([
+        np.trace(matrix[:, :, ::-1], offset=matrix.shape[1] - 1 - k, axis1=1, axis2=2)
+        for k in range(total.max() + 1)
+    ], axis=1)
+    cumulative = totals.cumsum(axis=1)
+
+    markets = {
+        (BetTypes.WIN_DRAW_WIN.value, '1'): home,
+        (BetTypes.WIN_DRAW_WIN.value, 'X'): draw,
+        (BetTypes.WIN_DRAW_WIN.value, '2'): away,
+        (BetTypes.DOUBLE_CHANCE.value, '1X'): home + draw,
+        (BetTypes.DOUBLE_CHANCE.value, '12'): home + away,
+        (BetTypes.DOUBLE_CHANCE.value, 'X2'): draw + away,
+        (BetTypes.BOTH_SCORE.value, 'yes'): btts,
+        (BetTypes.BOTH_SCORE.value, 'no'): 1 - btts,
+    }
+    for line in lines:
+        under = cumulative[:, int(np.floor(line))]
+        markets[(BetTypes.OVER_UNDER.value, f'over_{line:g}')] = 1 - under
+        markets[(BetTypes.OVER_UNDER.value, f'under_{line:g}')] = under
+    if exact_scores:
+        for h in goals:
+            for a in goals:
+                markets[(BetTypes.EXACT_SCORE.value, f'{h}-{a}')] = matrix[:, h, a]
+    return markets
+
+
+def model_path(league: str) -> str:
+    return os.path.join(MODEL_DIR, f"{league.replace(' ', '_').lower()}_goal_model.joblib")
+
+
+# Liga -> (mtime del fichero cuando se cargó o guardó, modelo)
+_models: Dict[str, Tuple[Optional[int], GoalModel]] = {}
+_models_lock = threading.Lock()
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def get_goal_model(league: str) -> Optional[GoalModel]:
+    """
+    Modelo de la liga en memoria, recargado del disco cuando el fichero cambia
+    (p. ej. tras un reajuste del scheduler en otro proceso)
+    """
+    path = model_path(league)
+    mtime = _mtime(path)
+    with _models_lock:
+        cached = _models.get(league)
+        if mtime is not None and (cached is None or cached[0] != mtime):
+            cached = _models[league] = (mtime, GoalModel.load(path))
+        return cached[1] if cached else None
+
+
+def _remember(league: str, model: GoalModel, path: Optional[str] = None):
+    with _models_lock:
+        _models[league] = (_mtime(path or model_path(league)), model)
+
+
+def fit_league(bind, league: str, history_days: int = GOAL_MODEL_CONFIG['history_days'],
+               save: bool = True) -> GoalModel:
+    """
+    Ajusta (o reajusta en caliente) el modelo de una liga con su historial reciente.
+    Se ajusta una copia del modelo vigente, que se sustituye en la caché al
+    terminar: quien lo esté usando (score_markets en otros hilos) nunca ve
+    parámetros a medio ajustar.
+    """
+    current = get_goal_model(league)
+    model = copy.deepcopy(current) if current is not None else GoalModel(league)
+    since = datetime.utcnow() - timedelta(days=history_days)
+    matches = load_league_history(bind, league, since=since)
+    model.fit(matches)
+    if save and model.is_fitted:
+        model.save()
+    _remember(league, model)
+    if model.fit_info:
+        logger.info(
+            f"Modelo de goles {league}: {model.fit_info['matches']} partidos, "
+            f"{model.fit_info['iterations']} iteraciones, {model.fit_info['seconds'] * 1000:.0f} ms"
+            f"{' (arranque en caliente)' if model.fit_info['warm_start'] else ''}"
+        )
+    return model
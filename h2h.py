@@ -0,0 +1,299 @@
+"""
+Índice de enfrentamientos directos (head-to-head)
+
+Los partidos jugados se guardan en arrays de NumPy ordenados por la clave
+(par no ordenado de equipos, día). Todos los enfrentamientos de un par quedan
+contiguos, así que con dos búsquedas binarias se obtiene el rango de un par
+(opcionalmente antes de una fecha o dentro de una ventana) y, con las sumas
+acumuladas de resultados, las victorias/empates en O(log n). Los últimos N
+partidos salen del final del rango. Los partidos nuevos se insertan en su
+posición sin reconstruir el índice, y los borrados o corregidos en la base de
+datos (o cuyo ID se ha reutilizado) se retiran al refrescarlo.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from database import engine as default_engine, get_data_versions
+
+logger = logging.getLogger(__name__)
+
+# Clave: (equipo menor * _TEAM_STRIDE + equipo mayor) * _DAY_STRIDE + día
+_TEAM_STRIDE = 1 << 16
+_DAY_STRIDE = 10 ** 6
+
+_EPOCH = datetime(1970, 1, 1)
+
+# El índice compartido trabaja con IDs de equipo (teams.TeamRegistry)
+_FINISHED_QUERY = text("""
+SELECT id AS match_id, date, home_team_id AS home_team, away_team_id AS away_team,
+       home_score, away_score, competition
+FROM matches
+WHERE status = 'finished' AND home_score IS NOT NULL AND away_score IS NOT NULL
+AND home_team_id IS NOT NULL AND away_team_id IS NOT NULL
+""")
+
+# Columnas que identifican la versión de un partido en el índice
+_FINGERPRINT = ["key", "home", "home_score", "away_score"]
+
+
+def _days(dates) -> np.ndarray:
+    """Días desde epoch (int64) de fechas sueltas o en array"""
+    return np.asarray(pd.to_datetime(dates), dtype="datetime64[D]").astype(np.int64)
+
+
+class H2HIndex:
+    """Enfrentamientos directos indexados por par de equipos (sin orden)"""
+
+    def __init__(self):
+        # Equipos (nombres o IDs de teams.TeamRegistry) -> código interno
+        self._codes: Dict[Hashable, int] = {}
+        self._names: List[Hashable] = []
+        self._keys = np.empty(0, dtype=np.int64)
+        self._match_ids = np.empty(0, dtype=np.int64)
+        self._home = np.empty(0, dtype=np.int64)
+        self._away = np.empty(0, dtype=np.int64)
+        self._home_score = np.empty(0, dtype=np.int64)
+        self._away_score = np.empty(0, dtype=np.int64)
+        self._competition = np.empty(0, dtype=object)
+        # Sumas acumuladas de (gana el equipo menor, gana el mayor, empate)
+        self._prefix = np.zeros((1, 3), dtype=np.int64)
+        self._known = np.empty(0, dtype=np.int64)  # match_id ordenados
+        self.version = None
+
+    @classmethod
+    def from_matches(cls, matches: pd.DataFrame) -> 'H2HIndex':
+        index = cls()
+        index.add(matches)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    # -- Construcción -------------------------------------------------------
+
+    def _intern(self, names) -> np.ndarray:
+        """Código entero de cada nombre (los nuevos se añaden al final)"""
+        positions, unique_names = pd.factorize(np.asarray(names, dtype=object))
+        for name in unique_names:
+            if name not in self._codes:
+                self._codes[name] = len(self._names)
+                self._names.append(name)
+        return np.array([self._codes[name] for name in unique_names], dtype=np.int64)[positions]
+
+    def _lookup(self, names) -> np.ndarray:
+        """Código de cada nombre; -1 si el equipo no aparece en el índice"""
+        positions, unique_names = pd.factorize(np.asarray(names, dtype=object))
+        return np.array([self._codes.get(name, -1) for name in unique_names], dtype=np.int64)[positions]
+
+    def _pair(self, team1: Hashable, team2: Hashable) -> Optional[int]:
+        code1, code2 = self._codes.get(team1), self._codes.get(team2)
+        if code1 is None or code2 is None:
+            return None
+        return min(code1, code2) * _TEAM_STRIDE + max(code1, code2)
+
+    @staticmethod
+    def _pairs(home: np.ndarray, away: np.ndarray) -> np.ndarray:
+        return np.minimum(home, away) * _TEAM_STRIDE + np.maximum(home, away)
+
+    def add(self, matches: pd.DataFrame) -> int:
+        """
+        Inserta partidos jugados (match_id, date, home_team, away_team, home_score,
+        away_score y opcionalmente competition). Ignora los que no tienen resultado
+        o ya están en el índice. Devuelve los partidos añadidos.
+        """
+        if "match_id" not in matches:
+            matches = matches.assign(match_id=-np.arange(len(self._keys) + 1, len(self._keys) + len(matches) + 1))
+        played = matches["home_score"].notna() & matches["away_score"].notna()
+        matches = matches[played & ~np.isin(matches["match_id"].to_numpy(dtype=np.int64), self._known)]
+        matches = matches.drop_duplicates("match_id")
+        if matches.empty:
+            return 0
+
+        home = self._intern(matches["home_team"])
+        away = self._intern(matches["away_team"])
+        keys = self._pairs(home, away) * _DAY_STRIDE + _days(matches["date"])
+        order = np.argsort(keys, kind="stable")
+        positions = np.searchsorted(self._keys, keys[order], side="right")
+
+        competition = matches["competition"] if "competition" in matches else matches.get("league")
+        competition = np.full(len(matches), None, dtype=object) if competition is None else competition.to_numpy(dtype=object)
+        columns = {
+            "_keys": keys,
+            "_match_ids": matches["match_id"].to_numpy(dtype=np.int64),
+            "_home": home,
+            "_away": away,
+            "_home_score": matches["home_score"].to_numpy(dtype=np.int64),
+            "_away_score": matches["away_score"].to_numpy(dtype=np.int64),
+            "_competition": competition,
+        }
+        for name, values in columns.items():
+            setattr(self, name, np.insert(getattr(self, name), positions, values[order]))
+        self._reindex()
+        return len(matches)
+
+    def remove(self, match_ids) -> int:
+        """Retira partidos del índice. Devuelve los partidos retirados."""
+        keep = ~np.isin(self._match_ids, np.asarray(match_ids, dtype=np.int64))
+        removed = int((~keep).sum())
+        if removed:
+            for name in ("_keys", "_match_ids", "_home", "_away", "_home_score", "_away_score", "_competition"):
+                setattr(self, name, getattr(self, name)[keep])
+            self._reindex()
+        return removed
+
+    def _reindex(self):
+        """Recalcula las sumas acumuladas y los match_id conocidos tras modificar los arrays"""
+        lo = np.minimum(self._home, self._away)
+        winner = np.where(
+            self._home_score > self._away_score, self._home,
+            np.where(self._away_score > self._home_score, self._away, -1)
+        )
+        outcomes = np.column_stack([winner == lo, (winner != lo) & (winner >= 0), winner < 0])
+        self._prefix = np.zeros((len(self._keys) + 1, 3), dtype=np.int64)
+        np.cumsum(outcomes, axis=0, out=self._prefix[1:])
+        self._known = np.sort(self._match_ids)
+
+    def refresh(self, bind=None) -> int:
+        """
+        Sincroniza el índice con los partidos terminados de la base de datos:
+        retira los que ya no existen o han cambiado (fecha, equipos o marcador,
+        p. ej. al recargar el historial mock con IDs reutilizados o al corregir
+        un resultado) y añade los que faltan. Devuelve los partidos añadidos.
+        """
+        bind = bind or default_engine
+        current = pd.read_sql_query(_FINISHED_QUERY, bind, parse_dates=["date"])
+
+        home = self._lookup(current["home_team"])
+        away = self._lookup(current["away_team"])
+        stored = pd.DataFrame({
+            "match_id": self._match_ids, "key": self._keys, "home": self._home,
+            "home_score": self._home_score, "away_score": self._away_score,
+        })
+        # Equipos que el índice no conoce (-1) nunca coinciden con lo guardado
+        keys = self._pairs(home, away) * _DAY_STRIDE + _days(current["date"])
+        in_db = pd.DataFrame({
+            "match_id": current["match_id"].to_numpy(dtype=np.int64),
+            "key": np.where((home >= 0) & (away >= 0), keys, -1),
+            "home": home,
+            "home_score": current["home_score"].to_numpy(),
+            "away_score": current["away_score"].to_numpy(),
+        })
+        merged = stored.merge(in_db, on="match_id", how="left", suffixes=("", "_db"))
+        changed = (
+            merged[_FINGERPRINT].to_numpy(dtype=float)
+            != merged[[f"{column}_db" for column in _FINGERPRINT]].to_numpy(dtype=float)
+        ).any(axis=1)
+        removed = self.remove(merged.loc[changed, "match_id"])
+        added = self.add(current)
+        if added or removed:
+            logger.info(f"Índice H2H: {added} partidos nuevos, {removed} retirados ({len(self)} en total)")
+        return added
+
+    # -- Consultas ----------------------------------------------------------
+
+    def _range(self, pair: int, before: Optional[datetime] = None, window_days: Optional[int] = None):
+        """[lo, hi) del par en los arrays ordenados"""
+        base = pair * _DAY_STRIDE
+        day = (pd.Timestamp(before or datetime.utcnow()).to_pydatetime() - _EPOCH).days
+        end = base + (day if before is not None else _DAY_STRIDE)
+        start = max(base, base + day - window_days) if window_days is not None else base
+        return (
+            int(np.searchsorted(self._keys, start, side="left")),
+            int(np.searchsorted(self._keys, end, side="left")),
+        )
+
+    def stats(self, team1: Hashable, team2: Hashable, before: Optional[datetime] = None,
+              window_days: Optional[int] = None) -> Dict:
+        """Victorias/empates entre dos equipos (claves de utils.calculate_h2h_stats)"""
+        pair = self._pair(team1, team2)
+        lo, hi = self._range(pair, before, window_days) if pair is not None else (0, 0)
+        total = hi - lo
+        if not total:
+            return {"total": 0, "team1_wins": 0, "team2_wins": 0, "draws": 0}
+        lo_wins, hi_wins, draws = (self._prefix[hi] - self._prefix[lo]).tolist()
+        team1_is_lo = self._codes[team1] < self._codes[team2]
+        team1_wins, team2_wins = (lo_wins, hi_wins) if team1_is_lo else (hi_wins, lo_wins)
+        return {
+            "total": total,
+            "team1_wins": team1_wins,
+            "team2_wins": team2_wins,
+            "draws": draws,
+            "team1_win_percentage": team1_wins / total * 100,
+            "team2_win_percentage": team2_wins / total * 100,
+        }
+
+    def last_meetings(self, team1: Hashable, team2: Hashable, limit: int = 10,
+                      before: Optional[datetime] = None) -> List[Dict]:
+        """Últimos enfrentamientos, del más reciente al más antiguo"""
+        pair = self._pair(team1, team2)
+        if pair is None:
+            return []
+        lo, hi = self._range(pair, before)
+        rows = slice(max(lo, hi - limit), hi)
+        columns = zip(*[
+            values[rows][::-1].tolist()
+            for values in (self._match_ids, self._keys, self._home, self._away,
+                           self._home_score, self._away_score, self._competition)
+        ])
+        return [
+            {
+                "match_id": match_id,
+                "date": (_EPOCH + timedelta(days=key % _DAY_STRIDE)).strftime("%Y-%m-%d"),
+                "home": self._names[home],
+                "away": self._names[away],
+                "score": f"{home_score}-{away_score}",
+                "competition": competition,
+            }
+            for match_id, key, home, away, home_score, away_score, competition in columns
+        ]
+
+    def features(self, home_teams, away_teams, dates, window_days: Optional[int] = None) -> pd.DataFrame:
+        """
+        h2h_home_wins, h2h_away_wins y h2h_draws de cada partido con los
+        enfrentamientos anteriores a su fecha (vectorizado, para entrenamiento)
+        """
+        home = self._lookup(home_teams)
+        away = self._lookup(away_teams)
+        known = (home >= 0) & (away >= 0)
+        base = np.where(known, self._pairs(home, away), 0) * _DAY_STRIDE
+        end = base + _days(dates)
+        start = np.maximum(base, end - window_days) if window_days is not None else base
+
+        hi = np.searchsorted(self._keys, end, side="left")
+        lo = np.searchsorted(self._keys, start, side="left")
+        sums = np.where(known[:, None], self._prefix[hi] - self._prefix[lo], 0).astype(float)
+
+        home_is_lo = home < away
+        return pd.DataFrame({
+            "h2h_home_wins": np.where(home_is_lo, sums[:, 0], sums[:, 1]),
+            "h2h_away_wins": np.where(home_is_lo, sums[:, 1], sums[:, 0]),
+            "h2h_draws": sums[:, 2],
+        }, index=home_teams.index if isinstance(home_teams, pd.Series) else None)
+
+
+_indexes: Dict[str, H2HIndex] = {}
+_index_lock = threading.Lock()
+
+
+def get_h2h_index(bind=None, refresh: bool = False) -> H2HIndex:
+    """
+    Índice compartido (uno por base de datos) con todos los partidos terminados,
+    por ID de equipo. Se sincroniza con la base de datos (H2HIndex.refresh)
+    cuando cambia la versión 'matches' o, con refresh=True, siempre (para quien
+    escribe partidos antes de subir la versión, como FeatureStore.update).
+    """
+    bind = bind or default_engine
+    version = get_data_versions(bind).get("matches", 0)
+    with _index_lock:
+        index = _indexes.setdefault(str(bind.url), H2HIndex())
+        if refresh or index.version != version:
+            index.refresh(bind)
+            index.version = version
+        return index
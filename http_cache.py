@@ -0,0 +1,313 @@
+"""
+Caché persistente de respuestas HTTP (SQLite en data/) para los fetchers
+
+- TTL por endpoint (HTTP_CACHE_CONFIG["ttls"], por subcadena de la URL)
+- Revalidación condicional con ETag / Last-Modified (304 => no se descarga el cuerpo)
+- stale-while-revalidate: una entrada caducada se sirve mientras se refresca en segundo plano
+- Límite de tamaño con expulsión LRU
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import requests
+
+from config import HTTP_CACHE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse:
+    """Respuesta mínima compatible con el uso de requests.Response en los fetchers"""
+
+    def __init__(self, status_code: int, content: bytes, headers: Dict, from_cache: bool):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.from_cache = from_cache
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class ResponseCache:
+    def __init__(self, path: str = HTTP_CACHE_CONFIG["path"],
+                 max_bytes: int = HTTP_CACHE_CONFIG["max_mb"] * 1024 * 1024,
+                 default_ttl: float = HTTP_CACHE_CONFIG["default_ttl"],
+                 stale_while_revalidate: float = HTTP_CACHE_CONFIG["stale_while_revalidate"],
+                 ttls: Optional[Dict[str, float]] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.ttls = ttls if ttls is not None else HTTP_CACHE_CONFIG["ttls"]
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._metrics = {
+            "hits": 0,
+            "stale_hits": 0,
+            "revalidated": 0,
+            "misses": 0,
+            "errors": 0,
+            "evictions": 0,
+            "bytes_saved": 0,
+            "bytes_downloaded": 0,
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                etag TEXT,
+                last_modified TEXT,
+                expires_at REAL,
+                last_access REAL,
+                size INTEGER
+            )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_last_access ON responses (last_access)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def ttl_for(self, url: str) -> float:
+        for pattern, ttl in self.ttls.items():
+            if pattern in url:
+                return ttl
+        return self.default_ttl
+
+    @staticmethod
+    def cache_key(url: str, params: Optional[Dict] = None) -> str:
+        if not params:
+            return url
+        return url + "?" + "&".join(f"{k}={params[k]}" for k in sorted(params))
+
+    def get(self, session: requests.Session, url: str, params: Optional[Dict] = None,
+            ttl: Optional[float] = None, **request_kwargs) -> CachedResponse:
+        """GET a través de la caché (mismo uso que session.get)"""
+        key = self.cache_key(url, params)
+        ttl = self.ttl_for(url) if ttl is None else ttl
+        entry = self._load(key)
+        now = time.time()
+
+        if entry is not None and now < entry["expires_at"]:
+            self._count("hits", bytes_saved=entry["size"])
+            self._touch(key, now)
+            return self._response(entry, from_cache=True)
+
+        if entry is not None and now < entry["expires_at"] + self.stale_while_revalidate:
+            self._count("stale_hits", bytes_saved=entry["size"])
+            self._touch(key, now)
+            self._revalidate_in_background(session, url, params, ttl, key, entry, request_kwargs)
+            return self._response(entry, from_cache=True)
+
+        return self._fetch(session, url, params, ttl, key, entry, request_kwargs)
+
+    def iter_content(self, session: requests.Session, url: str, params: Optional[Dict] = None,
+                     ttl: Optional[float] = None, chunk_size: int = 16384,
+                     **request_kwargs) -> Iterator[bytes]:
+        """
+        Como get(), pero entrega el cuerpo por trozos a medida que llega de la red.
+        Si el consumidor para antes de tiempo, el resto se descarga igualmente para
+        guardarlo en la caché. Un cuerpo cortado por un error de red no se guarda.
+        """
+        key = self.cache_key(url, params)
+        ttl = self.ttl_for(url) if ttl is None else ttl
+        entry = self._load(key)
+
+        if entry is not None and time.time() < entry["expires_at"] + self.stale_while_revalidate:
+            body = self.get(session, url, params=params, ttl=ttl, **request_kwargs).content
+            for start in range(0, len(body), chunk_size):
+                yield body[start:start + chunk_size]
+            return
+
+        headers = dict(request_kwargs.pop("headers", None) or {})
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        with session.get(url, params=params, headers=headers, stream=True, **request_kwargs) as response:
+            if response.status_code == 304 and entry is not None:
+                now = time.time()
+                self._count("revalidated", bytes_saved=entry["size"])
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE responses SET expires_at = ?, last_access = ? WHERE key = ?",
+                        (now + ttl, now, key)
+                    )
+                yield entry["body"]
+                return
+
+            response.raise_for_status()
+            received = []
+            chunks = response.iter_content(chunk_size)
+            try:
+                for chunk in chunks:
+                    received.append(chunk)
+                    yield chunk
+            except GeneratorExit:
+                # El consumidor paró antes de tiempo: se descarga el resto para la caché
+                try:
+                    received.extend(chunks)
+                except Exception as e:
+                    logger.warning(f"Descarga incompleta de {url}, no se guarda en caché: {e}")
+                    return
+                self._store_streamed(key, response, received, ttl)
+                return
+            # Solo llega aquí si el cuerpo se recibió entero (un error de red se propaga sin guardar)
+            self._store_streamed(key, response, received, ttl)
+
+    def _store_streamed(self, key: str, response: requests.Response, received, ttl: float):
+        response._content = b"".join(received)
+        self._count("misses", bytes_downloaded=len(response._content))
+        now = time.time()
+        self._store(key, response, now + ttl, now)
+
+    def metrics(self) -> Dict:
+        """Tasa de aciertos, bytes ahorrados y tamaño actual de la caché"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        served = metrics["hits"] + metrics["stale_hits"] + metrics["revalidated"]
+        lookups = served + metrics["misses"]
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {**metrics, "hit_rate": served / lookups if lookups else 0.0, "entries": entries, "size_bytes": size}
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def _fetch(self, session, url, params, ttl, key, entry, request_kwargs) -> CachedResponse:
+        headers = dict(request_kwargs.pop("headers", None) or {})
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            response = session.get(url, params=params, headers=headers, **request_kwargs)
+        except requests.RequestException:
+            self._count("errors")
+            if entry is not None:
+                # Mejor una respuesta antigua que ninguna
+                return self._response(entry, from_cache=True)
+            raise
+
+        now = time.time()
+        if response.status_code == 304 and entry is not None:
+            self._count("revalidated", bytes_saved=entry["size"])
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE responses SET expires_at = ?, last_access = ? WHERE key = ?",
+                    (now + ttl, now, key)
+                )
+            return self._response(entry, from_cache=True)
+
+        self._count("misses", bytes_downloaded=len(response.content))
+        if response.status_code == 200:
+            self._store(key, response, now + ttl, now)
+        return CachedResponse(response.status_code, response.content, dict(response.headers), from_cache=False)
+
+    def _revalidate_in_background(self, session, url, params, ttl, key, entry, request_kwargs):
+        with self._lock:
+            if key in self._in_flight:
+                return
+            self._in_flight.add(key)
+
+        def _run():
+            try:
+                self._fetch(session, url, params, ttl, key, entry, dict(request_kwargs))
+            except Exception as e:
+                logger.warning(f"Error revalidando {url}: {e}")
+            finally:
+                with self._lock:
+                    self._in_flight.discard(key)
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    def _load(self, key: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT status, headers, body, etag, last_modified, expires_at, size FROM responses WHERE key = ?",
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "status": row[0], "headers": json.loads(row[1]), "body": row[2],
+            "etag": row[3], "last_modified": row[4], "expires_at": row[5], "size": row[6],
+        }
+
+    def _store(self, key: str, response: requests.Response, expires_at: float, now: float):
+        body = response.content
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, response.status_code, json.dumps(dict(response.headers)), body,
+                 response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                 expires_at, now, len(body))
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Borra las entradas usadas menos recientemente hasta respetar max_bytes"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._count("evictions", evicted)
+
+    def _touch(self, key: str, now: float):
+        with self._connect() as conn:
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+
+    def _count(self, name: str, amount: int = 1, bytes_saved: int = 0, bytes_downloaded: int = 0):
+        with self._lock:
+            self._metrics[name] += amount
+            self._metrics["bytes_saved"] += bytes_saved
+            self._metrics["bytes_downloaded"] += bytes_downloaded
+
+    @staticmethod
+    def _response(entry: Dict, from_cache: bool) -> CachedResponse:
+        return CachedResponse(entry["status"], entry["body"], entry["headers"], from_cache)
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Caché compartida por todo el proceso"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
@@ -1,81 +1,88 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
 import xgboost as xgb
 import joblib
+import os
 from datetime import datetime, timedelta
-from typing import Tuple, Dict, List
+from typing import Tuple, Dict, Iterator, List, Optional, Union
 import logging
 from sqlalchemy.orm import Session
 
+from database import MLModel, bump_data_version
+from features import FEATURE_COLUMNS
+from feature_store import FeatureStore
+from odds_store import OddsStore
+from config import BetTypes, MODEL_CONFIG, VALUE_BET_CONFIG
+from value_bets import outcome_probabilities, scan_value_bets
+from goal_model import get_goal_model
+from model_registry import ModelRegistry, get_registry, best_params
+
 logger = logging.getLogger(__name__)
 
+# Umbral de EV para considerar una apuesta de valor
+VALUE_BET_THRESHOLD = VALUE_BET_CONFIG['min_ev']
+
+# Modelos que admiten actualización incremental (boosting: cada ronda corrige a las
+# anteriores). Un random forest con warm_start añadiría árboles entrenados solo con
+# el lote nuevo que votan igual que los del bosque base, así que se reentrena entero.
+INCREMENTAL_MODEL_TYPES = ('xgboost', 'gradient_boosting')
+
+# Fracción final (la más reciente) de la ventana que se reserva para evaluar
+HOLDOUT_FRACTION = 0.2
+
+# Mercados que se toman del modelo de goles en lugar del clasificador 1X2
+GOAL_MARKETS = [BetTypes.OVER_UNDER.value, BetTypes.BOTH_SCORE.value, BetTypes.EXACT_SCORE.value]
+
+def confidence_bucket(probabilities):
+    """Nivel de confianza (high/medium/low) para una probabilidad o un array"""
+    return np.select(
+        [np.asarray(probabilities) > 0.7, np.asarray(probabilities) > 0.55],
+        ['high', 'medium'], 'low'
+    )
+
 class BettingPredictor:
-    def __init__(self, db_session: Session):
+    def __init__(self, db_session: Session, registry: Optional[ModelRegistry] = None):
         self.db = db_session
+        self.registry = registry
+        # Por (liga, tipo de modelo); los entrenados en este proceso tienen prioridad
         self.models = {}
         self.scalers = {}
         self.label_encoders = {}
+        self.feature_store = FeatureStore(db_session)
+        self.odds_store = OddsStore(db_session.get_bind() if db_session is not None else None)
         
     def prepare_training_data(self, league: str, min_matches: int = 100) -> pd.DataFrame:
-        """Prepara datos históricos para entrenamiento"""
-        query = f"""
-        SELECT 
-            m.home_team, m.away_team, m.home_score, m.away_score,
-            ms.home_possession, ms.away_possession,
-            ms.home_shots, ms.away_shots,
-            ms.home_xg, ms.away_xg,
-            ms.home_corners, ms.away_corners,
-            CASE 
-                WHEN m.home_score > m.away_score THEN '1'
-                WHEN m.home_score = m.away_score THEN 'X'
-                ELSE '2'
-            END as result
-        FROM matches m
-        JOIN match_stats ms ON m.id = ms.match_id
-        WHERE m.league = '{league}' 
-        AND m.status = 'finished'
-        AND m.home_score IS NOT NULL
-        ORDER BY m.date DESC
-        LIMIT {min_matches * 2}
-        """
-        
-        df = pd.read_sql_query(query, self.db.bind)
-        
-        # Ingeniería de características
-        df['goal_difference'] = df['home_score'] - df['away_score']
-        df['total_goals'] = df['home_score'] + df['away_score']
-        df['possession_difference'] = df['home_possession'] - df['away_possession']
-        df['shot_difference'] = df['home_shots'] - df['away_shots']
-        df['xg_difference'] = df['home_xg'] - df['away_xg']
-        
-        # Agregar forma reciente (últimos 5 partidos)
-        df = self._add_recent_form(df, league)
-        
-        return df
+        """Prepara datos históricos para entrenamiento desde el feature store"""
+        # Solo se calculan los partidos terminados desde la última actualización
+        self.feature_store.update(league)
+        return self.feature_store.load(league, limit=min_matches * 2)
+    
+    def iter_training_data(self, league: str, chunk_size: int = 5000) -> Iterator[pd.DataFrame]:
+        """Historial completo de entrenamiento en bloques cronológicos (modo streaming)"""
+        self.feature_store.update(league)
+        yield from self.feature_store.iter_chunks(league, chunk_size)
     
-    def train_model(self, league: str, model_type: str = 'xgboost'):
-        """Entrena un modelo para una liga específica"""
+    def train_model(self, league: str, model_type: str = 'xgboost', n_jobs: Optional[int] = None):
+        """
+        Entrena un modelo para una liga específica (n_jobs: hilos del estimador).
+        Se entrena con los partidos más antiguos de la ventana y las métricas se
+        miden sobre los HOLDOUT_FRACTION más recientes, que el modelo no ha visto
+        (el escalador también se ajusta solo con la parte de entrenamiento). Esos
+        partidos quedan después de trained_through, así que la siguiente
+        actualización incremental los incorpora.
+        """
         df = self.prepare_training_data(league)
         
         if len(df) < 50:
             logger.warning(f"Insuficientes datos para {league}. Usando modelo dummy.")
             return self._create_dummy_model()
         
-        # Preparar características y target
-        features = [
-            'home_possession', 'away_possession',
-            'home_shots', 'away_shots',
-            'home_xg', 'away_xg',
-            'goal_difference_last5_home',
-            'goal_difference_last5_away',
-            'possession_difference',
-            'shot_difference',
-            'xg_difference'
-        ]
+        # Preparar características (solo las conocidas antes del partido) y target
+        features = list(FEATURE_COLUMNS)
+        df = df.sort_values(['date', 'match_id'], kind='stable', ignore_index=True)
         
         X = df[features].fillna(0)
         y = df['result']
@@ -83,82 +90,239 @@ class BettingPredictor:
         # Codificar target
         le = LabelEncoder()
         y_encoded = le.fit_transform(y)
-        self.label_encoders[league] = le
+        self.label_encoders[(league, model_type)] = le
         
-        # Escalar características
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
-        self.scalers[league] = scaler
+        # División cronológica: el pasado entrena, los partidos más recientes evalúan
+        n_train = len(df) - max(1, int(len(df) * HOLDOUT_FRACTION))
+        train = df.iloc[:n_train]
         
-        # Dividir datos
-        X_train, X_test, y_train, y_test = train_test_split(
-            X_scaled, y_encoded, test_size=0.2, random_state=42
-        )
-        
-        # Entrenar modelo
-        if model_type == 'xgboost':
-            model = xgb.XGBClassifier(
-                n_estimators=100,
-                max_depth=5,
-                learning_rate=0.1,
-                random_state=42,
-                objective='multi:softprob',
-                num_class=3
-            )
-        elif model_type == 'random_forest':
-            model = RandomForestClassifier(
-                n_estimators=100,
-                max_depth=10,
-                random_state=42
-            )
-        else:
-            model = GradientBoostingClassifier(random_state=42)
+        # Escalar características (ajustado solo con el entrenamiento)
+        scaler = StandardScaler()
+        X_train = scaler.fit_transform(X.iloc[:n_train])
+        X_test = scaler.transform(X.iloc[n_train:])
+        y_train, y_test = y_encoded[:n_train], y_encoded[n_train:]
+        self.scalers[(league, model_type)] = scaler
         
+        # Entrenar modelo (con los hiperparámetros de tuning si los hay)
+        params = best_params(self.db, league, model_type) or {}
+        model = self._new_estimator(model_type, n_jobs, params)
         model.fit(X_train, y_train)
         
-        # Evaluar modelo
-        y_pred = model.predict(X_test)
-        accuracy = accuracy_score(y_test, y_pred)
-        precision = precision_score(y_test, y_pred, average='weighted')
-        recall = recall_score(y_test, y_pred, average='weighted')
-        f1 = f1_score(y_test, y_pred, average='weighted')
+        # Evaluar modelo sobre los partidos posteriores al entrenamiento
+        metrics = self._evaluate(model, X_test, y_test)
         
-        logger.info(f"Modelo {model_type} para {league} entrenado:")
-        logger.info(f"  Accuracy: {accuracy:.3f}")
-        logger.info(f"  Precision: {precision:.3f}")
-        logger.info(f"  Recall: {recall:.3f}")
-        logger.info(f"  F1-Score: {f1:.3f}")
+        logger.info(f"Modelo {model_type} para {league} entrenado ({len(train)} partidos, "
+                    f"evaluado con los {len(df) - n_train} más recientes):")
+        self._log_metrics(metrics)
         
-        self.models[league] = model
-        
-        # Guardar modelo
+        newest = train.iloc[-1]
         model_data = {
             'model': model,
             'scaler': scaler,
             'label_encoder': le,
             'features': features,
-            'metrics': {
-                'accuracy': accuracy,
-                'precision': precision,
-                'recall': recall,
-                'f1_score': f1,
-                'trained_at': datetime.now()
+            'metrics': {**metrics, 'trained_at': datetime.now()},
+            'lineage': {
+                'parent_id': None,
+                'training_mode': 'full',
+                'trained_through': newest['date'].to_pydatetime(),
+                'last_match_id': int(newest['match_id']),
+                'training_samples': len(train),
+                'total_samples': len(train),
+                'increments_since_full': 0,
+                'hyperparameters': params,
             }
         }
+        self._save_model(league, model_type, model_data)
+        return metrics['accuracy']
+    
+    def update_model(self, league: str, model_type: str = 'xgboost', n_jobs: Optional[int] = None):
+        """
+        Actualiza el último modelo de la liga solo con los partidos terminados
+        después de su entrenamiento: XGBoost sigue el boosting desde el booster
+        guardado (xgb_model=) y gradient boosting añade etapas con warm_start. El
+        escalador y las clases se mantienen. Hace un entrenamiento completo para
+        random forest, si no hay modelo previo con linaje, si usa otras características o si ya acumula
+        MODEL_CONFIG['full_rebuild_every'] actualizaciones (limita la deriva).
+        Las métricas se miden sobre los partidos nuevos antes de actualizar.
+        """
+        parent = self._latest_record(league, model_type)
+        if (model_type not in INCREMENTAL_MODEL_TYPES or parent is None or parent.trained_through is None or not os.path.exists(parent.model_path or '')
+                or parent.features_used != list(FEATURE_COLUMNS)
+                or (parent.increments_since_full or 0) >= MODEL_CONFIG['full_rebuild_every']):
+            return self.train_model(league, model_type, n_jobs)
+        
+        self.feature_store.update(league)
+        df = self.feature_store.load_after(league, parent.trained_through, parent.last_match_id or 0)
+        previous = joblib.load(parent.model_path)
+        le, scaler, features = previous['label_encoder'], previous['scaler'], previous['features']
+        
+        # Lotes pequeños o sin las tres clases se dejan para la siguiente ejecución
+        if len(df) < MODEL_CONFIG['min_incremental_samples'] or set(df['result']) != set(le.classes_):
+            logger.info(f"{model_type} para {league}: {len(df)} partidos nuevos, sin actualizar")
+            return parent.accuracy
+        
+        X_new = scaler.transform(df[features].fillna(0))
+        y_new = le.transform(df['result'])
+        metrics = self._evaluate(previous['model'], X_new, y_new)
         
-        joblib.dump(model_data, f"data/models/{league}_{model_type}.joblib")
+        model = self._continue_training(previous['model'], model_type, X_new, y_new, n_jobs)
         
-        return accuracy
+        logger.info(f"Modelo {model_type} para {league} actualizado con {len(df)} partidos nuevos:")
+        self._log_metrics(metrics)
+        
+        self.label_encoders[(league, model_type)] = le
+        self.scalers[(league, model_type)] = scaler
+        newest = df.iloc[-1]
+        model_data = {
+            'model': model,
+            'scaler': scaler,
+            'label_encoder': le,
+            'features': features,
+            'metrics': {**metrics, 'trained_at': datetime.now()},
+            'lineage': {
+                'parent_id': parent.id,
+                'training_mode': 'incremental',
+                'trained_through': newest['date'].to_pydatetime(),
+                'last_match_id': int(newest['match_id']),
+                'training_samples': len(df),
+                'total_samples': (parent.total_samples or 0) + len(df),
+                'increments_since_full': (parent.increments_since_full or 0) + 1,
+                'hyperparameters': parent.hyperparameters,
+            }
+        }
+        self._save_model(league, model_type, model_data)
+        return metrics['accuracy']
+    
+    @staticmethod
+    def _new_estimator(model_type: str, n_jobs: Optional[int] = None, params: Optional[Dict] = None):
+        """Estimador sin entrenar; `params` sustituye a los hiperparámetros por defecto"""
+        params = params or {}
+        if model_type == 'xgboost':
+            return xgb.XGBClassifier(**{
+                'n_estimators': 100,
+                'max_depth': 5,
+                'learning_rate': 0.1,
+                'random_state': 42,
+                'objective': 'multi:softprob',
+                'num_class': 3,
+                'n_jobs': n_jobs,
+                **params
+            })
+        if model_type == 'random_forest':
+            return RandomForestClassifier(**{
+                'n_estimators': 100,
+                'max_depth': 10,
+                'random_state': 42,
+                'n_jobs': n_jobs,
+                **params
+            })
+        return GradientBoostingClassifier(**{'random_state': 42, **params})
+    
+    @staticmethod
+    def _continue_training(model, model_type: str, X, y, n_jobs: Optional[int] = None):
+        """Sigue entrenando un modelo de boosting ya ajustado con datos nuevos"""
+        if model_type == 'xgboost':
+            updated = xgb.XGBClassifier(**{
+                **model.get_params(), 'n_estimators': MODEL_CONFIG['incremental_rounds'], 'n_jobs': n_jobs
+            })
+            updated.fit(X, y, xgb_model=model.get_booster())
+            return updated
+        if model_type not in INCREMENTAL_MODEL_TYPES:
+            raise ValueError(f"{model_type} no admite entrenamiento incremental")
+        model.set_params(warm_start=True, n_estimators=model.n_estimators + MODEL_CONFIG['incremental_trees'])
+        model.fit(X, y)
+        return model
+    
+    @staticmethod
+    def _evaluate(model, X, y) -> Dict:
+        y_pred = model.predict(X)
+        return {
+            'accuracy': accuracy_score(y, y_pred),
+            'precision': precision_score(y, y_pred, average='weighted', zero_division=0),
+            'recall': recall_score(y, y_pred, average='weighted', zero_division=0),
+            'f1_score': f1_score(y, y_pred, average='weighted', zero_division=0),
+        }
+    
+    @staticmethod
+    def _log_metrics(metrics: Dict):
+        logger.info(f"  Accuracy: {metrics['accuracy']:.3f}")
+        logger.info(f"  Precision: {metrics['precision']:.3f}")
+        logger.info(f"  Recall: {metrics['recall']:.3f}")
+        logger.info(f"  F1-Score: {metrics['f1_score']:.3f}")
+    
+    def _save_model(self, league: str, model_type: str, model_data: Dict) -> MLModel:
+        """
+        Guarda el artefacto y su fila en ml_models. Cada versión tiene su propio
+        fichero (el linaje parent_id/model_path sigue apuntando a artefactos que
+        existen) y se escribe en un temporal que se renombra al terminar, así que
+        un lector nunca ve un fichero a medias.
+        """
+        self.models[(league, model_type)] = model_data
+        version = self._version(model_data)
+        model_path = f"data/models/{league}_{model_type}_{version}.joblib"
+        tmp_path = f"{model_path}.{os.getpid()}.tmp"
+        try:
+            joblib.dump(model_data, tmp_path)
+            os.replace(tmp_path, model_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return self._register_model(league, model_type, model_data, model_path)
+    
+    @staticmethod
+    def _version(model_data: Dict) -> str:
+        return model_data['metrics']['trained_at'].strftime('%Y%m%d%H%M%S%f')
     
-    def predict_match(self, league: str, match_features: Dict) -> Dict:
+    def _latest_record(self, league: str, model_type: str) -> Optional[MLModel]:
+        return (
+            self.db.query(MLModel)
+            .filter(MLModel.model_name == league, MLModel.model_type == model_type)
+            .order_by(MLModel.trained_at.desc(), MLModel.id.desc())
+            .first()
+        )
+    
+    def _register_model(self, league: str, model_type: str, model_data: Dict, model_path: str) -> MLModel:
+        """Guarda una fila en ml_models para el modelo entrenado"""
+        metrics = model_data['metrics']
+        record = MLModel(
+            model_name=league,
+            model_type=model_type,
+            version=self._version(model_data),
+            accuracy=metrics['accuracy'],
+            precision=metrics['precision'],
+            recall=metrics['recall'],
+            f1_score=metrics['f1_score'],
+            features_used=model_data['features'],
+            trained_at=metrics['trained_at'],
+            model_path=model_path,
+            **model_data.get('lineage', {})
+        )
+        self.db.add(record)
+        self.db.commit()
+        bump_data_version('models', self.db.get_bind())
+        return record
+    
+    def load_model(self, league: str, model_type: str = 'xgboost') -> Dict:
+        """Obtiene el modelo más reciente de una liga desde el registro"""
+        if self.registry is None:
+            self.registry = get_registry()
+        model_data = self.registry.get(league, model_type)
+        if model_data is None:
+            raise ValueError(f"No hay modelo {model_type} entrenado para {league}")
+        return model_data
+    
+    def _get_model(self, league: str, model_type: str = 'xgboost') -> Dict:
+        if (league, model_type) in self.models:
+            return self.models[(league, model_type)]
+        return self.load_model(league, model_type)
+    
+    def predict_match(self, league: str, match_features: Dict, model_type: str = 'xgboost') -> Dict:
         """Predice resultado de un partido"""
-        if league not in self.models:
-            self.load_model(league)
-        
-        model_data = self.models[league]
+        model_data = self._get_model(league, model_type)
         
         # Preparar características
-        features_df = pd.DataFrame([match_features])
+        features_df = pd.DataFrame([match_features]).reindex(columns=model_data['features']).fillna(0)
         
         # Escalar
         X_scaled = model_data['scaler'].transform(features_df)
@@ -171,7 +335,7 @@ class BettingPredictor:
         for i, class_name in enumerate(model_data['label_encoder'].classes_):
             predictions[class_name] = {
                 'probability': float(probabilities[i]),
-                'confidence': 'high' if probabilities[i] > 0.7 else 'medium' if probabilities[i] > 0.55 else 'low'
+                'confidence': str(confidence_bucket(probabilities[i]))
             }
         
         # Calcular valor esperado para apuestas
@@ -180,6 +344,99 @@ class BettingPredictor:
         
         return predictions
     
+    def predict_matches(self, fixtures: Union[pd.DataFrame, List[Dict]],
+                        value_threshold: float = VALUE_BET_THRESHOLD, model_type: str = 'xgboost') -> pd.DataFrame:
+        """
+        Predice una lista de partidos de varias ligas de una sola vez.
+        
+        Cada fila necesita 'league' y las características del modelo de su liga; las
+        cuotas son opcionales, como dict en 'odds' o en columnas odds_1/odds_X/odds_2;
+        si no vienen y hay 'match_id', se usa la mejor cuota actual del historial.
+        Se hace un único transform y un único predict_proba por liga con el modelo
+        `model_type` de cada una. Devuelve un
+        DataFrame con el mismo índice: prob_*, confidence_*, expected_value_*,
+        value_bet_* y la predicción más probable.
+        """
+        if not isinstance(fixtures, pd.DataFrame):
+            fixtures = pd.DataFrame(list(fixtures))
+        
+        odds = self._odds_matrix(fixtures)
+        results = []
+        
+        for league, group in fixtures.groupby('league', sort=False):
+            model_data = self._get_model(league, model_type)
+            
+            X = group.reindex(columns=model_data['features']).fillna(0)
+            probabilities = model_data['model'].predict_proba(model_data['scaler'].transform(X))
+            classes = list(model_data['label_encoder'].classes_)
+            
+            result = pd.DataFrame(index=group.index)
+            for i, outcome in enumerate(classes):
+                result[f'prob_{outcome}'] = probabilities[:, i]
+                result[f'confidence_{outcome}'] = confidence_bucket(probabilities[:, i])
+            result['prediction'] = np.asarray(classes)[probabilities.argmax(axis=1)]
+            results.append(result)
+        
+        if not results:
+            return pd.DataFrame(index=fixtures.index)
+        
+        predictions = pd.concat(results).reindex(fixtures.index)
+        
+        # Valor esperado vectorizado: EV = p * cuota - 1
+        for outcome in odds.columns:
+            prob_col = f'prob_{outcome}'
+            if prob_col in predictions:
+                ev = predictions[prob_col].values * odds[outcome].values - 1
+                predictions[f'expected_value_{outcome}'] = ev
+                predictions[f'value_bet_{outcome}'] = ev > value_threshold
+        
+        return predictions
+    
+    def scan_value_bets(self, fixtures: Union[pd.DataFrame, List[Dict]], odds: Optional[pd.DataFrame] = None,
+                        bankroll: Optional[float] = None, predictions: Optional[pd.DataFrame] = None,
+                        model_type: str = 'xgboost', **scan_options) -> pd.DataFrame:
+        """
+        Apuestas de valor de todos los mercados con cuotas para los partidos dados
+        (necesitan 'match_id'), ordenadas por EV. 1X2 y doble oportunidad vienen del
+        clasificador; con 'home_team'/'away_team' se añaden los mercados de goles del
+        modelo Dixon-Coles. Sin `odds` se usan las últimas cuotas de todas las casas
+        guardadas en el historial. `predictions` evita repetir predict_matches
+        (si no, se predice con el modelo `model_type`).
+        """
+        if not isinstance(fixtures, pd.DataFrame):
+            fixtures = pd.DataFrame(list(fixtures))
+        
+        if predictions is None:
+            predictions = self.predict_matches(fixtures, model_type=model_type)
+        probabilities = [outcome_probabilities(predictions, fixtures['match_id'])]
+        
+        # Over/under, ambos marcan y resultado exacto salen del modelo de goles
+        if {'home_team', 'away_team'} <= set(fixtures.columns):
+            for league, group in fixtures.groupby('league', sort=False):
+                goal_model = get_goal_model(league)
+                if goal_model is not None:
+                    derived = goal_model.market_probabilities(group)
+                    probabilities.append(derived[derived['market'].isin(GOAL_MARKETS)])
+        probabilities = pd.concat(probabilities, ignore_index=True)
+        
+        if odds is None:
+            odds = self.odds_store.latest(fixtures['match_id'].unique())
+        return scan_value_bets(probabilities, odds, bankroll=bankroll, **scan_options)
+    
+    def _odds_matrix(self, fixtures: pd.DataFrame) -> pd.DataFrame:
+        """Cuotas 1X2 de los partidos como columnas (NaN si faltan)"""
+        if 'odds' in fixtures:
+            odds = pd.DataFrame(
+                [o if isinstance(o, dict) else {} for o in fixtures['odds']],
+                index=fixtures.index
+            )
+        elif fixtures.columns.str.startswith('odds_').any() or 'match_id' not in fixtures:
+            odds = fixtures.filter(like='odds_').rename(columns=lambda c: c[len('odds_'):])
+        else:
+            best = self.odds_store.best_prices(fixtures['match_id'].dropna().astype(int).unique())
+            odds = best.reindex(fixtures['match_id'].values).set_axis(fixtures.index)
+        return odds.reindex(columns=['1', 'X', '2']).astype(float)
+    
     def _calculate_expected_value(self, predictions: Dict, odds: Dict) -> Dict:
         """Calcula el valor esperado para cada apuesta"""
         for outcome, prediction in predictions.items():
@@ -191,13 +448,6 @@ class BettingPredictor:
                 ev = (probability * (decimal_odds - 1)) - (1 - probability)
                 
                 prediction['expected_value'] = ev
-                prediction['value_bet'] = ev > 0.05  # Umbral para apuesta de valor
+                prediction['value_bet'] = ev > VALUE_BET_THRESHOLD
                 
         return predictions
-    
-    def _add_recent_form(self, df: pd.DataFrame, league: str) -> pd.DataFrame:
-        """Añade forma reciente de los equipos"""
-        # Implementación simplificada
-        df['goal_difference_last5_home'] = np.random.uniform(-1, 2, len(df))
-        df['goal_difference_last5_away'] = np.random.uniform(-2, 1, len(df))
-        return df
@@ -0,0 +1,332 @@
+"""
+Generador vectorizado de historial sintético (partidos, estadísticas y cuotas)
+"""
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from sqlalchemy import insert, update, delete, select, func
+
+from config import BetTypes, Leagues
+import aggregates
+from database import (
+    engine as default_engine, Match, MatchStats, MatchFeatures, OddsSnapshot, AggregatedMatch, bump_data_version
+)
+from odds_store import OddsStore
+from teams import get_team_registry
+from utils import generate_match_id
+
+logger = logging.getLogger(__name__)
+
+LEAGUE_TEAMS = {
+    Leagues.LA_LIGA.value: [
+        "Real Madrid", "Barcelona", "Atlético Madrid", "Sevilla", "Real Sociedad",
+        "Real Betis", "Villarreal", "Athletic Club", "Valencia", "Girona",
+        "Osasuna", "Celta de Vigo", "Rayo Vallecano", "Getafe", "Mallorca",
+        "Las Palmas", "Alavés", "Cádiz", "Granada", "Almería",
+    ],
+    Leagues.PREMIER_LEAGUE.value: [
+        "Manchester City", "Arsenal", "Liverpool", "Manchester United", "Tottenham",
+        "Chelsea", "Newcastle", "Aston Villa", "Brighton", "West Ham",
+        "Crystal Palace", "Fulham", "Brentford", "Wolves", "Everton",
+        "Nottingham Forest", "Bournemouth", "Luton Town", "Burnley", "Sheffield United",
+    ],
+    Leagues.BUNDESLIGA.value: [
+        "Bayern München", "Borussia Dortmund", "RB Leipzig", "Bayer Leverkusen", "Union Berlin",
+        "Eintracht Frankfurt", "VfB Stuttgart", "Freiburg", "Wolfsburg", "Mönchengladbach",
+        "Hoffenheim", "Werder Bremen", "Augsburg", "Mainz 05", "Heidenheim",
+        "Bochum", "Köln", "Darmstadt",
+    ],
+    Leagues.SERIE_A.value: [
+        "Inter de Milán", "Juventus", "AC Milan", "Napoli", "Roma",
+        "Lazio", "Atalanta", "Fiorentina", "Bologna", "Torino",
+        "Monza", "Genoa", "Lecce", "Udinese", "Sassuolo",
+        "Frosinone", "Empoli", "Cagliari", "Verona", "Salernitana",
+    ],
+    Leagues.LIGUE_1.value: [
+        "PSG", "Marseille", "Lyon", "Monaco", "Lille",
+        "Lens", "Rennes", "Nice", "Reims", "Montpellier",
+        "Toulouse", "Strasbourg", "Nantes", "Brest", "Le Havre",
+        "Metz", "Lorient", "Clermont",
+    ],
+}
+
+# Competiciones europeas: se nutren de los mejores equipos de cada liga
+CUP_SOURCES = {
+    Leagues.CHAMPIONS_LEAGUE.value: slice(0, 6),
+    Leagues.EUROPA_LEAGUE.value: slice(6, 11),
+}
+CUP_ROUNDS = 8
+
+# Antelación con la que se publican las cuotas de apertura
+OPENING_ODDS_LEAD = pd.Timedelta(days=2)
+
+# Parámetros del modelo de goles (log-escala)
+BASE_RATE = np.log(1.25)
+HOME_ADVANTAGE = 0.20
+BOOKMAKER_MARGIN = 0.05
+MAX_GOALS = 10
+# Minuto de los goles ~ 90 * Beta(a, 1): con a > 1 se marcan más goles al final
+GOAL_MINUTE_SKEW = 1.25
+
+MOCK_PREFIX = "mock:"
+
+# Versión del feature store que ningún cálculo usa: fuerza a recalcular las filas
+STALE_FEATURE_VERSION = "stale"
+
+
+def league_teams(league: str) -> List[str]:
+    """Equipos de una liga (las copas toman los mejores de cada liga)"""
+    if league in LEAGUE_TEAMS:
+        return LEAGUE_TEAMS[league]
+    source = CUP_SOURCES[league]
+    return [team for teams in LEAGUE_TEAMS.values() for team in teams[source]]
+
+
+def _round_robin(n_teams: int) -> np.ndarray:
+    """Calendario a doble vuelta (método del círculo): array (jornadas, partidos, 2)"""
+    teams = np.arange(n_teams + (n_teams % 2))
+    n = len(teams)
+    rounds = []
+    for r in range(n - 1):
+        rotated = np.concatenate([[teams[0]], np.roll(teams[1:], r)])
+        pairs = np.column_stack([rotated[:n // 2], rotated[::-1][:n // 2]])
+        if r % 2:
+            pairs = pairs[:, ::-1]
+        rounds.append(pairs)
+    first_leg = np.stack(rounds)
+    # Con número impar de equipos, los partidos contra el "equipo fantasma" se descartan luego
+    return np.concatenate([first_leg, first_leg[:, :, ::-1]])
+
+
+def _cup_schedule(n_teams: int, rng: np.random.Generator) -> np.ndarray:
+    """Emparejamientos aleatorios por jornada: array (jornadas, partidos, 2)"""
+    return np.stack([
+        rng.permutation(n_teams)[: n_teams - n_teams % 2].reshape(-1, 2)
+        for _ in range(CUP_ROUNDS)
+    ])
+
+
+def _outcome_probabilities(lam_home: np.ndarray, lam_away: np.ndarray) -> np.ndarray:
+    """Probabilidades 1/X/2 a partir de dos Poisson independientes (vectorizado)"""
+    goals = np.arange(MAX_GOALS + 1)
+    log_fact = np.cumsum(np.log(np.maximum(goals, 1)))
+    home_pmf = np.exp(goals * np.log(lam_home[:, None]) - lam_home[:, None] - log_fact)
+    away_pmf = np.exp(goals * np.log(lam_away[:, None]) - lam_away[:, None] - log_fact)
+    matrix = home_pmf[:, :, None] * away_pmf[:, None, :]
+    home_win = np.tril(np.ones((MAX_GOALS + 1, MAX_GOALS + 1)), -1)
+    p_home = (matrix * home_win).sum(axis=(1, 2))
+    p_draw = np.trace(matrix, axis1=1, axis2=2)
+    p_away = (matrix * home_win.T).sum(axis=(1, 2))
+    probs = np.column_stack([p_home, p_draw, p_away])
+    return probs / probs.sum(axis=1, keepdims=True)
+
+
+def _goal_minutes(goals: np.ndarray, rng: np.random.Generator) -> List[List[int]]:
+    """Minutos (ordenados) de los goles de cada partido"""
+    minutes = np.ceil(90 * rng.beta(GOAL_MINUTE_SKEW, 1.0, int(goals.sum()))).astype(int).clip(1, 90)
+    return [sorted(chunk.tolist()) for chunk in np.split(minutes, np.cumsum(goals)[:-1])]
+
+
+def generate_history(league: str, seasons: int = 2, last_season: Optional[int] = None,
+                     seed: Optional[int] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Genera `seasons` temporadas de una liga terminando en `last_season` (año de
+    inicio; por defecto la temporada actual). Devuelve (matches, match_stats) con
+    las columnas de Match y MatchStats; los partidos futuros quedan 'scheduled'.
+    """
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow()
+    if last_season is None:
+        last_season = now.year if now.month >= 7 else now.year - 1
+
+    teams = np.array(league_teams(league))
+    n_teams = len(teams)
+    attack = rng.normal(0, 0.25, n_teams)
+    defence = rng.normal(0, 0.20, n_teams)
+
+    frames = []
+    for season in range(last_season - seasons + 1, last_season + 1):
+        # Las fuerzas evolucionan ligeramente entre temporadas
+        attack = 0.8 * attack + rng.normal(0, 0.1, n_teams)
+        defence = 0.8 * defence + rng.normal(0, 0.08, n_teams)
+
+        schedule = _cup_schedule(n_teams, rng) if league in CUP_SOURCES else _round_robin(n_teams)
+        n_rounds, per_round, _ = schedule.shape
+        pairs = schedule.reshape(-1, 2)
+        valid = (pairs < n_teams).all(axis=1)
+        round_idx = np.repeat(np.arange(n_rounds), per_round)[valid]
+        pairs = pairs[valid]
+
+        start = np.datetime64(f"{season}-08-15T18:00")
+        # Jornadas semanales (las copas cada dos semanas) con horarios repartidos
+        spacing = 14 if league in CUP_SOURCES else 7
+        dates = (
+            start
+            + (round_idx * spacing).astype("timedelta64[D]")
+            + rng.integers(0, 3, len(pairs)).astype("timedelta64[D]")
+            + (rng.integers(0, 4, len(pairs)) * 90).astype("timedelta64[m]")
+        )
+        frames.append(pd.DataFrame({
+            "home_idx": pairs[:, 0],
+            "away_idx": pairs[:, 1],
+            "date": dates,
+            "lam_home": np.exp(BASE_RATE + HOME_ADVANTAGE + attack[pairs[:, 0]] - defence[pairs[:, 1]]),
+            "lam_away": np.exp(BASE_RATE + attack[pairs[:, 1]] - defence[pairs[:, 0]]),
+            "strength_diff": (attack - defence)[pairs[:, 0]] - (attack - defence)[pairs[:, 1]],
+        }))
+
+    games = pd.concat(frames, ignore_index=True).sort_values("date", kind="stable").reset_index(drop=True)
+    n = len(games)
+    lam_home = games["lam_home"].values
+    lam_away = games["lam_away"].values
+
+    home_goals = rng.poisson(lam_home)
+    away_goals = rng.poisson(lam_away)
+    probs = _outcome_probabilities(lam_home, lam_away)
+    odds = np.round(1 / (probs * (1 + BOOKMAKER_MARGIN)), 2)
+
+    finished = games["date"].values < np.datetime64(now)
+    home_names = teams[games["home_idx"].values]
+    away_names = teams[games["away_idx"].values]
+    date_strings = pd.DatetimeIndex(games["date"]).strftime("%Y-%m-%d")
+
+    matches = pd.DataFrame({
+        "api_match_id": [
+            # La liga forma parte de la clave: las copas repiten emparejamientos de liga
+            MOCK_PREFIX + generate_match_id(h, a, f"{d}_{league}")
+            for h, a, d in zip(home_names, away_names, date_strings)
+        ],
+        "league": league,
+        "competition": league,
+        "date": games["date"].dt.to_pydatetime(),
+        "home_team": home_names,
+        "away_team": away_names,
+        "home_score": np.where(finished, home_goals, None),
+        "away_score": np.where(finished, away_goals, None),
+        "status": np.where(finished, "finished", "scheduled"),
+        "odds": [{"1": h, "X": d, "2": a} for h, d, a in odds.tolist()],
+    })
+
+    # Estadísticas coherentes con las fuerzas y los goles
+    possession = np.clip(50 + 12 * np.tanh(games["strength_diff"].values) + rng.normal(0, 5, n), 25, 75).round(1)
+    home_shots = rng.poisson(4 + lam_home * 6)
+    away_shots = rng.poisson(4 + lam_away * 6)
+    home_minutes = _goal_minutes(home_goals, rng)
+    away_minutes = _goal_minutes(away_goals, rng)
+    home_on_target = np.maximum(rng.binomial(home_shots, 0.35), home_goals)
+    away_on_target = np.maximum(rng.binomial(away_shots, 0.35), away_goals)
+    stats = pd.DataFrame({
+        "row": np.arange(n),
+        "home_possession": possession,
+        "away_possession": (100 - possession).round(1),
+        "home_shots": np.maximum(home_shots, home_on_target),
+        "away_shots": np.maximum(away_shots, away_on_target),
+        "home_shots_on_target": home_on_target,
+        "away_shots_on_target": away_on_target,
+        "home_corners": rng.poisson(3 + home_shots / 3),
+        "away_corners": rng.poisson(3 + away_shots / 3),
+        "home_fouls": rng.poisson(12, n),
+        "away_fouls": rng.poisson(12.5, n),
+        "home_yellow_cards": rng.poisson(1.8, n),
+        "away_yellow_cards": rng.poisson(2.1, n),
+        "home_red_cards": rng.binomial(1, 0.05, n),
+        "away_red_cards": rng.binomial(1, 0.06, n),
+        "home_xg": (lam_home * rng.gamma(8, 1 / 8, n)).round(2),
+        "away_xg": (lam_away * rng.gamma(8, 1 / 8, n)).round(2),
+        "home_goal_minutes": home_minutes,
+        "away_goal_minutes": away_minutes,
+    })[finished]
+
+    return matches, stats
+
+
+def bulk_load(matches: pd.DataFrame, stats: pd.DataFrame, bind=None, replace: bool = True) -> int:
+    """
+    Inserta partidos y estadísticas en una sola transacción con executemany y
+    registra las cuotas de apertura en el historial de cuotas.
+    Con replace=True borra antes el historial mock previo de esas ligas con sus
+    filas del feature store (y recalcula sus agregados por equipo); el resto de
+    filas del feature store de esas ligas se marca como obsoleto, porque su contexto
+    cambia. Si no, solo se suman los partidos nuevos.
+    """
+    bind = bind or default_engine
+    match_table = Match.__table__
+    stats_table = MatchStats.__table__
+    odds_table = OddsSnapshot.__table__
+    aggregated_table = AggregatedMatch.__table__
+    features_table = MatchFeatures.__table__
+
+    # IDs de equipo antes de abrir la transacción (el registro escribe en su propia conexión)
+    registry = get_team_registry(bind)
+    matches = matches.assign(home_team_id=0, away_team_id=0)
+    for league, rows in matches.groupby("league", sort=False).groups.items():
+        for side in ("home", "away"):
+            matches.loc[rows, f"{side}_team_id"] = registry.resolve_many(
+                matches.loc[rows, f"{side}_team"], league=league, provider="mock"
+            )
+
+    with bind.begin() as conn:
+        if replace:
+            leagues = matches["league"].unique().tolist()
+            mock_ids = select(match_table.c.id).where(
+                match_table.c.league.in_(leagues),
+                match_table.c.api_match_id.like(MOCK_PREFIX + "%")
+            )
+            conn.execute(delete(stats_table).where(stats_table.c.match_id.in_(mock_ids)))
+            conn.execute(delete(odds_table).where(odds_table.c.match_id.in_(mock_ids)))
+            conn.execute(delete(aggregated_table).where(aggregated_table.c.match_id.in_(mock_ids)))
+            conn.execute(delete(features_table).where(features_table.c.match_id.in_(mock_ids)))
+            # FeatureStore.update recalcula las filas con otra versión
+            conn.execute(
+                update(features_table)
+                .where(features_table.c.league.in_(leagues))
+                .values(feature_version=STALE_FEATURE_VERSION)
+            )
+            conn.execute(delete(match_table).where(match_table.c.id.in_(mock_ids)))
+
+        # IDs explícitos para enlazar las estadísticas sin releer la tabla
+        first_id = (conn.execute(select(func.max(match_table.c.id))).scalar() or 0) + 1
+        match_ids = np.arange(first_id, first_id + len(matches))
+
+        match_records = matches.assign(id=match_ids).to_dict("records")
+        stats_records = (
+            stats.assign(match_id=match_ids[stats["row"].values])
+            .drop(columns="row")
+            .to_dict("records")
+        )
+        conn.execute(insert(match_table), match_records)
+        if stats_records:
+            conn.execute(insert(stats_table), stats_records)
+
+    opening = pd.DataFrame(matches["odds"].tolist(), index=match_ids).rename_axis("match_id")
+    opening = opening.reset_index().melt(id_vars="match_id", var_name="selection", value_name="price")
+    opening_ts = (pd.to_datetime(matches["date"]) - OPENING_ODDS_LEAD).astype("datetime64[s]").astype("int64").values
+    OddsStore(bind).record(opening.assign(
+        market=BetTypes.WIN_DRAW_WIN.value,
+        bookmaker="mock",
+        ts=np.tile(opening_ts, 3)
+    ))
+    if replace:
+        aggregates.rebuild(bind, leagues=matches["league"].unique().tolist())
+    else:
+        aggregates.update(bind)
+    bump_data_version('matches', bind)
+    bump_data_version('odds', bind)
+
+    return len(match_records)
+
+
+def load_mock_history(leagues: Optional[List[str]] = None, seasons: int = 2,
+                      seed: Optional[int] = 42, bind=None) -> Dict[str, int]:
+    """Genera y carga el historial mock de varias ligas. Devuelve partidos por liga"""
+    leagues = leagues or [league.value for league in Leagues]
+    loaded = {}
+    for i, league in enumerate(leagues):
+        matches, stats = generate_history(league, seasons=seasons, seed=None if seed is None else seed + i)
+        loaded[league] = bulk_load(matches, stats, bind=bind)
+        logger.info(f"Historial mock de {league}: {loaded[league]} partidos")
+    return loaded
@@ -0,0 +1,197 @@
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import joblib
+
+from database import SessionLocal, MLModel, ModelHyperparameters
+
+logger = logging.getLogger(__name__)
+
+# Presupuesto de memoria por defecto para modelos cargados (bytes en disco)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Cada cuánto se consulta ml_models para detectar versiones nuevas (segundos)
+DEFAULT_CHECK_INTERVAL = 30.0
+
+
+class ModelRegistry:
+    """
+    Registro de modelos respaldado por la tabla ml_models.
+
+    Carga los artefactos joblib bajo demanda (con mmap_mode para los arrays
+    numpy), mantiene un LRU acotado por tamaño de los modelos más usados y
+    cambia a una versión nueva en cuanto aparece en ml_models, sin reiniciar.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_bytes: int = DEFAULT_MAX_BYTES,
+                 check_interval: float = DEFAULT_CHECK_INTERVAL, mmap_mode: Optional[str] = 'r'):
+        self.session_factory = session_factory
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self.mmap_mode = mmap_mode
+        self._entries: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'loads': 0,
+            'load_time': 0.0,
+            'evictions': 0,
+            'swaps': 0,
+        }
+
+    def get(self, league: str, model_type: str = 'xgboost') -> Optional[Dict]:
+        """Devuelve el model_data más reciente de una liga (None si no hay modelo)"""
+        key = (league, model_type)
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+
+            if entry is not None and now - entry['checked_at'] < self.check_interval:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry['model_data']
+
+            latest = self._latest(league, model_type)
+            if latest is None:
+                return entry['model_data'] if entry else None
+
+            if entry is not None and entry['version'] == latest['version']:
+                entry['checked_at'] = now
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry['model_data']
+
+            self._stats['misses'] += 1
+            if entry is not None:
+                logger.info(f"Nueva versión de {model_type} para {league}: "
+                            f"{entry['version']} -> {latest['version']}")
+                self._stats['swaps'] += 1
+                self._drop(key)
+
+            model_data = self._load(latest['path'])
+            self._entries[key] = {
+                'model_data': model_data,
+                'version': latest['version'],
+                'path': latest['path'],
+                'nbytes': latest['nbytes'],
+                'checked_at': now,
+            }
+            self._bytes += latest['nbytes']
+            self._evict(keep=key)
+            return model_data
+
+    def invalidate(self, league: Optional[str] = None):
+        """Descarta modelos en memoria (todos o los de una liga)"""
+        with self._lock:
+            for key in [k for k in self._entries if league is None or k[0] == league]:
+                self._drop(key)
+
+    def stats(self) -> Dict:
+        """Contadores de aciertos/fallos/cargas y memoria ocupada"""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'hit_rate': self._stats['hits'] / lookups if lookups else 0.0,
+                'avg_load_time': self._stats['load_time'] / self._stats['loads'] if self._stats['loads'] else 0.0,
+                'cached_models': len(self._entries),
+                'cached_bytes': self._bytes,
+            }
+
+    def _latest(self, league: str, model_type: str) -> Optional[Dict]:
+        """Última versión registrada en ml_models (o el fichero legacy si no hay fila)"""
+        db = self.session_factory()
+        try:
+            record = (
+                db.query(MLModel)
+                .filter(MLModel.model_name == league, MLModel.model_type == model_type)
+                .order_by(MLModel.trained_at.desc(), MLModel.id.desc())
+                .first()
+            )
+        finally:
+            db.close()
+
+        path = record.model_path if record else f"data/models/{league}_{model_type}.joblib"
+        if not os.path.exists(path):
+            return None
+
+        stat = os.stat(path)
+        version = record.version if record else f"file:{int(stat.st_mtime)}"
+        return {'path': path, 'version': version, 'nbytes': stat.st_size}
+
+    def _load(self, path: str) -> Dict:
+        start = time.perf_counter()
+        model_data = joblib.load(path, mmap_mode=self.mmap_mode)
+        elapsed = time.perf_counter() - start
+        self._stats['loads'] += 1
+        self._stats['load_time'] += elapsed
+        logger.info(f"Modelo cargado desde {path} en {elapsed * 1000:.0f} ms")
+        return model_data
+
+    def _drop(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['nbytes']
+
+    def _evict(self, keep: Tuple[str, str]):
+        """Expulsa los modelos menos usados hasta respetar max_bytes"""
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._drop(key)
+            self._stats['evictions'] += 1
+            logger.info(f"Modelo {key[1]} para {key[0]} expulsado de memoria")
+
+
+def _current_params(db, league: str, model_type: str) -> Optional[ModelHyperparameters]:
+    """Fila vigente (la más reciente) de una liga y tipo de modelo"""
+    return (
+        db.query(ModelHyperparameters)
+        .filter(ModelHyperparameters.league == league, ModelHyperparameters.model_type == model_type)
+        .order_by(ModelHyperparameters.tuned_at.desc(), ModelHyperparameters.id.desc())
+        .first()
+    )
+
+
+def best_params(db, league: str, model_type: str) -> Optional[Dict]:
+    """Hiperparámetros vigentes de una liga y tipo de modelo (None: los por defecto)"""
+    record = _current_params(db, league, model_type)
+    return dict(record.params) if record else None
+
+
+def save_best_params(db, league: str, model_type: str, params: Dict, score: float,
+                     data_version: str, trials: int) -> ModelHyperparameters:
+    """
+    Registra el resultado de una búsqueda; train_model lo usa a partir de ahora.
+    Si la fila vigente ya tiene esos parámetros con la misma versión de los datos
+    (una búsqueda repetida que sale entera de la caché) se devuelve sin insertar.
+    """
+    current = _current_params(db, league, model_type)
+    if current is not None and current.data_version == data_version and current.params == params:
+        return current
+    record = ModelHyperparameters(
+        league=league, model_type=model_type, params=params, score=score,
+        data_version=data_version, trials=trials,
+    )
+    db.add(record)
+    db.commit()
+    return record
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ModelRegistry:
+    """Registro compartido por todo el proceso"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
@@ -0,0 +1,112 @@
+"""
+Parser de cuotas en streaming (html.parser de la librería estándar)
+
+Procesa el HTML por trozos a medida que llega y emite un registro por partido
+sin construir el árbol DOM completo. Usa la misma estructura que el scraper con
+BeautifulSoup: filas '.deactivate' dentro de '.table-main', con equipos en '.name'
+y cuotas 1/X/2 en '.odds'.
+"""
+
+import codecs
+from html.parser import HTMLParser
+from typing import Dict, Iterable, Iterator, List, Optional
+
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+
+class OddsStreamParser(HTMLParser):
+    """Extrae filas de cuotas; los registros completos se recogen con pop_records()"""
+
+    def __init__(self, container_class: str = "table-main", row_class: str = "deactivate"):
+        super().__init__(convert_charrefs=True)
+        self.container_class = container_class
+        self.row_class = row_class
+        self._stack: List[tuple] = []  # (tag, rol)
+        self._containers = 0
+        self._row: Optional[Dict] = None
+        self._capture: Optional[List[str]] = None
+        self._records: List[Dict] = []
+
+    def handle_starttag(self, tag, attrs):
+        classes = set()
+        for name, value in attrs:
+            if name == "class" and value:
+                classes.update(value.split())
+
+        role = None
+        if self.container_class in classes:
+            role = "container"
+            self._containers += 1
+        elif self._containers and self._row is None and self.row_class in classes:
+            role = "row"
+            self._row = {"names": [], "odds": []}
+        elif self._row is not None and self._capture is None and classes & {"name", "odds"}:
+            role = "name" if "name" in classes else "odds"
+            self._capture = []
+
+        if tag not in VOID_TAGS:
+            self._stack.append((tag, role))
+
+    def handle_startendtag(self, tag, attrs):
+        pass
+
+    def handle_endtag(self, tag):
+        # Cierra hasta la última etiqueta con ese nombre (tolera HTML mal cerrado)
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                for _, role in reversed(self._stack[i:]):
+                    self._close(role)
+                del self._stack[i:]
+                return
+
+    def handle_data(self, data):
+        if self._capture is not None:
+            self._capture.append(data)
+
+    def _close(self, role):
+        if role in ("name", "odds"):
+            text = "".join(self._capture or []).strip()
+            self._capture = None
+            if self._row is not None:
+                self._row["names" if role == "name" else "odds"].append(text)
+        elif role == "row":
+            record = _to_record(self._row)
+            self._row = None
+            if record is not None:
+                self._records.append(record)
+        elif role == "container":
+            self._containers -= 1
+
+    def pop_records(self) -> List[Dict]:
+        records, self._records = self._records, []
+        return records
+
+
+def _to_record(row: Dict) -> Optional[Dict]:
+    """Convierte una fila capturada al formato de scrape_odds_from_website"""
+    if len(row["names"]) < 2 or len(row["odds"]) < 3:
+        return None
+    try:
+        home_odds, draw_odds, away_odds = (float(value) for value in row["odds"][:3])
+    except ValueError:
+        return None
+    return {
+        "home_team": row["names"][0],
+        "away_team": row["names"][1],
+        "odds": {"1": home_odds, "X": draw_odds, "2": away_odds},
+    }
+
+
+def parse_odds_stream(chunks: Iterable[bytes], encoding: str = "utf-8") -> Iterator[Dict]:
+    """Genera registros de cuotas a partir de trozos de bytes conforme se parsean"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    parser = OddsStreamParser()
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        yield from parser.pop_records()
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    yield from parser.pop_records()
@@ -0,0 +1,394 @@
+"""
+Historial de cuotas (serie temporal, solo inserciones)
+
+Cada fila es (partido, casa de apuestas, mercado, selección, instante, cuota) con
+mercado y selección codificados como enteros. Solo se guarda una fila nueva cuando
+el precio cambia. El índice (match_id, market, selection, bookmaker_id, ts) resuelve
+"última cuota" y "cuota en el instante T" sin recorrer la tabla. Las cuotas de
+partidos terminados hace tiempo se archivan en Parquet por mes y en la tabla solo
+queda la cuota de cierre.
+"""
+
+import os
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, insert, delete, bindparam, func, text
+from sqlalchemy.util import LRUCache
+
+from config import BetTypes, ODDS_HISTORY_CONFIG
+from database import engine as default_engine, Bookmaker, OddsSnapshot
+
+logger = logging.getLogger(__name__)
+
+MARKET_CODES = {
+    BetTypes.WIN_DRAW_WIN.value: 1,
+    BetTypes.OVER_UNDER.value: 2,
+    BetTypes.BOTH_SCORE.value: 3,
+    BetTypes.EXACT_SCORE.value: 4,
+    BetTypes.DOUBLE_CHANCE.value: 5,
+    BetTypes.CORNERS.value: 6,
+}
+MARKET_NAMES = {code: name for name, code in MARKET_CODES.items()}
+
+# Mercados con selecciones fijas
+FIXED_SELECTIONS = {
+    MARKET_CODES[BetTypes.WIN_DRAW_WIN.value]: {"1": 1, "X": 2, "2": 3},
+    MARKET_CODES[BetTypes.BOTH_SCORE.value]: {"yes": 1, "no": 2},
+    MARKET_CODES[BetTypes.DOUBLE_CHANCE.value]: {"1X": 1, "12": 2, "X2": 3},
+}
+FIXED_LABELS = {
+    market: {code: label for label, code in selections.items()}
+    for market, selections in FIXED_SELECTIONS.items()
+}
+
+# Mercados con línea ("over_2.5" / "under_2.5"): décimas de la línea * 10 + lado
+LINE_MARKETS = {MARKET_CODES[BetTypes.OVER_UNDER.value], MARKET_CODES[BetTypes.CORNERS.value]}
+LINE_SIDES = {"over": 1, "under": 2}
+
+_CHUNK_SIZE = 500
+_KEY = ["match_id", "market", "selection", "bookmaker_id"]
+
+_COMPILED_CACHE = LRUCache(50)
+
+_oh = OddsSnapshot.__table__
+_bk = Bookmaker.__table__
+
+
+def _latest_statement(by_market: bool, at_time: bool):
+    """Fila más reciente por (partido, mercado, selección, casa), opcionalmente hasta ts <= :at"""
+    rn = func.row_number().over(
+        partition_by=[_oh.c[name] for name in _KEY],
+        order_by=[_oh.c.ts.desc(), _oh.c.id.desc()]
+    ).label("rn")
+    inner = select(*[_oh.c[name] for name in _KEY], _oh.c.ts, _oh.c.price, rn).where(
+        _oh.c.match_id.in_(bindparam("match_ids", expanding=True))
+    )
+    if by_market:
+        inner = inner.where(_oh.c.market == bindparam("market"))
+    if at_time:
+        inner = inner.where(_oh.c.ts <= bindparam("at"))
+    sub = inner.subquery()
+    return select(*[sub.c[name] for name in _KEY], sub.c.ts, sub.c.price).where(sub.c.rn == 1)
+
+
+_LATEST_QUERIES = {
+    (by_market, at_time): _latest_statement(by_market, at_time)
+    for by_market in (False, True) for at_time in (False, True)
+}
+
+# Partidos terminados antes de :cutoff con más de una cuota para alguna selección
+_ROLLUP_CANDIDATES = text("""
+    SELECT DISTINCT oh.match_id
+    FROM odds_history oh
+    JOIN matches m ON m.id = oh.match_id
+    WHERE m.status = 'finished' AND m.date < :cutoff
+    GROUP BY oh.match_id, oh.market, oh.selection, oh.bookmaker_id
+    HAVING COUNT(*) > 1
+""")
+
+
+def market_code(market: Union[str, int, BetTypes]) -> int:
+    if isinstance(market, BetTypes):
+        market = market.value
+    if isinstance(market, (int, np.integer)):
+        return int(market)
+    return MARKET_CODES[market]
+
+
+def encode_selection(market: int, selection: Union[str, int]) -> int:
+    """Código entero de una selección ('1', 'over_2.5', '2-1', 'yes'...)"""
+    if isinstance(selection, (int, np.integer)):
+        return int(selection)
+    if market in FIXED_SELECTIONS:
+        return FIXED_SELECTIONS[market][selection]
+    if market in LINE_MARKETS:
+        side, line = selection.split("_")
+        return int(round(float(line) * 10)) * 10 + LINE_SIDES[side]
+    home, away = selection.split("-")
+    return int(home) * 100 + int(away)
+
+
+def decode_selection(market: int, code: int) -> str:
+    if market in FIXED_LABELS:
+        return FIXED_LABELS[market][code]
+    if market in LINE_MARKETS:
+        side = "over" if code % 10 == LINE_SIDES["over"] else "under"
+        return f"{side}_{code // 10 / 10:g}"
+    return f"{code // 100}-{code % 100}"
+
+
+def to_epoch(value) -> int:
+    """Segundos epoch UTC (datetime naive = UTC, como Match.date)"""
+    if value is None:
+        return int(time.time())
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(pd.Timestamp(value).timestamp())
+
+
+class OddsStore:
+    def __init__(self, bind=None):
+        self.bind = bind or default_engine
+        self._bookmakers: Dict[str, int] = {}
+        self._bookmaker_names: Dict[int, str] = {}
+
+    # -- Escritura ---------------------------------------------------------
+
+    def record(self, snapshots: Union[pd.DataFrame, List[Dict]]) -> int:
+        """
+        Añade cuotas al historial. Columnas: match_id, market, selection, price y
+        opcionalmente bookmaker y ts. Mercado y selección pueden venir como texto
+        o ya codificados. Se descartan las filas cuyo precio no cambia respecto a
+        la última cuota guardada. Devuelve las filas insertadas.
+        """
+        df = pd.DataFrame(snapshots) if not isinstance(snapshots, pd.DataFrame) else snapshots.copy()
+        if df.empty:
+            return 0
+
+        if "bookmaker" not in df:
+            df["bookmaker"] = ODDS_HISTORY_CONFIG["default_bookmaker"]
+        if "ts" not in df:
+            df["ts"] = int(time.time())
+        elif not pd.api.types.is_integer_dtype(df["ts"]):
+            df["ts"] = pd.to_datetime(df["ts"]).astype("datetime64[s]").astype("int64")
+
+        df = self._encode(df)
+        df["bookmaker_id"] = df["bookmaker"].map(self._bookmaker_ids(df["bookmaker"].unique()))
+        df = df[_KEY + ["ts", "price"]].dropna(subset=["price"])
+
+        # Solo cambios de precio: dentro del lote y frente a lo ya guardado
+        df = df.sort_values(_KEY + ["ts"], kind="stable")
+        same_key = (df[_KEY] == df[_KEY].shift()).all(axis=1)
+        df = df[~(same_key & (df["price"] == df["price"].shift()))]
+
+        stored = self._latest_raw(df["match_id"].unique().tolist())
+        if not stored.empty:
+            df = df.merge(
+                stored.rename(columns={"ts": "last_ts", "price": "last_price"}),
+                on=_KEY, how="left"
+            )
+            first = ~(df[_KEY] == df[_KEY].shift()).all(axis=1)
+            unchanged = first & (df["price"] == df["last_price"]) & (df["ts"] >= df["last_ts"])
+            df = df.loc[~unchanged, _KEY + ["ts", "price"]]
+
+        if df.empty:
+            return 0
+        records = df.astype({name: int for name in _KEY + ["ts"]}).to_dict("records")
+        with self.bind.begin() as conn:
+            conn.execute(insert(_oh), records)
+        return len(records)
+
+    def record_odds(self, items: Iterable[Dict], bookmaker: Optional[str] = None, ts=None) -> int:
+        """
+        Atajo para el formato de Match.odds / scrapers: cada item tiene 'match_id' y
+        'odds', bien plano ({"1": 2.1, "X": 3.4, "2": 3.5}, mercado 1X2) o por
+        mercado ({"Over/Under": {"over_2.5": 1.9, ...}, ...}).
+        """
+        bookmaker = bookmaker or ODDS_HISTORY_CONFIG["default_bookmaker"]
+        default_market = BetTypes.WIN_DRAW_WIN.value
+        rows = []
+        for item in items:
+            item_ts = to_epoch(item.get("ts", ts))
+            for key, value in (item.get("odds") or {}).items():
+                prices = value if isinstance(value, dict) else {key: value}
+                market = key if isinstance(value, dict) else default_market
+                for selection, price in prices.items():
+                    rows.append((item["match_id"], market, selection, price, bookmaker, item_ts))
+        return self.record(pd.DataFrame(
+            rows, columns=["match_id", "market", "selection", "price", "bookmaker", "ts"]
+        ))
+
+    # -- Lectura -----------------------------------------------------------
+
+    def latest(self, match_ids: Iterable[int], market=None, at=None) -> pd.DataFrame:
+        """
+        Última cuota de cada selección y casa para los partidos dados (o la vigente
+        en el instante `at`). Columnas: match_id, bookmaker, market, selection, ts, price
+        """
+        code = None if market is None else market_code(market)
+        raw = self._latest_raw(list(match_ids), code, None if at is None else to_epoch(at))
+        return self._decode(raw)
+
+    def price_at(self, match_ids: Iterable[int], at, market=None) -> pd.DataFrame:
+        """Cuotas vigentes en el instante `at` (último cambio con ts <= at)"""
+        return self.latest(match_ids, market=market, at=at)
+
+    def best_prices(self, match_ids: Iterable[int], market=BetTypes.WIN_DRAW_WIN, at=None) -> pd.DataFrame:
+        """Mejor cuota entre casas por partido: índice match_id, una columna por selección"""
+        code = market_code(market)
+        raw = self._latest_raw(list(match_ids), code, None if at is None else to_epoch(at))
+        if raw.empty:
+            columns = list(FIXED_SELECTIONS.get(code, {}))
+            return pd.DataFrame(columns=columns, index=pd.Index([], name="match_id"), dtype=float)
+        best = raw.pivot_table(index="match_id", columns="selection", values="price", aggfunc="max")
+        best.columns = [decode_selection(code, c) for c in best.columns]
+        best.columns.name = None
+        return best
+
+    def prices_before(self, kickoffs: pd.Series, market=BetTypes.WIN_DRAW_WIN) -> pd.DataFrame:
+        """
+        Cuota vigente al inicio de cada partido (último cambio con ts <= su fecha),
+        por casa y selección. `kickoffs`: fechas indexadas por match_id. Una sola
+        lectura por bloque de partidos, para backtesting.
+        """
+        code = market_code(market)
+        match_ids = [int(match_id) for match_id in kickoffs.index]
+        statement = select(*[_oh.c[name] for name in _KEY], _oh.c.ts, _oh.c.price).where(
+            _oh.c.match_id.in_(bindparam("match_ids", expanding=True)), _oh.c.market == code
+        )
+        rows = []
+        with self.bind.connect() as conn:
+            for start in range(0, len(match_ids), _CHUNK_SIZE):
+                rows.extend(conn.execute(statement, {"match_ids": match_ids[start:start + _CHUNK_SIZE]}).fetchall())
+        raw = pd.DataFrame(rows, columns=_KEY + ["ts", "price"])
+        if raw.empty:
+            return self._decode(raw)
+
+        limit = pd.Series(
+            pd.to_datetime(kickoffs.values).astype("datetime64[s]").astype("int64"), index=kickoffs.index
+        )
+        raw = raw[raw["ts"].to_numpy() <= limit.reindex(raw["match_id"]).to_numpy()]
+        raw = raw.sort_values("ts", kind="stable").drop_duplicates(_KEY, keep="last")
+        return self._decode(raw.reset_index(drop=True))
+
+    def history(self, match_id: int, market=None) -> pd.DataFrame:
+        """Serie completa de cambios de un partido (para gráficos de movimiento)"""
+        statement = select(*[_oh.c[name] for name in _KEY], _oh.c.ts, _oh.c.price).where(
+            _oh.c.match_id == match_id
+        ).order_by(_oh.c.ts, _oh.c.id)
+        if market is not None:
+            statement = statement.where(_oh.c.market == market_code(market))
+        with self.bind.connect() as conn:
+            raw = pd.DataFrame(conn.execute(statement).fetchall(), columns=_KEY + ["ts", "price"])
+        return self._decode(raw)
+
+    # -- Archivado en Parquet ----------------------------------------------
+
+    def rollup(self, older_than_days: Optional[int] = None, directory: Optional[str] = None) -> int:
+        """
+        Archiva en Parquet (directory/month=AAAAMM/) el historial de los partidos
+        terminados hace más de `older_than_days` días y deja en la tabla solo la
+        cuota de cierre de cada selección. Devuelve las filas borradas de la tabla.
+        Necesita pyarrow; sin él no se archiva nada.
+        """
+        older_than_days = ODDS_HISTORY_CONFIG["rollup_after_days"] if older_than_days is None else older_than_days
+        directory = directory or ODDS_HISTORY_CONFIG["rollup_dir"]
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+        with self.bind.connect() as conn:
+            match_ids = [row[0] for row in conn.execute(_ROLLUP_CANDIDATES, {"cutoff": cutoff})]
+        if not match_ids:
+            return 0
+
+        statement = select(_oh.c.id, *[_oh.c[name] for name in _KEY], _oh.c.ts, _oh.c.price).where(
+            _oh.c.match_id.in_(bindparam("match_ids", expanding=True))
+        )
+        frames = []
+        with self.bind.connect() as conn:
+            for start in range(0, len(match_ids), _CHUNK_SIZE):
+                chunk = match_ids[start:start + _CHUNK_SIZE]
+                frames.append(pd.DataFrame(
+                    conn.execute(statement, {"match_ids": chunk}).fetchall(),
+                    columns=["id"] + _KEY + ["ts", "price"]
+                ))
+        rows = pd.concat(frames, ignore_index=True)
+
+        months = pd.to_datetime(rows["ts"], unit="s").dt.strftime("%Y%m")
+        part = f"part-{int(time.time() * 1000)}.parquet"
+        try:
+            for month, group in rows.groupby(months):
+                path = os.path.join(directory, f"month={month}")
+                os.makedirs(path, exist_ok=True)
+                group.drop(columns="id").to_parquet(os.path.join(path, part), index=False)
+        except ImportError as e:
+            logger.warning(f"No se puede archivar el historial de cuotas en Parquet: {e}")
+            return 0
+
+        closing = rows.sort_values(["ts", "id"]).groupby(_KEY)["id"].last()
+        obsolete = rows.loc[~rows["id"].isin(closing.values), "id"].tolist()
+        with self.bind.begin() as conn:
+            for start in range(0, len(obsolete), _CHUNK_SIZE):
+                conn.execute(delete(_oh).where(_oh.c.id.in_(obsolete[start:start + _CHUNK_SIZE])))
+
+        logger.info(f"Historial de cuotas archivado: {len(rows)} filas de {len(match_ids)} partidos")
+        return len(obsolete)
+
+    def read_rollups(self, match_ids: Optional[Iterable[int]] = None,
+                     directory: Optional[str] = None) -> pd.DataFrame:
+        """Historial archivado en Parquet (decodificado), opcionalmente filtrado por partidos"""
+        directory = directory or ODDS_HISTORY_CONFIG["rollup_dir"]
+        if not os.path.isdir(directory):
+            return self._decode(pd.DataFrame(columns=_KEY + ["ts", "price"]))
+        filters = [("match_id", "in", list(match_ids))] if match_ids is not None else None
+        raw = pd.read_parquet(directory, filters=filters)
+        return self._decode(raw.drop(columns="month", errors="ignore"))
+
+    # -- Internos ----------------------------------------------------------
+
+    def _latest_raw(self, match_ids: List[int], market: Optional[int] = None,
+                    at: Optional[int] = None) -> pd.DataFrame:
+        statement = _LATEST_QUERIES[(market is not None, at is not None)]
+        params = {}
+        if market is not None:
+            params["market"] = market
+        if at is not None:
+            params["at"] = at
+
+        rows = []
+        with self.bind.connect().execution_options(compiled_cache=_COMPILED_CACHE) as conn:
+            for start in range(0, len(match_ids), _CHUNK_SIZE):
+                chunk = [int(match_id) for match_id in match_ids[start:start + _CHUNK_SIZE]]
+                rows.extend(conn.execute(statement, {**params, "match_ids": chunk}).fetchall())
+        return pd.DataFrame(rows, columns=_KEY + ["ts", "price"])
+
+    def _encode(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Codifica mercado y selección (una vez por par distinto, no por fila)"""
+        df["market"] = df["market"].map(market_code)
+        pairs = df[["market", "selection"]].drop_duplicates()
+        codes = {
+            (market, selection): encode_selection(market, selection)
+            for market, selection in pairs.itertuples(index=False)
+        }
+        df["selection"] = [codes[pair] for pair in zip(df["market"], df["selection"])]
+        return df
+
+    def _decode(self, raw: pd.DataFrame) -> pd.DataFrame:
+        columns = ["match_id", "bookmaker", "market", "selection", "ts", "price"]
+        if raw.empty:
+            return pd.DataFrame(columns=columns)
+        self._load_bookmakers()
+        pairs = raw[["market", "selection"]].drop_duplicates()
+        labels = {
+            (market, code): decode_selection(market, code)
+            for market, code in pairs.itertuples(index=False)
+        }
+        return pd.DataFrame({
+            "match_id": raw["match_id"].values,
+            "bookmaker": raw["bookmaker_id"].map(self._bookmaker_names).values,
+            "market": raw["market"].map(MARKET_NAMES).values,
+            "selection": [labels[pair] for pair in zip(raw["market"], raw["selection"])],
+            "ts": pd.to_datetime(raw["ts"], unit="s").values,
+            "price": raw["price"].values,
+        })
+
+    def _load_bookmakers(self):
+        with self.bind.connect() as conn:
+            for bookmaker_id, name in conn.execute(select(_bk.c.id, _bk.c.name)):
+                self._bookmakers[name] = bookmaker_id
+                self._bookmaker_names[bookmaker_id] = name
+
+    def _bookmaker_ids(self, names: Iterable[str]) -> Dict[str, int]:
+        names = list(names)
+        if any(name not in self._bookmakers for name in names):
+            self._load_bookmakers()
+            missing = [name for name in names if name not in self._bookmakers]
+            if missing:
+                with self.bind.begin() as conn:
+                    conn.execute(insert(_bk), [{"name": name} for name in missing])
+                self._load_bookmakers()
+        return {name: self._bookmakers[name] for name in names}
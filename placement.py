@@ -0,0 +1,205 @@
+"""
+Colocación de apuestas con comprobación atómica de saldo y límite diario
+
+Cada apuesta es un UPDATE condicional sobre users que comprueba y descuenta a la
+vez: saldo suficiente, límite diario (users.daily_spent, contador del día
+daily_spent_date que se reinicia solo al cambiar de día, sin SUM sobre bets) y
+partido aún programado. Si no toca ninguna fila la apuesta se rechaza; si la toca,
+el INSERT en bets va en la misma transacción. Dos peticiones simultáneas del mismo
+usuario no pueden gastar el mismo saldo: la segunda espera el bloqueo de la fila
+(de la base de datos en SQLite) y vuelve a evaluar la condición.
+
+place_bets() coloca muchas apuestas en una sola transacción (un commit para todo
+el lote) y PlacementQueue agrupa en micro-lotes las peticiones que llegan desde
+varios hilos.
+"""
+
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, insert, update, bindparam, case, func, exists, Date
+
+from config import BETTING_CONFIG
+from database import engine as default_engine, User, Bet, Match
+from settlement import bet_codes
+from utils import calculate_potential_win, validate_bet
+
+logger = logging.getLogger(__name__)
+
+_u = User.__table__
+_b = Bet.__table__
+_m = Match.__table__
+
+_STAKE = bindparam("stake")
+_DAY = bindparam("day", type_=Date)
+_SPENT_TODAY = case((_u.c.daily_spent_date == _DAY, func.coalesce(_u.c.daily_spent, 0.0)), else_=0.0)
+
+# Comprobación y descuento en una sola sentencia
+_RESERVE = (
+    update(_u)
+    .where(
+        _u.c.id == bindparam("uid"),
+        _u.c.balance >= _STAKE,
+        _SPENT_TODAY + _STAKE <= func.coalesce(_u.c.daily_limit, BETTING_CONFIG["default_daily_limit"]),
+        exists().where(_m.c.id == bindparam("mid"), _m.c.status == "scheduled"),
+    )
+    .values(balance=_u.c.balance - _STAKE, daily_spent=_SPENT_TODAY + _STAKE, daily_spent_date=_DAY)
+)
+
+_INSERT = insert(_b).returning(_b.c.id, sort_by_parameter_order=True)
+
+
+def _request(user_id: int, match_id: int, bet_type: str, selection: str, odds: float, stake: float) -> Dict:
+    return {
+        "user_id": int(user_id), "match_id": int(match_id), "bet_type": bet_type,
+        "selection": selection, "odds": float(odds), "stake": round(float(stake), 2),
+    }
+
+
+def _rejection(conn, request: Dict, day) -> str:
+    """Motivo del rechazo (solo se consulta cuando el UPDATE no tocó ninguna fila)"""
+    user = conn.execute(
+        select(_u.c.balance, _u.c.daily_limit, _u.c.daily_spent, _u.c.daily_spent_date)
+        .where(_u.c.id == request["user_id"])
+    ).first()
+    if user is None:
+        return "Usuario no encontrado"
+    status = conn.execute(select(_m.c.status).where(_m.c.id == request["match_id"])).scalar()
+    if status != "scheduled":
+        return "Partido no disponible para apostar"
+    daily_spent = (user.daily_spent or 0.0) if user.daily_spent_date == day else 0.0
+    daily_limit = user.daily_limit if user.daily_limit is not None else BETTING_CONFIG["default_daily_limit"]
+    valid, message = validate_bet(request["stake"], user.balance or 0.0, daily_spent, daily_limit)
+    return message if not valid else "Apuesta rechazada"
+
+
+def place_bets(requests: List[Dict], bind=None) -> List[Dict]:
+    """
+    Coloca las apuestas (dicts con user_id, match_id, bet_type, selection, odds y
+    stake) en una transacción, en orden. Devuelve por cada una
+    {"accepted", "bet_id", "reason"}.
+    """
+    bind = bind or default_engine
+    requests = [_request(**request) for request in requests]
+    now = datetime.utcnow()
+    day = now.date()
+    results: List[Dict] = [{"accepted": False, "bet_id": None, "reason": None} for _ in requests]
+    rows, positions = [], []
+
+    with bind.begin() as conn:
+        for position, request in enumerate(requests):
+            codes = bet_codes(request["bet_type"], request["selection"])
+            if request["stake"] <= 0:
+                results[position]["reason"] = "El importe debe ser mayor a 0"
+                continue
+            if codes is None or request["odds"] <= 1:
+                results[position]["reason"] = "Mercado, selección o cuota no válidos"
+                continue
+            reserved = conn.execute(_RESERVE, {
+                "uid": request["user_id"], "mid": request["match_id"], "stake": request["stake"], "day": day
+            }).rowcount
+            if not reserved:
+                results[position]["reason"] = _rejection(conn, request, day)
+                continue
+            rows.append({
+                **request, "market": codes[0], "selection_code": codes[1],
+                "potential_win": round(calculate_potential_win(request["stake"], request["odds"]), 2),
+                "status": "pending", "placed_at": now,
+            })
+            positions.append(position)
+        if rows:
+            bet_ids = conn.execute(_INSERT, rows).scalars().all()
+            for position, bet_id in zip(positions, bet_ids):
+                results[position].update(accepted=True, bet_id=bet_id)
+    return results
+
+
+def place_bet(user_id: int, match_id: int, bet_type: str, selection: str, odds: float, stake: float,
+              bind=None) -> Dict:
+    """Coloca una apuesta (una transacción)"""
+    return place_bets([{
+        "user_id": user_id, "match_id": match_id, "bet_type": bet_type,
+        "selection": selection, "odds": odds, "stake": stake,
+    }], bind)[0]
+
+
+class PlacementQueue:
+    """
+    Agrupa las apuestas que llegan desde varios hilos en micro-lotes: un hilo
+    coloca hasta batch_size apuestas por transacción, esperando como mucho
+    max_wait_ms a que se llene el lote.
+    """
+
+    def __init__(self, bind=None, batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None):
+        self.bind = bind or default_engine
+        self.batch_size = batch_size or BETTING_CONFIG["placement_batch_size"]
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else BETTING_CONFIG["placement_max_wait_ms"]) / 1000
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="bet-placement", daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id: int, match_id: int, bet_type: str, selection: str, odds: float,
+               stake: float) -> Future:
+        """Encola una apuesta; el Future devuelve el resultado de place_bets"""
+        future: Future = Future()
+        self._queue.put((_request(user_id, match_id, bet_type, selection, odds, stake), future))
+        return future
+
+    def place(self, *args, timeout: Optional[float] = None, **kwargs) -> Dict:
+        return self.submit(*args, **kwargs).result(timeout)
+
+    def close(self):
+        """Coloca lo pendiente y detiene el hilo"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self) -> Optional[List]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                results = place_bets([request for request, _ in batch], self.bind)
+            except Exception as e:
+                logger.error(f"Error colocando un lote de {len(batch)} apuestas: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+_placement_queue: Optional[PlacementQueue] = None
+_placement_lock = threading.Lock()
+
+
+def get_placement_queue(bind=None) -> PlacementQueue:
+    """Cola de colocación compartida por el proceso"""
+    global _placement_queue
+    with _placement_lock:
+        if _placement_queue is None:
+            _placement_queue = PlacementQueue(bind)
+        return _placement_queue
@@ -0,0 +1,147 @@
+"""
+Comprobación de arranque (python run.py --preflight)
+
+Verifica una sola vez, fuera de las peticiones de Streamlit, que las dependencias
+de requirements están instaladas y en la versión fijada, precalienta los imports
+pesados (bytecode y caché de disco) y deja un sello en data/ para no repetir la
+comprobación mientras no cambien los requisitos ni el intérprete.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import logging
+import compileall
+import importlib
+import importlib.util
+import subprocess
+from importlib import metadata
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REQUIREMENTS_FILE = os.path.join(BASE_DIR, 'requirements .txt')
+STAMP_FILE = os.path.join(BASE_DIR, 'data', '.preflight.json')
+
+# Distribuciones cuyo módulo importable tiene otro nombre
+IMPORT_NAMES = {
+    'scikit-learn': 'sklearn',
+    'python-dotenv': 'dotenv',
+    'streamlit-authenticator': 'streamlit_authenticator',
+    'pyyaml': 'yaml',
+    'beautifulsoup4': 'bs4',
+}
+
+# Módulos que se importan para precalentar (por orden de coste aproximado)
+WARM_IMPORTS = [
+    'numpy', 'pandas', 'sqlalchemy', 'scipy.stats', 'sklearn.ensemble',
+    'xgboost', 'plotly.express', 'streamlit', 'streamlit_authenticator',
+]
+
+
+def read_requirements(path: str = REQUIREMENTS_FILE) -> Dict[str, Optional[str]]:
+    """{distribución: versión fijada o None}"""
+    requirements = {}
+    with open(path) as file:
+        for line in file:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            match = re.match(r'^([A-Za-z0-9_.\-]+)\s*(?:==\s*([^\s;]+))?', line)
+            if match:
+                requirements[match.group(1).lower()] = match.group(2)
+    return requirements
+
+
+def check_dependencies(requirements: Dict[str, Optional[str]]) -> Dict[str, List[str]]:
+    """Dependencias que faltan y las que tienen otra versión instalada"""
+    missing, mismatched = [], []
+    for name, pinned in requirements.items():
+        try:
+            installed = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            # Sin metadatos (p. ej. copiado al path): basta con que sea importable
+            if importlib.util.find_spec(IMPORT_NAMES.get(name, name.replace('-', '_'))) is None:
+                missing.append(f"{name}=={pinned}" if pinned else name)
+            continue
+        if pinned and installed != pinned:
+            mismatched.append(f"{name} {installed} (fijada {pinned})")
+    return {'missing': missing, 'mismatched': mismatched}
+
+
+def warm_imports(modules: List[str] = WARM_IMPORTS) -> Dict[str, float]:
+    """Importa los módulos pesados una vez y devuelve el tiempo de cada uno"""
+    timings = {}
+    for module in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logger.warning(f"No se pudo importar {module}: {e}")
+            continue
+        timings[module] = time.perf_counter() - start
+    return timings
+
+
+def _fingerprint(path: str = REQUIREMENTS_FILE) -> str:
+    with open(path, 'rb') as file:
+        content = file.read()
+    return hashlib.sha256(content + sys.executable.encode() + sys.version.encode()).hexdigest()
+
+
+def is_fresh(stamp_file: str = STAMP_FILE) -> bool:
+    """True si ya se pasó la comprobación con estos requisitos e intérprete"""
+    try:
+        with open(stamp_file) as file:
+            return json.load(file).get('fingerprint') == _fingerprint()
+    except (OSError, ValueError):
+        return False
+
+
+def run_preflight(install: bool = False, force: bool = False) -> bool:
+    """
+    Comprueba dependencias, compila a bytecode el proyecto y precalienta imports.
+    Con install=True instala lo que falte con pip (aquí, nunca dentro de la app).
+    Devuelve False si faltan dependencias.
+    """
+    if not force and is_fresh():
+        logger.info("Preflight: entorno ya verificado")
+        return True
+
+    requirements = read_requirements()
+    status = check_dependencies(requirements)
+
+    if status['missing'] and install:
+        logger.info(f"Instalando dependencias: {', '.join(status['missing'])}")
+        subprocess.check_call([sys.executable, '-m', 'pip', 'install', *status['missing']])
+        importlib.invalidate_caches()
+        status = check_dependencies(requirements)
+
+    for entry in status['mismatched']:
+        logger.warning(f"Versión distinta: {entry}")
+    if status['missing']:
+        logger.error(
+            "Faltan dependencias: " + ", ".join(status['missing'])
+            + f"\nInstálalas con: {sys.executable} -m pip install -r \"{REQUIREMENTS_FILE}\""
+            + " (o python run.py --preflight --install)"
+        )
+        return False
+
+    compileall.compile_dir(BASE_DIR, maxlevels=0, quiet=1)
+    timings = warm_imports()
+    for module, seconds in timings.items():
+        logger.info(f"  import {module:<26} {seconds * 1000:8.1f} ms")
+
+    os.makedirs(os.path.dirname(STAMP_FILE), exist_ok=True)
+    with open(STAMP_FILE, 'w') as file:
+        json.dump({
+            'fingerprint': _fingerprint(),
+            'checked_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'import_seconds': timings,
+        }, file, indent=2)
+    logger.info("✅ Preflight completado")
+    return True
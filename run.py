@@ -7,14 +7,13 @@ import sys
 import os
 import logging
 import argparse
+import signal
+import threading
 from pathlib import Path
 
 # Añadir el directorio actual al path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from database import init_db
-from ml_model import BettingPredictor
-from scheduler import init_scheduler
 import warnings
 
 warnings.filterwarnings('ignore')
@@ -29,6 +28,7 @@ def setup_database():
     """Inicializa la base de datos"""
     logger.info("Configurando base de datos...")
     try:
+        from database import init_db
         init_db()
         logger.info("✅ Base de datos inicializada correctamente")
     except Exception as e:
@@ -44,45 +44,93 @@ def setup_directories():
         logger.info(f"Creado directorio: {directory}")
     return True
 
-def generate_mock_data():
-    """Genera datos mock iniciales"""
+def generate_mock_data(seasons=2):
+    """Genera y carga en la base de datos un historial mock"""
     logger.info("Generando datos mock iniciales...")
     try:
         from data_fetcher import DataFetcher
+        from config import Leagues
         fetcher = DataFetcher(use_mock=True)
         
-        # Generar datos para diferentes ligas
-        leagues = ['La Liga', 'Premier League', 'Serie A', 'Bundesliga', 'Ligue 1']
-        
-        for league in leagues:
-            matches = fetcher.get_historical_matches(league, days_back=730)  # 2 años
-            logger.info(f"Generados {len(matches)} partidos mock para {league}")
+        # Generar datos para todas las ligas
+        for i, league in enumerate(Leagues):
+            matches = fetcher.get_historical_matches(league.value, days_back=365 * seasons, seed=42 + i)
+            logger.info(f"Generados {len(matches)} partidos mock para {league.value}")
         
         logger.info("✅ Datos mock generados correctamente")
     except Exception as e:
         logger.error(f"❌ Error generando datos mock: {e}")
     return True
 
-def train_initial_models():
-    """Entrena modelos iniciales"""
+def train_initial_models(workers=None, threads_per_worker=1, model_types=None, incremental=False):
+    """Entrena modelos iniciales en paralelo (ligas × tipos de modelo)"""
     logger.info("Entrenando modelos iniciales...")
     try:
-        from database import SessionLocal
-        db = SessionLocal()
+        from training import train_all
+        results = train_all(
+            model_types=model_types,
+            workers=workers,
+            threads_per_worker=threads_per_worker,
+            incremental=incremental
+        )
         
-        predictor = BettingPredictor(db)
-        leagues = ['La Liga', 'Premier League', 'Serie A']
+        for result in results:
+            if result['error']:
+                logger.warning(f"Modelo {result['model_type']} para {result['league']} falló: {result['error']}")
+            else:
+                logger.info(
+                    f"Modelo {result['model_type']} para {result['league']} entrenado - "
+                    f"Accuracy: {result['accuracy']:.2%} ({result['seconds']:.1f}s)"
+                )
         
-        for league in leagues:
-            accuracy = predictor.train_model(league)
-            logger.info(f"Modelo para {league} entrenado - Accuracy: {accuracy:.2%}")
+        from config import Leagues
+        from database import engine
+        from goal_model import fit_league
+        for league in Leagues:
+            fit_league(engine, league.value)
         
-        db.close()
         logger.info("✅ Modelos entrenados correctamente")
     except Exception as e:
         logger.error(f"❌ Error entrenando modelos: {e}")
     return True
 
+def run_backtests(workers=None, threads_per_worker=1, model_types=None, seasons=None):
+    """Backtesting walk-forward de ligas × tipos de modelo (escribe model_performance)"""
+    logger.info("Ejecutando backtesting...")
+    try:
+        from backtest import make_config, run_backtests as run_all
+        overrides = {'seasons': seasons} if seasons else {}
+        configs = [make_config(model_type=model_type, **overrides) for model_type in model_types or ['xgboost']]
+        for result in run_all(configs=configs, workers=workers, threads_per_worker=threads_per_worker):
+            if result['error']:
+                logger.warning(f"Backtest {result['config']} de {result['league']} falló: {result['error']}")
+            else:
+                logger.info(
+                    f"Backtest {result['config']} de {result['league']}: accuracy {result['accuracy']:.2%}, "
+                    f"{result['bets']} apuestas, ROI {result['roi']:+.2%} ({result['seconds']:.1f}s)"
+                )
+    except Exception as e:
+        logger.error(f"❌ Error en el backtesting: {e}")
+    return True
+
+def tune_models(workers=None, threads_per_worker=1, model_types=None):
+    """Búsqueda de hiperparámetros de ligas × tipos de modelo (la usa el siguiente --train)"""
+    logger.info("Ejecutando tuning de hiperparámetros...")
+    try:
+        from tuning import tune_all
+        for result in tune_all(model_types=model_types, workers=workers, threads_per_worker=threads_per_worker):
+            if result['error']:
+                logger.warning(f"Tuning {result['model_type']} de {result['league']} falló: {result['error']}")
+            else:
+                logger.info(
+                    f"Tuning {result['model_type']} de {result['league']}: log loss {result['score']:.4f}, "
+                    f"{result['folds_computed']} folds calculados, {result['folds_cached']} de caché "
+                    f"({result['seconds']:.1f}s)"
+                )
+    except Exception as e:
+        logger.error(f"❌ Error en el tuning: {e}")
+    return True
+
 def main():
     parser = argparse.ArgumentParser(description='SportsPred Dashboard Manager')
     parser.add_argument('--setup', action='store_true', help='Configuración inicial completa')
@@ -91,26 +139,55 @@ def main():
     parser.add_argument('--train', action='store_true', help='Entrenar modelos')
     parser.add_argument('--run', action='store_true', help='Ejecutar aplicación')
     parser.add_argument('--scheduler', action='store_true', help='Iniciar scheduler')
+    parser.add_argument('--preflight', action='store_true',
+                        help='Comprobar dependencias y precalentar imports (también antes de --run)')
+    parser.add_argument('--install', action='store_true', help='Con --preflight, instalar las dependencias que falten')
+    parser.add_argument('--seasons', type=int, default=2, help='Temporadas de historial mock por liga')
+    parser.add_argument('--workers', type=int, default=None, help='Procesos de entrenamiento en paralelo')
+    parser.add_argument('--threads', type=int, default=1, help='Hilos por proceso de entrenamiento')
+    parser.add_argument('--model-types', nargs='+', default=None,
+                        help='Tipos de modelo a entrenar (xgboost, random_forest, gradient_boosting)')
+    parser.add_argument('--backtest', action='store_true',
+                        help='Backtesting walk-forward de los modelos (usa --workers, --threads, --model-types)')
+    parser.add_argument('--backtest-seasons', type=int, default=None, help='Temporadas simuladas en el backtesting')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Con --train, actualizar los modelos solo con los partidos nuevos')
+    parser.add_argument('--tune', action='store_true',
+                        help='Buscar hiperparámetros antes de entrenar (usa --workers, --threads, --model-types)')
     
     args = parser.parse_args()
     
+    if args.preflight or args.run:
+        from preflight import run_preflight
+        if not run_preflight(install=args.install, force=args.preflight):
+            sys.exit(1)
+    
     if args.setup or args.db_only:
         setup_directories()
         setup_database()
     
     if args.setup or args.mock_data:
-        generate_mock_data()
+        generate_mock_data(args.seasons)
+    
+    if args.tune:
+        tune_models(args.workers, args.threads, args.model_types)
     
     if args.setup or args.train:
-        train_initial_models()
+        train_initial_models(args.workers, args.threads, args.model_types, args.incremental)
+    
+    if args.backtest:
+        run_backtests(args.workers, args.threads, args.model_types, args.backtest_seasons)
     
     if args.scheduler:
+        from scheduler import init_scheduler, shutdown_scheduler
         init_scheduler()
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
         logger.info("Scheduler iniciado. Presiona Ctrl+C para detener.")
         try:
-            while True:
-                pass
-        except KeyboardInterrupt:
+            # Espera bloqueante: el proceso queda inactivo entre jobs
+            threading.Event().wait()
+        except (KeyboardInterrupt, SystemExit):
+            shutdown_scheduler()
             logger.info("Scheduler detenido")
     
     if args.run:
@@ -1 +1,211 @@
+"""
+Servicio de tareas programadas (APScheduler) para SportsPred Dashboard
+"""
 
+import logging
+from typing import Dict, List, Optional
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.executors.pool import ThreadPoolExecutor
+
+from config import Leagues, MODEL_CONFIG, ODDS_HISTORY_CONFIG, SCHEDULER_CONFIG
+from database import engine, SessionLocal, Match, bump_data_version
+
+logger = logging.getLogger(__name__)
+
+_scheduler: Optional[BackgroundScheduler] = None
+
+
+def refresh_odds() -> int:
+    """
+    Actualiza las cuotas de los partidos programados: con clave de odds_api, todas
+    las ligas en una ronda de peticiones concurrentes (DataFetcher.get_odds_for_leagues);
+    si no, las del scraper
+    """
+    from data_fetcher import DataFetcher, FreeDataFetcher
+    from odds_store import OddsStore
+    from teams import get_team_registry
+
+    by_league = DataFetcher().get_odds_for_leagues([league.value for league in Leagues])
+    odds_list = [item for items in by_league.values() for item in items]
+    provider = 'odds_api'
+    if not odds_list:
+        odds_list = FreeDataFetcher().scrape_odds_from_website()
+        provider = 'scraper'
+    if not odds_list:
+        # Sin datos reales no se guarda nada (nunca cuotas de ejemplo como precio de mercado)
+        logger.warning("Sin cuotas de odds_api ni del scraper: no se actualiza ningún partido")
+        return 0
+    # Los nombres del proveedor se resuelven al mismo ID que los de la base de datos
+    registry = get_team_registry()
+    home_ids = registry.resolve_many([item['home_team'] for item in odds_list], provider=provider)
+    away_ids = registry.resolve_many([item['away_team'] for item in odds_list], provider=provider)
+    db = SessionLocal()
+    snapshots: Dict[str, List[Dict]] = {}
+    try:
+        for item, home_id, away_id in zip(odds_list, home_ids.tolist(), away_ids.tolist()):
+            match = (
+                db.query(Match)
+                .filter(
+                    Match.home_team_id == home_id,
+                    Match.away_team_id == away_id,
+                    Match.status == 'scheduled'
+                )
+                .order_by(Match.date)
+                .first()
+            )
+            if match is not None:
+                # Match.odds guarda solo el 1X2 plano; el resto de mercados va al historial
+                match.odds = {key: price for key, price in item['odds'].items() if not isinstance(price, dict)}
+                snapshots.setdefault(item.get('bookmaker') or provider, []).append(
+                    {'match_id': match.id, 'odds': item['odds']}
+                )
+        db.commit()
+    finally:
+        db.close()
+
+    store = OddsStore()
+    changes = sum(store.record_odds(items, bookmaker=bookmaker) for bookmaker, items in snapshots.items())
+    if changes:
+        bump_data_version('odds')
+    updated = len({snapshot['match_id'] for items in snapshots.values() for snapshot in items})
+    logger.info(f"Cuotas de {provider} actualizadas para {updated} partidos ({changes} cambios de precio)")
+    return updated
+
+
+def rollup_odds_history() -> int:
+    """Archiva en Parquet el historial de cuotas de partidos terminados hace tiempo"""
+    from odds_store import OddsStore
+
+    return OddsStore().rollup()
+
+
+def ingest_finished_matches() -> int:
+    """Procesa los partidos que han pasado a 'finished' desde la última ejecución"""
+    import aggregates
+    import settlement
+    from feature_store import FeatureStore
+    from goal_model import fit_league
+    from teams import get_team_registry
+
+    # Partidos llegados por otras vías sin IDs de equipo
+    get_team_registry().backfill_matches()
+
+    db = SessionLocal()
+    new_rows = 0
+    try:
+        store = FeatureStore(db)
+        for league in Leagues:
+            added = store.update(league.value)
+            if added:
+                # Reajuste en caliente del modelo de goles tras la jornada
+                fit_league(engine, league.value)
+            new_rows += added
+    finally:
+        db.close()
+
+    # Suma los partidos nuevos a las tablas por equipo y temporada
+    aggregated = aggregates.update(engine)
+    if new_rows or aggregated:
+        bump_data_version('matches')
+    # Apuestas pendientes de los partidos terminados
+    settlement.settle_finished(engine)
+    logger.info(f"Ingesta completada: {new_rows} partidos terminados nuevos")
+    return new_rows
+
+
+def refresh_dashboard_metrics():
+    """Precalcula las métricas del dashboard (partidos de hoy, en vivo, valor detectado)"""
+    import aggregates
+
+    metrics = aggregates.refresh_dashboard_metrics(engine)
+    logger.info(f"Métricas del dashboard actualizadas ({len(metrics)} valores)")
+
+
+def retrain_models():
+    """Actualiza (o reentrena desde cero, según MODEL_CONFIG) los modelos de todas las ligas"""
+    from training import train_all
+
+    results = train_all(
+        workers=SCHEDULER_CONFIG['training_workers'],
+        threads_per_worker=SCHEDULER_CONFIG['training_threads'],
+        incremental=MODEL_CONFIG['incremental_training']
+    )
+    failed = [r for r in results if r['error']]
+    logger.info(f"Reentrenamiento completado: {len(results) - len(failed)} modelos, {len(failed)} fallos")
+
+
+# Definición de los jobs (solo se usa para los que aún no están en el job store)
+_JOBS = [
+    {
+        'func': 'scheduler:refresh_odds', 'trigger': 'interval',
+        'minutes': SCHEDULER_CONFIG['odds_refresh_minutes'],
+        'id': 'refresh_odds', 'name': 'Actualizar cuotas',
+    },
+    {
+        'func': 'scheduler:ingest_finished_matches', 'trigger': 'interval',
+        'minutes': SCHEDULER_CONFIG['ingest_minutes'],
+        'id': 'ingest_finished_matches', 'name': 'Ingesta de partidos terminados',
+    },
+    {
+        'func': 'scheduler:refresh_dashboard_metrics', 'trigger': 'interval',
+        'minutes': SCHEDULER_CONFIG['metrics_refresh_minutes'],
+        'id': 'refresh_dashboard_metrics', 'name': 'Métricas del dashboard',
+    },
+    {
+        'func': 'scheduler:retrain_models', 'trigger': 'interval',
+        'hours': MODEL_CONFIG['retrain_interval_hours'],
+        'id': 'retrain_models', 'name': 'Reentrenar modelos',
+    },
+    {
+        'func': 'scheduler:rollup_odds_history', 'trigger': 'cron',
+        'hour': ODDS_HISTORY_CONFIG['rollup_hour'],
+        'id': 'rollup_odds_history', 'name': 'Archivar historial de cuotas',
+    },
+]
+
+
+def init_scheduler(start: bool = True) -> BackgroundScheduler:
+    """
+    Crea (una sola vez) el scheduler en segundo plano con un job store persistente
+    en la base de datos. Los jobs se fusionan si se acumulan ejecuciones
+    (coalesce) y nunca corren dos instancias del mismo job a la vez. Un reinicio
+    no reprograma los jobs guardados (para cambiar un intervalo hay que borrar el
+    job de scheduler_jobs). Con start=False el scheduler queda en pausa.
+    """
+    global _scheduler
+    if _scheduler is not None:
+        return _scheduler
+
+    scheduler = BackgroundScheduler(
+        jobstores={'default': SQLAlchemyJobStore(engine=engine, tablename='scheduler_jobs')},
+        executors={'default': ThreadPoolExecutor(SCHEDULER_CONFIG['max_workers'])},
+        job_defaults={
+            'coalesce': True,
+            'max_instances': 1,
+            'misfire_grace_time': SCHEDULER_CONFIG['misfire_grace_seconds'],
+        },
+        timezone='UTC'
+    )
+
+    # Los jobs ya guardados conservan su próxima ejecución: solo se añaden los que faltan
+    scheduler.start(paused=True)
+    for job in _JOBS:
+        if scheduler.get_job(job['id']) is None:
+            scheduler.add_job(**job)
+
+    if start:
+        scheduler.resume()
+        logger.info("Scheduler iniciado con jobs: " + ", ".join(job.id for job in scheduler.get_jobs()))
+
+    _scheduler = scheduler
+    return scheduler
+
+
+def shutdown_scheduler(wait: bool = True):
+    """Detiene el scheduler esperando a que terminen los jobs en curso"""
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.shutdown(wait=wait)
+        _scheduler = None
@@ -0,0 +1,224 @@
+"""
+Liquidación de apuestas (bets) de los partidos terminados
+
+Todo se resuelve en SQL por lotes de partidos, sin cargar objetos del ORM:
+
+1. Los pares (bet_type, selection) distintos de las apuestas sin códigos se
+   traducen en Python a market/selection_code (los de odds_store).
+2. Un UPDATE ... FROM calcula con CASE el resultado de cada apuesta pendiente a
+   partir del marcador (y de los córners de match_stats) y fija status,
+   settled_at y los códigos. Las líneas exactas (over 2.0 con 2 goles) quedan 'void'.
+3. Otro UPDATE ... FROM suma a User.balance las ganancias del lote (cuota * stake
+   si gana, el stake si es nula); el stake se descontó al colocar la apuesta.
+   Se calcula siempre desde stake y odds: potential_win es el beneficio neto
+   (utils.calculate_potential_win), no el retorno.
+
+Cada lote es una transacción y solo toca apuestas 'pending', así que repetir la
+liquidación no cambia nada. Las apuestas de córners sin estadísticas del partido
+y las que no se pueden interpretar siguen pendientes.
+"""
+
+import re
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text, bindparam
+
+from config import BETTING_CONFIG, BetTypes
+from database import engine as default_engine, bump_data_version
+from odds_store import (
+    MARKET_CODES, FIXED_SELECTIONS, LINE_MARKETS, LINE_SIDES, market_code, encode_selection
+)
+
+logger = logging.getLogger(__name__)
+
+_M = {market: MARKET_CODES[market.value] for market in BetTypes}
+
+# Nombres de mercado y selecciones que usa la app además de los de odds_store
+_MARKET_ALIASES = {
+    "1x2": BetTypes.WIN_DRAW_WIN, "ganador": BetTypes.WIN_DRAW_WIN, "resultado": BetTypes.WIN_DRAW_WIN,
+    "over/under": BetTypes.OVER_UNDER, "goles": BetTypes.OVER_UNDER, "total goles": BetTypes.OVER_UNDER,
+    "ambos marcan": BetTypes.BOTH_SCORE, "btts": BetTypes.BOTH_SCORE,
+    "resultado exacto": BetTypes.EXACT_SCORE, "marcador exacto": BetTypes.EXACT_SCORE,
+    "doble oportunidad": BetTypes.DOUBLE_CHANCE,
+    "córners": BetTypes.CORNERS, "corners": BetTypes.CORNERS, "total tiros de esquina": BetTypes.CORNERS,
+}
+_SELECTION_ALIASES = {
+    "local": "1", "local ganador": "1", "empate": "X", "visitante": "2", "visitante ganador": "2",
+    "x": "X", "sí": "yes", "si": "yes", "1x": "1X", "x2": "X2",
+}
+_LINE_PATTERN = re.compile(r"^(over|under|más de|mas de|menos de)[\s_]*([0-9]+(?:[.,][0-9]+)?)")
+_LINE_WORDS = {"más de": "over", "mas de": "over", "menos de": "under"}
+_SCORE_PATTERN = re.compile(r"^(\d+)\s*[-:]\s*(\d+)$")
+
+
+def bet_codes(bet_type: str, selection: str) -> Optional[Tuple[int, int]]:
+    """
+    (market, selection_code) de una apuesta con el mercado y la selección como
+    texto libre ('1X2' / 'Local ganador', 'Over/Under' / 'Over 2.5'...). None si
+    no se reconoce.
+    """
+    try:
+        market = market_code(bet_type)
+    except KeyError:
+        alias = _MARKET_ALIASES.get(str(bet_type).strip().lower())
+        if alias is None:
+            return None
+        market = _M[alias]
+
+    value = str(selection).strip()
+    lowered = value.lower()
+    try:
+        if market in LINE_MARKETS:
+            found = _LINE_PATTERN.match(lowered)
+            if not found:
+                return None
+            side = _LINE_WORDS.get(found.group(1), found.group(1))
+            return market, encode_selection(market, f"{side}_{found.group(2).replace(',', '.')}")
+        if market in FIXED_SELECTIONS:
+            return market, encode_selection(market, _SELECTION_ALIASES.get(lowered, lowered))
+        found = _SCORE_PATTERN.match(lowered)
+        return (market, encode_selection(market, f"{found.group(1)}-{found.group(2)}")) if found else None
+    except (KeyError, ValueError):
+        return None
+
+
+# Código efectivo de la apuesta: el guardado o, si aún no lo tiene, el de la tabla `codes`
+_MK = "COALESCE(b.market, codes.market)"
+_SC = "COALESCE(b.selection_code, codes.selection_code)"
+
+
+def _line(value: str) -> str:
+    """Resultado de una selección over/under sobre el total `value` (en décimas: código // 10)"""
+    return f"""CASE
+            WHEN {value} IS NULL THEN NULL
+            WHEN {value} * 10 = {_SC} / 10 THEN 'void'
+            WHEN ({_SC} % 10 = {LINE_SIDES['over']} AND {value} * 10 > {_SC} / 10)
+              OR ({_SC} % 10 = {LINE_SIDES['under']} AND {value} * 10 < {_SC} / 10)
+            THEN 'won' ELSE 'lost' END"""
+
+
+# Resultado de cada apuesta pendiente de los partidos del lote (NULL = aún no se puede
+# liquidar). {codes} es un SELECT ... UNION ALL con los códigos de los pares
+# (bet_type, selection) que aún no los tienen guardados (ver _codes_subquery).
+_OUTCOME = f"""
+    SELECT b.id, {_MK} AS market, {_SC} AS selection_code, CASE {_MK}
+        WHEN {_M[BetTypes.WIN_DRAW_WIN]} THEN CASE WHEN {_SC} =
+            CASE WHEN m.home_score > m.away_score THEN 1 WHEN m.home_score = m.away_score THEN 2 ELSE 3 END
+            THEN 'won' ELSE 'lost' END
+        WHEN {_M[BetTypes.DOUBLE_CHANCE]} THEN CASE
+            WHEN ({_SC} = 1 AND m.home_score >= m.away_score)
+              OR ({_SC} = 2 AND m.home_score <> m.away_score)
+              OR ({_SC} = 3 AND m.home_score <= m.away_score)
+            THEN 'won' ELSE 'lost' END
+        WHEN {_M[BetTypes.BOTH_SCORE]} THEN CASE WHEN {_SC} =
+            CASE WHEN m.home_score > 0 AND m.away_score > 0 THEN 1 ELSE 2 END
+            THEN 'won' ELSE 'lost' END
+        WHEN {_M[BetTypes.EXACT_SCORE]} THEN CASE
+            WHEN m.home_score * 100 + m.away_score = {_SC} THEN 'won' ELSE 'lost' END
+        WHEN {_M[BetTypes.OVER_UNDER]} THEN {_line('(m.home_score + m.away_score)')}
+        WHEN {_M[BetTypes.CORNERS]} THEN {_line('(ms.home_corners + ms.away_corners)')}
+    END AS outcome
+    FROM bets b
+    JOIN matches m ON m.id = b.match_id
+    LEFT JOIN match_stats ms ON ms.match_id = m.id
+    LEFT JOIN ({{codes}}) AS codes ON codes.bet_type = b.bet_type AND codes.selection = b.selection
+    WHERE b.match_id IN :match_ids
+    AND b.status = 'pending'
+    AND m.status = 'finished' AND m.home_score IS NOT NULL AND m.away_score IS NOT NULL
+"""
+
+# Un solo UPDATE por lote: guarda los códigos y fija el resultado
+_SETTLE = f"""
+UPDATE bets SET market = r.market, selection_code = r.selection_code, status = r.outcome, settled_at = :now
+FROM ({_OUTCOME}) AS r
+WHERE bets.id = r.id AND r.outcome IS NOT NULL
+"""
+
+# Ganancias del lote: las apuestas que el UPDATE anterior acaba de liquidar (settled_at = :now)
+_CREDIT = text("""
+UPDATE users SET balance = COALESCE(users.balance, 0) + credit.amount
+FROM (
+    SELECT user_id, SUM(CASE status
+        WHEN 'won' THEN stake * odds
+        WHEN 'void' THEN stake
+        ELSE 0 END) AS amount
+    FROM bets
+    WHERE match_id IN :match_ids AND settled_at = :now AND status IN ('won', 'void')
+    GROUP BY user_id
+) AS credit
+WHERE users.id = credit.user_id
+""").bindparams(bindparam("match_ids", expanding=True))
+
+_UNCODED = text("""
+SELECT DISTINCT bet_type, selection FROM bets
+WHERE match_id IN :match_ids AND status = 'pending' AND selection_code IS NULL
+""").bindparams(bindparam("match_ids", expanding=True))
+
+_SETTLEABLE = text("""
+SELECT DISTINCT b.match_id
+FROM bets b JOIN matches m ON m.id = b.match_id
+WHERE b.status = 'pending' AND m.status = 'finished' AND m.home_score IS NOT NULL
+ORDER BY b.match_id
+""")
+
+
+def _codes_subquery(conn, match_ids: List[int]) -> Tuple[str, Dict]:
+    """
+    SELECT con (bet_type, selection, market, selection_code) de los pares sin
+    códigos de las apuestas pendientes del lote, y sus parámetros
+    """
+    pairs = conn.execute(_UNCODED, {"match_ids": match_ids}).fetchall()
+    rows, params, unknown = [], {}, []
+    for bet_type, selection in pairs:
+        codes = bet_codes(bet_type, selection)
+        if codes is None:
+            unknown.append(f"{bet_type}: {selection}")
+            continue
+        i = len(rows)
+        rows.append(f"SELECT :bt{i} AS bet_type, :sel{i} AS selection, :mk{i} AS market, :sc{i} AS selection_code")
+        params.update({f"bt{i}": bet_type, f"sel{i}": selection, f"mk{i}": codes[0], f"sc{i}": codes[1]})
+    if unknown:
+        logger.warning(f"Apuestas sin interpretar (quedan pendientes): {', '.join(unknown[:10])}")
+    if not rows:
+        rows = ["SELECT NULL AS bet_type, NULL AS selection, NULL AS market, NULL AS selection_code WHERE 1 = 0"]
+    return " UNION ALL ".join(rows), params
+
+
+def settle_matches(match_ids: List[int], bind=None) -> Dict[str, int]:
+    """
+    Liquida en una transacción las apuestas pendientes de los partidos dados.
+    Devuelve cuántas apuestas se liquidaron y cuántos usuarios recibieron saldo.
+    """
+    bind = bind or default_engine
+    match_ids = [int(match_id) for match_id in match_ids]
+    if not match_ids:
+        return {"settled": 0, "credited_users": 0}
+
+    now = datetime.utcnow()
+    with bind.begin() as conn:
+        codes, params = _codes_subquery(conn, match_ids)
+        statement = text(_SETTLE.format(codes=codes)).bindparams(bindparam("match_ids", expanding=True))
+        settled = conn.execute(statement, {**params, "match_ids": match_ids, "now": now}).rowcount
+        credited = conn.execute(_CREDIT, {"match_ids": match_ids, "now": now}).rowcount if settled else 0
+    return {"settled": settled, "credited_users": credited}
+
+
+def settle_finished(bind=None, batch_size: Optional[int] = None) -> int:
+    """
+    Liquida las apuestas pendientes de todos los partidos terminados, por lotes
+    de batch_size partidos (una transacción por lote). Devuelve las apuestas liquidadas.
+    """
+    bind = bind or default_engine
+    batch_size = batch_size or BETTING_CONFIG["settlement_batch_matches"]
+    with bind.connect() as conn:
+        match_ids = [row[0] for row in conn.execute(_SETTLEABLE)]
+
+    total = 0
+    for start in range(0, len(match_ids), batch_size):
+        total += settle_matches(match_ids[start:start + batch_size], bind)["settled"]
+    if total:
+        bump_data_version('bets', bind)
+        logger.info(f"Liquidación: {total} apuestas de {len(match_ids)} partidos")
+    return total
@@ -0,0 +1,246 @@
+"""
+Resolución de equipos: nombres de distintos proveedores -> un ID entero
+
+Cada nombre se normaliza (sin acentos, minúsculas, sin puntuación ni palabras
+genéricas como "FC" o "de") y se busca en team_aliases. Los alias conocidos de
+KNOWN_ALIASES hacen que "Inter", "Internazionale" e "Inter de Milán" resuelvan
+al mismo equipo; los nombres nuevos crean un equipo y su alias. El registro vive
+en memoria (dict alias -> id) y solo va a la base de datos para persistir lo nuevo,
+así que cruces, agrupaciones y arrays de características trabajan con enteros.
+"""
+
+import re
+import logging
+import threading
+import unicodedata
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, insert, update, bindparam, text
+from sqlalchemy.exc import IntegrityError
+
+from database import engine as default_engine, Team, TeamAlias, Match
+
+logger = logging.getLogger(__name__)
+
+# Palabras que no distinguen a un club
+_GENERIC_TOKENS = {"fc", "cf", "afc", "sc", "ssc", "as", "ss", "ac", "club", "de", "the", "1"}
+
+# Nombre canónico -> nombres usados por otras fuentes
+KNOWN_ALIASES = {
+    "Inter de Milán": ["Inter", "Internazionale", "Inter Milan", "FC Internazionale Milano"],
+    "AC Milan": ["Milan"],
+    "Juventus": ["Juve", "Juventus FC"],
+    "Napoli": ["SSC Napoli"],
+    "Roma": ["AS Roma"],
+    "Lazio": ["SS Lazio"],
+    "Atlético Madrid": ["Atlético de Madrid", "Club Atlético de Madrid", "Atleti"],
+    "Athletic Club": ["Athletic Bilbao"],
+    "Celta de Vigo": ["Celta Vigo", "Celta"],
+    "Real Betis": ["Betis", "Real Betis Balompié"],
+    "Barcelona": ["FC Barcelona", "Barça", "Barca"],
+    "Manchester United": ["Man United", "Man Utd"],
+    "Manchester City": ["Man City"],
+    "Tottenham": ["Tottenham Hotspur", "Spurs"],
+    "Newcastle": ["Newcastle United"],
+    "West Ham": ["West Ham United"],
+    "Brighton": ["Brighton & Hove Albion", "Brighton and Hove Albion"],
+    "Wolves": ["Wolverhampton", "Wolverhampton Wanderers"],
+    "Nottingham Forest": ["Nott'm Forest"],
+    "Bayern München": ["Bayern Munich", "FC Bayern München", "Bayern"],
+    "Borussia Dortmund": ["Dortmund", "BVB"],
+    "Mönchengladbach": ["Borussia Mönchengladbach", "Gladbach"],
+    "Köln": ["1. FC Köln"],
+    "Bayer Leverkusen": ["Leverkusen", "Bayer 04 Leverkusen"],
+    "PSG": ["Paris Saint-Germain", "Paris SG", "Paris Saint Germain"],
+    "Marseille": ["Olympique de Marseille", "OM"],
+    "Lyon": ["Olympique Lyonnais", "OL"],
+}
+
+
+@lru_cache(maxsize=4096)
+def normalize_name(name: str) -> str:
+    """'FC Internazionale Milano' -> 'internazionale milano'"""
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    tokens = re.sub(r"[^a-z0-9]+", " ", ascii_name.lower()).split()
+    meaningful = [token for token in tokens if token not in _GENERIC_TOKENS]
+    return " ".join(meaningful or tokens)
+
+
+_STATIC_ALIASES = {
+    normalize_name(alias): canonical
+    for canonical, aliases in KNOWN_ALIASES.items()
+    for alias in [canonical, *aliases]
+}
+
+
+def canonical_name(name: str) -> str:
+    """Nombre canónico de un equipo según KNOWN_ALIASES (sin base de datos)"""
+    return _STATIC_ALIASES.get(normalize_name(name), name)
+
+
+def canonical_key(name: str) -> str:
+    """Clave estable de un equipo, igual para todos sus alias conocidos"""
+    return normalize_name(canonical_name(name))
+
+
+class TeamRegistry:
+    """Alias normalizado -> team_id, cargado una vez y ampliado al ver nombres nuevos"""
+
+    def __init__(self, bind=None):
+        self.bind = bind or default_engine
+        self._lock = threading.RLock()
+        self._ids: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        self.load()
+
+    def load(self):
+        with self.bind.connect() as conn:
+            teams = conn.execute(select(Team.id, Team.name)).fetchall()
+            aliases = conn.execute(select(TeamAlias.alias, TeamAlias.team_id)).fetchall()
+        with self._lock:
+            self._names = dict(teams)
+            self._ids = dict(aliases)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def name(self, team_id: int) -> Optional[str]:
+        return self._names.get(team_id)
+
+    def names(self, team_ids: Iterable[int]) -> List[Optional[str]]:
+        return [self._names.get(team_id) for team_id in team_ids]
+
+    def resolve(self, name: str, league: Optional[str] = None, provider: Optional[str] = None,
+                create: bool = True) -> Optional[int]:
+        """ID del equipo (None si no existe y create=False)"""
+        team_id = int(self.resolve_many([name], league, provider, create)[0])
+        return team_id if team_id >= 0 else None
+
+    def resolve_many(self, names, league: Optional[str] = None, provider: Optional[str] = None,
+                     create: bool = True) -> np.ndarray:
+        """
+        IDs (int64) de un array de nombres, resolviendo una vez cada nombre distinto.
+        Sin create los desconocidos valen -1.
+        """
+        positions, unique_names = pd.factorize(np.asarray(names, dtype=object))
+        keys = [normalize_name(str(name)) for name in unique_names]
+        missing = [(name, key) for name, key in zip(unique_names, keys) if key not in self._ids]
+        if missing and create:
+            try:
+                self._register(missing, league, provider)
+            except IntegrityError:
+                # Otro proceso registró el mismo equipo a la vez: se relee el registro
+                self.load()
+                self._register([(name, key) for name, key in missing if key not in self._ids], league, provider)
+        # Los alias de KNOWN_ALIASES que aún no se han visto resuelven a su equipo canónico
+        ids = np.array([
+            self._ids.get(key, self._ids.get(normalize_name(canonical_name(str(name))), -1))
+            for name, key in zip(unique_names, keys)
+        ], dtype=np.int64)
+        return ids[positions]
+
+    def _register(self, missing: List[tuple], league: Optional[str], provider: Optional[str]):
+        """Crea los equipos que falten (o enlaza el alias al equipo canónico)"""
+        with self._lock, self.bind.begin() as conn:
+            by_name = {name: team_id for team_id, name in self._names.items()}
+            aliases = []
+            for name, key in missing:
+                if key in self._ids:
+                    continue
+                canonical = canonical_name(name)
+                team_id = self._ids.get(normalize_name(canonical), by_name.get(canonical))
+                if team_id is None:
+                    team_id = conn.execute(
+                        insert(Team).values(name=canonical, league=league, created_at=datetime.utcnow())
+                    ).inserted_primary_key[0]
+                    by_name[canonical] = team_id
+                    self._names[team_id] = canonical
+                    logger.debug(f"Equipo nuevo: {canonical} (id {team_id})")
+                # El alias del nombre canónico también se registra
+                for alias in {key, normalize_name(canonical)} - set(self._ids):
+                    self._ids[alias] = team_id
+                    aliases.append({"alias": alias, "team_id": team_id, "provider": provider})
+            if aliases:
+                conn.execute(insert(TeamAlias), aliases)
+
+    def add_alias(self, alias: str, team_id: int, provider: Optional[str] = None):
+        """Enlaza a mano un nombre de un proveedor con un equipo existente"""
+        key = normalize_name(alias)
+        with self._lock, self.bind.begin() as conn:
+            if key in self._ids:
+                conn.execute(update(TeamAlias).where(TeamAlias.alias == key).values(team_id=team_id))
+            else:
+                conn.execute(insert(TeamAlias).values(alias=key, team_id=team_id, provider=provider))
+            self._ids[key] = team_id
+
+    def backfill_matches(self) -> int:
+        """Asigna home_team_id/away_team_id a los partidos que aún no los tienen"""
+        with self.bind.connect() as conn:
+            rows = conn.execute(text("""
+            SELECT DISTINCT league, home_team FROM matches WHERE home_team_id IS NULL
+            UNION
+            SELECT DISTINCT league, away_team FROM matches WHERE away_team_id IS NULL
+            """)).fetchall()
+        if not rows:
+            return 0
+
+        names = pd.DataFrame(rows, columns=["league", "team"]).drop_duplicates("team")
+        for league, group in names.groupby("league", sort=False, dropna=False):
+            self.resolve_many(group["team"], league=league)
+        params = [{"name": name, "team_id": self._ids[normalize_name(name)]} for name in names["team"]]
+        table = Match.__table__
+        updated = 0
+        with self.bind.begin() as conn:
+            for side in ("home", "away"):
+                updated += conn.execute(
+                    update(table)
+                    .where(table.c[f"{side}_team"] == bindparam("name"), table.c[f"{side}_team_id"].is_(None))
+                    .values({f"{side}_team_id": bindparam("team_id")}),
+                    params
+                ).rowcount
+        logger.info(f"Equipos: {updated} referencias de partidos enlazadas")
+        return updated
+
+
+_registries: Dict[str, TeamRegistry] = {}
+_registry_lock = threading.Lock()
+
+
+def get_team_registry(bind=None) -> TeamRegistry:
+    """Registro compartido por base de datos"""
+    bind = bind or default_engine
+    key = str(bind.url)
+    with _registry_lock:
+        if key not in _registries:
+            _registries[key] = TeamRegistry(bind)
+        return _registries[key]
+
+
+def team_ids(frame: pd.DataFrame, bind=None, create: bool = True) -> tuple:
+    """
+    (home_ids, away_ids) de un DataFrame de partidos: las columnas home_team_id /
+    away_team_id si existen y, para las filas sin ID, el nombre resuelto en el
+    registro de `bind`. Sin create (rutas de solo lectura) no se registran equipos:
+    cada nombre desconocido recibe un ID negativo propio (-2, -3, ...), que no
+    coincide con ningún equipo del registro ni con los demás desconocidos.
+    """
+    registry = None
+    unknown: Dict[str, int] = {}
+    result = []
+    for side in ("home", "away"):
+        ids = frame[f"{side}_team_id"] if f"{side}_team_id" in frame else pd.Series(np.nan, index=frame.index)
+        missing = ids.isna().to_numpy()
+        values = ids.fillna(-1).to_numpy(dtype=np.int64)
+        if missing.any():
+            registry = registry or get_team_registry(bind)
+            names = frame[f"{side}_team"].to_numpy()[missing]
+            resolved = registry.resolve_many(names, create=create)
+            for i in np.flatnonzero(resolved < 0):
+                resolved[i] = unknown.setdefault(normalize_name(str(names[i])), -2 - len(unknown))
+            values[missing] = resolved
+        result.append(values)
+    return tuple(result)
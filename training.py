@@ -0,0 +1,131 @@
+"""
+Entrenamiento paralelo de modelos por liga y tipo de modelo
+"""
+
+import os
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from config import Leagues
+
+# Este módulo no importa numpy/sklearn al nivel superior: los workers se crean con
+# 'spawn' y deben fijar los límites de hilos antes de cargar las librerías nativas.
+
+logger = logging.getLogger(__name__)
+
+MODEL_TYPES = ['xgboost', 'random_forest', 'gradient_boosting']
+
+_THREAD_ENV_VARS = [
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+]
+
+
+def _init_worker(threads: int):
+    """Limita los hilos nativos de cada worker a su presupuesto"""
+    for var in _THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+
+def _train_one(league: str, model_type: str, threads: int, incremental: bool = False) -> Dict:
+    """
+    Entrena un modelo en el worker con su propia sesión de base de datos
+    (incremental: solo con los partidos nuevos, ver BettingPredictor.update_model)
+    """
+    from database import SessionLocal
+    from ml_model import BettingPredictor
+
+    start = time.perf_counter()
+    db = SessionLocal()
+    try:
+        predictor = BettingPredictor(db)
+        train = predictor.update_model if incremental else predictor.train_model
+        accuracy = train(league, model_type, n_jobs=threads)
+    finally:
+        db.close()
+
+    return {
+        'league': league,
+        'model_type': model_type,
+        'accuracy': accuracy,
+        'seconds': time.perf_counter() - start,
+        'error': None
+    }
+
+
+def _refresh_feature_store(leagues: List[str]):
+    """Actualiza el feature store antes de repartir trabajo (evita escrituras concurrentes)"""
+    from database import SessionLocal
+    from feature_store import FeatureStore
+
+    db = SessionLocal()
+    try:
+        store = FeatureStore(db)
+        for league in leagues:
+            store.update(league)
+    finally:
+        db.close()
+
+
+def train_all(leagues: Optional[List[str]] = None,
+              model_types: Optional[List[str]] = None,
+              workers: Optional[int] = None,
+              threads_per_worker: int = 1,
+              incremental: bool = False) -> List[Dict]:
+    """
+    Entrena ligas × tipos de modelo en un ProcessPoolExecutor.
+
+    Cada tarea escribe data/models/{league}_{model_type}_{version}.joblib y su fila en
+    ml_models. Por defecto usa todas las ligas de config.Leagues, todos los
+    MODEL_TYPES y tantos workers como quepan en los núcleos disponibles. Con
+    incremental=True cada modelo se actualiza con los partidos nuevos y solo se
+    reentrena desde cero cuando toca (MODEL_CONFIG['full_rebuild_every']).
+    """
+    leagues = leagues or [league.value for league in Leagues]
+    model_types = model_types or MODEL_TYPES
+    threads_per_worker = max(1, threads_per_worker)
+    tasks = [(league, model_type) for league in leagues for model_type in model_types]
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) // threads_per_worker)
+    workers = max(1, min(workers, len(tasks)))
+
+    _refresh_feature_store(leagues)
+
+    logger.info(
+        f"{'Actualizando' if incremental else 'Entrenando'} {len(tasks)} modelos con {workers} workers "
+        f"({threads_per_worker} hilos por worker)"
+    )
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(threads_per_worker,)
+    ) as executor:
+        futures = {
+            executor.submit(_train_one, league, model_type, threads_per_worker, incremental): (league, model_type)
+            for league, model_type in tasks
+        }
+        for future in as_completed(futures):
+            league, model_type = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Error entrenando {model_type} para {league}: {e}")
+                result = {'league': league, 'model_type': model_type, 'accuracy': None,
+                          'seconds': None, 'error': str(e)}
+            results.append(result)
+
+    logger.info(f"Entrenamiento completo en {time.perf_counter() - start:.1f}s")
+    return results
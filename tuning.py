@@ -0,0 +1,269 @@
+"""
+Búsqueda de hiperparámetros con validación temporal, successive halving y caché
+
+Por liga y tipo de modelo se muestrean n_trials combinaciones del espacio de
+TUNING_CONFIG y se evalúan con TimeSeriesSplit (entrenar con el pasado, validar
+con el bloque siguiente; log loss) sobre los mismos partidos con los que
+entrena BettingPredictor.train_model (prepare_training_data), para que los
+parámetros elegidos correspondan al tamaño de datos con que se usan.
+Successive halving: la primera ronda evalúa todas las combinaciones en el fold
+más reciente, cada ronda siguiente conserva 1/eta de ellas y añade folds hasta
+llegar a todos.
+
+Cada fold evaluado se guarda en tuning_results con la versión de los datos
+(FeatureStore.data_version) y el hash de los parámetros, así que repetir la
+búsqueda sin datos nuevos no reentrena nada. Los folds pendientes se reparten en
+un ProcessPoolExecutor; los workers leen X/y de un fichero joblib (mmap) en vez
+de la base de datos. La mejor combinación se registra en model_hyperparameters
+y BettingPredictor.train_model la usa.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+from sqlalchemy import select, insert
+from sqlalchemy.orm import Session
+
+from config import TUNING_CONFIG, Leagues
+from database import engine as default_engine, TuningResult
+from features import FEATURE_COLUMNS
+from feature_store import FeatureStore
+from ml_model import BettingPredictor
+from model_registry import save_best_params
+
+logger = logging.getLogger(__name__)
+
+_OUTCOMES = ['1', 'X', '2']
+
+_tr = TuningResult.__table__
+
+# X/y ya cargados en cada worker (ruta del fichero -> arrays)
+_datasets: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+
+def params_key(params: Dict) -> str:
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def sample_params(space: Dict[str, List], n_trials: int, seed: Optional[int] = None) -> List[Dict]:
+    """Hasta n_trials combinaciones distintas del espacio (muestreo aleatorio sin repetición)"""
+    rng = np.random.default_rng(seed)
+    names = sorted(space)
+    total = int(np.prod([len(space[name]) for name in names]))
+    trials, seen = [], set()
+    while len(trials) < min(n_trials, total):
+        params = {name: space[name][rng.integers(len(space[name]))] for name in names}
+        params = {name: value.item() if isinstance(value, np.generic) else value for name, value in params.items()}
+        key = params_key(params)
+        if key not in seen:
+            seen.add(key)
+            trials.append(params)
+    return trials
+
+
+def rung_folds(n_folds: int, eta: int) -> List[List[int]]:
+    """Folds de cada ronda: primero el más reciente, después eta veces más hasta todos"""
+    rungs, size = [], 1
+    while True:
+        size = min(size, n_folds)
+        rungs.append(list(range(n_folds - size, n_folds)))
+        if size == n_folds:
+            return rungs
+        size *= eta
+
+
+def _load_dataset(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    if path not in _datasets:
+        data = joblib.load(path, mmap_mode='r')
+        _datasets[path] = (data['X'], data['y'])
+    return _datasets[path]
+
+
+def evaluate_fold(path: str, model_type: str, params: Dict, fold: int, n_folds: int,
+                  threads: int = 1) -> Dict:
+    """Log loss de un fold de TimeSeriesSplit (se ejecuta en los workers)"""
+    from sklearn.metrics import log_loss
+    from sklearn.model_selection import TimeSeriesSplit
+    from sklearn.preprocessing import StandardScaler
+
+    start = time.perf_counter()
+    X, y = _load_dataset(path)
+    train, test = list(TimeSeriesSplit(n_splits=n_folds).split(X))[fold]
+    scaler = StandardScaler().fit(X[train])
+    model = BettingPredictor._new_estimator(model_type, threads, params)
+    model.fit(scaler.transform(X[train]), y[train])
+    probabilities = model.predict_proba(scaler.transform(X[test]))
+    return {
+        'fold': fold,
+        'score': float(log_loss(y[test], probabilities, labels=list(range(len(_OUTCOMES))))),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+class HyperparameterSearch:
+    """Búsqueda de una liga y tipo de modelo (ver el docstring del módulo)"""
+
+    def __init__(self, league: str, model_type: str = 'xgboost', bind=None,
+                 n_trials: Optional[int] = None, n_folds: Optional[int] = None, eta: Optional[int] = None,
+                 space: Optional[Dict[str, List]] = None, seed: Optional[int] = None):
+        self.league = league
+        self.model_type = model_type
+        self.bind = bind or default_engine
+        self.n_trials = n_trials or TUNING_CONFIG['n_trials']
+        self.n_folds = n_folds or TUNING_CONFIG['n_folds']
+        self.eta = max(2, eta or TUNING_CONFIG['eta'])
+        self.space = space or TUNING_CONFIG['search_spaces'][model_type]
+        self.seed = TUNING_CONFIG['seed'] if seed is None else seed
+        self.data_version = None
+
+    def load_data(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Ventana de entrenamiento de train_model en orden cronológico"""
+        with Session(bind=self.bind) as db:
+            frame = BettingPredictor(db).prepare_training_data(self.league)
+            self.data_version = FeatureStore(db).data_version(self.league)
+        frame = frame.sort_values(['date', 'match_id'], kind='stable')
+        frame = frame[frame['result'].isin(_OUTCOMES)]
+        X = frame.reindex(columns=FEATURE_COLUMNS).fillna(0).to_numpy(dtype=float)
+        y = np.searchsorted(np.sort(_OUTCOMES), frame['result'].to_numpy())  # mismo orden que LabelEncoder
+        return X, y
+
+    def cached(self) -> Dict[Tuple[str, int], float]:
+        """(params_key, fold) -> score ya calculados para esta versión de los datos"""
+        with self.bind.connect() as conn:
+            rows = conn.execute(
+                select(_tr.c.params_key, _tr.c.fold, _tr.c.score).where(
+                    _tr.c.league == self.league,
+                    _tr.c.model_type == self.model_type,
+                    _tr.c.data_version == self.data_version,
+                    _tr.c.n_folds == self.n_folds,
+                )
+            ).fetchall()
+        return {(key, fold): score for key, fold, score in rows}
+
+    def _store(self, results: List[Dict]):
+        if results:
+            with self.bind.begin() as conn:
+                conn.execute(insert(_tr), [
+                    {
+                        'league': self.league, 'model_type': self.model_type,
+                        'data_version': self.data_version, 'n_folds': self.n_folds,
+                        **result,
+                    }
+                    for result in results
+                ])
+
+    def run(self, executor: Optional[ProcessPoolExecutor] = None, threads: int = 1) -> Dict:
+        """
+        Ejecuta la búsqueda (los folds pendientes en `executor` si se da, si no en
+        este proceso), registra la mejor combinación y devuelve el resumen
+        """
+        start = time.perf_counter()
+        X, y = self.load_data()
+        if len(X) < self.n_folds * 20:
+            raise ValueError(f"Insuficientes partidos para tuning en {self.league} ({len(X)})")
+
+        trials = sample_params(self.space, self.n_trials, self.seed)
+        keys = [params_key(params) for params in trials]
+        scores = self.cached()
+        survivors = list(range(len(trials)))
+        computed = cached = 0
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'dataset.joblib')
+            joblib.dump({'X': X, 'y': y}, path)
+
+            for folds in rung_folds(self.n_folds, self.eta):
+                pending = [(i, fold) for i in survivors for fold in folds if (keys[i], fold) not in scores]
+                cached += len(survivors) * len(folds) - len(pending)
+                results = self._evaluate(path, trials, keys, pending, executor, threads)
+                self._store(results)
+                scores.update({(result['params_key'], result['fold']): result['score'] for result in results})
+                computed += len(results)
+
+                mean = {i: np.mean([scores[(keys[i], fold)] for fold in folds]) for i in survivors}
+                survivors = sorted(survivors, key=mean.get)
+                if len(folds) == self.n_folds:
+                    break
+                survivors = survivors[:max(1, len(survivors) // self.eta)]
+
+        best = survivors[0]
+        with Session(bind=self.bind) as db:
+            record_id = save_best_params(
+                db, self.league, self.model_type, trials[best], float(mean[best]), self.data_version, len(trials)
+            ).id
+        summary = {
+            'league': self.league,
+            'model_type': self.model_type,
+            'params': trials[best],
+            'score': float(mean[best]),
+            'trials': len(trials),
+            'folds_computed': computed,
+            'folds_cached': cached,
+            'record_id': record_id,
+            'seconds': time.perf_counter() - start,
+            'error': None,
+        }
+        logger.info(
+            f"Tuning {self.model_type} para {self.league}: log loss {summary['score']:.4f} con {trials[best]} "
+            f"({computed} folds calculados, {cached} de caché, {summary['seconds']:.1f}s)"
+        )
+        return summary
+
+    def _evaluate(self, path: str, trials: List[Dict], keys: List[str], pending: List[Tuple[int, int]],
+                  executor: Optional[ProcessPoolExecutor], threads: int) -> List[Dict]:
+        results = []
+        if executor is None:
+            outputs = [(i, evaluate_fold(path, self.model_type, trials[i], fold, self.n_folds, threads))
+                       for i, fold in pending]
+        else:
+            futures = {
+                executor.submit(evaluate_fold, path, self.model_type, trials[i], fold, self.n_folds, threads): i
+                for i, fold in pending
+            }
+            outputs = [(futures[future], future.result()) for future in as_completed(futures)]
+        for i, output in outputs:
+            results.append({**output, 'params_key': keys[i], 'params': trials[i]})
+        return results
+
+
+def tune_all(leagues: Optional[List[str]] = None, model_types: Optional[List[str]] = None,
+             workers: Optional[int] = None, threads_per_worker: int = 1, **search_options) -> List[Dict]:
+    """
+    Tuning de ligas × tipos de modelo con un único ProcessPoolExecutor para todos
+    los folds (como training.train_all). Devuelve un resumen por búsqueda.
+    """
+    from training import _init_worker, MODEL_TYPES
+
+    leagues = leagues or [league.value for league in Leagues]
+    model_types = model_types or MODEL_TYPES
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) // max(1, threads_per_worker))
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(threads_per_worker,)
+    ) as executor:
+        for league in leagues:
+            for model_type in model_types:
+                try:
+                    search = HyperparameterSearch(league, model_type, **search_options)
+                    results.append(search.run(executor, threads_per_worker))
+                except Exception as e:
+                    logger.error(f"Error en el tuning de {model_type} para {league}: {e}")
+                    results.append({'league': league, 'model_type': model_type, 'error': str(e)})
+
+    logger.info(f"Tuning completo en {time.perf_counter() - start:.1f}s con {workers} workers")
+    return results
@@ -15,7 +15,10 @@ def calculate_potential_win(stake: float, odds: float) -> float:
     return stake * odds - stake
 
 def validate_bet(stake: float, balance: float, daily_spent: float, daily_limit: float = 100) -> Tuple[bool, str]:
-    """Valida si una apuesta puede realizarse"""
+    """
+    Valida si una apuesta puede realizarse (aviso previo en la interfaz; la
+    comprobación definitiva es atómica en placement.place_bets)
+    """
     if stake <= 0:
         return False, "El importe debe ser mayor a 0"
     if stake > balance:
@@ -25,8 +28,10 @@ def validate_bet(stake: float, balance: float, daily_spent: float, daily_limit:
     return True, ""
 
 def generate_match_id(home_team: str, away_team: str, date: str) -> str:
-    """Genera un ID único para un partido"""
-    match_string = f"{home_team}_{away_team}_{date}"
+    """Genera un ID único para un partido (igual con cualquier alias conocido de los equipos)"""
+    from teams import canonical_key
+    
+    match_string = f"{canonical_key(home_team)}_{canonical_key(away_team)}_{date}"
     return hashlib.md5(match_string.encode()).hexdigest()[:10]
 
 def parse_score(score_str: str) -> Tuple[int, int]:
@@ -87,7 +92,11 @@ def calculate_form(matches: List[Dict], team: str, last_n: int = 5) -> Dict:
     }
 
 def calculate_h2h_stats(matches: List[Dict], team1: str, team2: str) -> Dict:
-    """Calcula estadísticas de enfrentamientos directos"""
+    """
+    Calcula estadísticas de enfrentamientos directos recorriendo una lista de
+    partidos. Para consultas repetidas sobre la base de datos usa
+    h2h.get_h2h_index(), que indexa los partidos terminados por par de equipos.
+    """
     h2h_matches = []
     for match in matches:
         if (match.get('home_team') == team1 and match.get('away_team') == team2) or \
@@ -0,0 +1,156 @@
+"""
+Escáner vectorizado de apuestas de valor para todos los mercados
+
+Recibe probabilidades del modelo y cuotas en formato largo (una fila por partido,
+mercado y selección, como devuelve OddsStore.latest) y calcula en una sola pasada
+de NumPy: probabilidad implícita, margen de la casa, probabilidad justa (sin margen),
+EV y stake de Kelly. Devuelve la tabla ordenada por EV.
+"""
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from config import BetTypes, VALUE_BET_CONFIG
+from odds_store import MARKET_CODES, LINE_MARKETS, market_code, encode_selection
+
+# Selecciones que cubre cada resultado de doble oportunidad
+DOUBLE_CHANCE_OUTCOMES = {"1X": ("1", "X"), "12": ("1", "2"), "X2": ("X", "2")}
+
+# En doble oportunidad cada resultado aparece en dos selecciones: las probabilidades
+# implícitas del mercado suman 2 (más el margen), no 1
+_COVERAGE = {MARKET_CODES[BetTypes.DOUBLE_CHANCE.value]: 2.0}
+
+_SELECTION_STRIDE = 100_000  # Mayor que cualquier código de selección
+_MARKET_STRIDE = 16
+
+
+def outcome_probabilities(predictions: pd.DataFrame, match_ids) -> pd.DataFrame:
+    """
+    Convierte la salida de BettingPredictor.predict_matches (prob_1/prob_X/prob_2)
+    en formato largo con los mercados 1X2 y doble oportunidad.
+    Columnas: match_id, market, selection, prob
+    """
+    match_ids = np.asarray(match_ids)
+    probs = {outcome: predictions[f'prob_{outcome}'].to_numpy(dtype=float) for outcome in ('1', 'X', '2')}
+    for selection, (a, b) in DOUBLE_CHANCE_OUTCOMES.items():
+        probs[selection] = probs[a] + probs[b]
+
+    frames = []
+    for selection, values in probs.items():
+        market = BetTypes.DOUBLE_CHANCE.value if selection in DOUBLE_CHANCE_OUTCOMES else BetTypes.WIN_DRAW_WIN.value
+        frames.append(pd.DataFrame({
+            'match_id': match_ids, 'market': market, 'selection': selection, 'prob': values
+        }))
+    return pd.concat(frames, ignore_index=True).dropna(subset=['prob'])
+
+
+def evaluate(prob: np.ndarray, price: np.ndarray, book: np.ndarray, coverage: np.ndarray,
+             kelly_fraction: float = VALUE_BET_CONFIG['kelly_fraction'],
+             max_stake_fraction: float = VALUE_BET_CONFIG['max_stake_fraction']) -> dict:
+    """
+    Núcleo vectorizado. `book` agrupa las selecciones que forman un mismo mercado
+    de una casa (p. ej. over/under de una línea) para quitar el margen.
+    """
+    implied = 1.0 / price
+    overround = np.bincount(book, weights=implied)[book] / coverage
+    fair = implied / overround
+    ev = prob * price - 1.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kelly = np.where(price > 1.0, ev / (price - 1.0), 0.0)
+    stake_fraction = np.minimum(np.clip(kelly, 0.0, None) * kelly_fraction, max_stake_fraction)
+    return {
+        'implied_prob': implied,
+        'fair_prob': fair,
+        'margin': overround - 1.0,
+        'edge': prob - fair,
+        'expected_value': ev,
+        'kelly': kelly,
+        'stake_fraction': np.nan_to_num(stake_fraction),
+    }
+
+
+def _selection_codes(markets: np.ndarray, selections: pd.Series) -> np.ndarray:
+    """Códigos de selección, calculados una vez por par (mercado, selección) distinto"""
+    labels, unique_labels = pd.factorize(selections)
+    pairs, unique_pairs = pd.factorize(markets * len(unique_labels) + labels)
+    codes = np.array([
+        encode_selection(int(pair // len(unique_labels)), unique_labels[pair % len(unique_labels)])
+        for pair in unique_pairs
+    ], dtype=np.int64)
+    return codes[pairs]
+
+
+def _market_codes(markets: pd.Series) -> np.ndarray:
+    positions, unique_markets = pd.factorize(markets)
+    return np.array([market_code(market) for market in unique_markets], dtype=np.int64)[positions]
+
+
+def scan_value_bets(probabilities: pd.DataFrame, odds: pd.DataFrame,
+                    bankroll: Optional[float] = None,
+                    min_ev: float = VALUE_BET_CONFIG['min_ev'],
+                    min_price: float = VALUE_BET_CONFIG['min_price'],
+                    kelly_fraction: float = VALUE_BET_CONFIG['kelly_fraction'],
+                    max_stake_fraction: float = VALUE_BET_CONFIG['max_stake_fraction'],
+                    only_value: bool = True) -> pd.DataFrame:
+    """
+    Tabla de apuestas de valor ordenada por EV.
+
+    probabilities: match_id, market, selection, prob
+    odds: match_id, market, selection, price y opcionalmente bookmaker (una fila por
+          casa; el margen se calcula con todas las selecciones que ofrece cada casa)
+    Mercado y selección pueden venir como texto ('Over/Under', 'over_2.5') o codificados.
+    """
+    odds = odds.dropna(subset=['price'])
+    odds = odds[odds['price'] > 0]
+    if odds.empty or probabilities.empty:
+        return pd.DataFrame(columns=[
+            'match_id', 'bookmaker', 'market', 'selection', 'price', 'prob', 'implied_prob',
+            'fair_prob', 'margin', 'edge', 'expected_value', 'kelly', 'stake_fraction', 'value_bet'
+        ])
+
+    match_ids = odds['match_id'].to_numpy(dtype=np.int64)
+    markets = _market_codes(odds['market'])
+    selections = _selection_codes(markets, odds['selection'])
+    bookmakers = (
+        pd.factorize(odds['bookmaker'])[0] if 'bookmaker' in odds else np.zeros(len(odds), dtype=np.int64)
+    )
+    line = np.where(np.isin(markets, list(LINE_MARKETS)), selections // 10, 0)
+
+    book_key = ((match_ids * 1024 + bookmakers) * _MARKET_STRIDE + markets) * _SELECTION_STRIDE + line
+    book = pd.factorize(book_key)[0]
+    coverage = np.array([_COVERAGE.get(m, 1.0) for m in range(_MARKET_STRIDE)])[markets]
+
+    # Probabilidad del modelo para cada fila de cuotas (búsqueda por clave entera)
+    prob_markets = _market_codes(probabilities['market'])
+    prob_keys = (
+        (probabilities['match_id'].to_numpy(dtype=np.int64) * _MARKET_STRIDE + prob_markets) * _SELECTION_STRIDE
+        + _selection_codes(prob_markets, probabilities['selection'])
+    )
+    odds_keys = (match_ids * _MARKET_STRIDE + markets) * _SELECTION_STRIDE + selections
+    prob_index = pd.Index(prob_keys)
+    unique = ~prob_index.duplicated(keep='last')
+    position = prob_index[unique].get_indexer(odds_keys)
+    prob = np.where(position >= 0, probabilities['prob'].to_numpy(dtype=float)[unique][position], np.nan)
+
+    price = odds['price'].to_numpy(dtype=float)
+    metrics = evaluate(prob, price, book, coverage, kelly_fraction, max_stake_fraction)
+
+    table = pd.DataFrame({
+        'match_id': match_ids,
+        'bookmaker': odds['bookmaker'].values if 'bookmaker' in odds else None,
+        'market': odds['market'].values,
+        'selection': odds['selection'].values,
+        'price': price,
+        'prob': prob,
+        **metrics,
+    })
+    table['value_bet'] = (table['expected_value'] > min_ev) & (price >= min_price)
+    if bankroll is not None:
+        table['stake'] = (table['stake_fraction'] * bankroll).round(2)
+
+    table = table[table['prob'].notna()]
+    if only_value:
+        table = table[table['value_bet']]
+    return table.sort_values('expected_value', ascending=False, kind='stable').reset_index(drop=True)